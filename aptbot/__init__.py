@@ -1,4 +1,5 @@
 from .bot import ABCBot as Bot
-from .bot import Commands, Message
+from .bot import AsyncBot, Commands, Message
+from .registry import CommandRegistry
 
-__all__ = ["Bot", "Commands", "Message"]
+__all__ = ["AsyncBot", "Bot", "CommandRegistry", "Commands", "Message"]
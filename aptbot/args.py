@@ -25,7 +25,8 @@ def parse_arguments() -> argparse.Namespace:
         "-s",
         "--send-message",
         type=str,
-        help=f"Send a message to skgyorugo",
+        action="append",
+        help=f'Send a message to a channel, as "channel message", can be repeated',
     )
 
     arg_parser.add_argument(
@@ -35,6 +36,13 @@ def parse_arguments() -> argparse.Namespace:
         help=f"Enable the bot",
     )
 
+    arg_parser.add_argument(
+        "--asyncio",
+        default=False,
+        action="store_true",
+        help=f"Run the bot on asyncio, use together with --enable",
+    )
+
     arg_parser.add_argument(
         "--disable",
         default=False,
@@ -49,4 +57,11 @@ def parse_arguments() -> argparse.Namespace:
         help=f"Update the bot",
     )
 
+    arg_parser.add_argument(
+        "--metrics",
+        default=False,
+        action="store_true",
+        help=f"Print the bot's metrics in the prometheus text format",
+    )
+
     return arg_parser.parse_args()
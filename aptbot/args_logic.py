@@ -1,9 +1,10 @@
 import os
 import shutil
-import socket
 from enum import Enum
+from typing import Iterable, Optional
 
 from .constants import CONFIG_PATH
+from .control import ControlClient, ControlError
 
 
 class BotCommands(Enum):
@@ -12,9 +13,27 @@ class BotCommands(Enum):
     SEND = "SEND"
     KILL = "KILL"
     UPDATE = "UPDATE"
+    METRICS = "METRICS"
 
 
-def add_account(s: socket.socket, acc: str):
+def _request(
+    client: Optional[ControlClient], requests: list[tuple[str, dict]]
+) -> list[dict]:
+    if not client:
+        print("aptbot is not running.")
+        return []
+    try:
+        responses = client.pipeline(requests)
+    except (ControlError, OSError) as e:
+        print(f"Unable to reach aptbot: {e}")
+        return []
+    for response in responses:
+        if not response.get("ok"):
+            print(f"Error: {response.get('error')}")
+    return responses
+
+
+def add_account(client: Optional[ControlClient], acc: str):
     account_path = os.path.join(CONFIG_PATH, f"{acc}")
     hidden_account_path = os.path.join(CONFIG_PATH, f".{acc}")
 
@@ -32,30 +51,23 @@ def add_account(s: socket.socket, acc: str):
             os.path.join(account_path, "main.py"),
         )
 
-    command = BotCommands.JOIN.value
-    channel = acc
-    msg = ""
-    try:
-        s.send(bytes(f"{command}==={channel}==={msg}", "utf-8"))
-    except (BrokenPipeError, OSError):
-        pass
+    if client:
+        _request(client, [(BotCommands.JOIN.value, {"channel": acc})])
 
 
-def send_msg(s: socket.socket, msg: str):
-    command = BotCommands.SEND.value
-    channel = msg.split(" ")[0]
-    msg = msg[len(channel) + 1 :]
-    s.send(bytes(f"{command}==={channel}==={msg}", "utf-8"))
+def send_msg(client: Optional[ControlClient], msgs: Iterable[str]):
+    requests = []
+    for msg in msgs:
+        channel, _, msg = msg.partition(" ")
+        requests.append((BotCommands.SEND.value, {"channel": channel, "message": msg}))
+    _request(client, requests)
 
 
-def disable(s: socket.socket):
-    command = BotCommands.KILL.value
-    channel = ""
-    msg = ""
-    s.send(bytes(f"{command}==={channel}==={msg}", "utf-8"))
+def disable(client: Optional[ControlClient]):
+    _request(client, [(BotCommands.KILL.value, {})])
 
 
-def disable_account(s: socket.socket, acc: str):
+def disable_account(client: Optional[ControlClient], acc: str):
     account_path = os.path.join(CONFIG_PATH, f"{acc}")
     hidden_account_path = os.path.join(CONFIG_PATH, f".{acc}")
     try:
@@ -63,17 +75,15 @@ def disable_account(s: socket.socket, acc: str):
     except FileNotFoundError:
         print(f"Account {acc} is already disabled.")
 
-    command = BotCommands.PART.value
-    channel = acc
-    msg = ""
-    try:
-        s.send(bytes(f"{command}==={channel}==={msg}", "utf-8"))
-    except (BrokenPipeError, OSError):
-        pass
+    if client:
+        _request(client, [(BotCommands.PART.value, {"channel": acc})])
+
+
+def update(client: Optional[ControlClient]):
+    _request(client, [(BotCommands.UPDATE.value, {})])
 
 
-def update(s: socket.socket):
-    command = BotCommands.UPDATE.value
-    channel = ""
-    msg = ""
-    s.send(bytes(f"{command}==={channel}==={msg}", "utf-8"))
+def print_metrics(client: Optional[ControlClient]):
+    for response in _request(client, [(BotCommands.METRICS.value, {})]):
+        if response.get("ok"):
+            print(response["result"], end="")
@@ -1,15 +1,60 @@
+import asyncio
+import errno
+import itertools
 import logging
-import re
+import random
+import selectors
 import socket
 import sys
+import threading
 import time
+from collections import deque
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
 from enum import Enum
-from typing import Iterable, Optional, Union
+from typing import Iterable, Iterator, Optional, Union
+
+from . import logs, metrics
+from .outbound import OutboundQueue, Priority
 
 logger = logging.getLogger(__name__)
 
+RECV_SIZE = 65536
+MAX_LINE_LENGTH = 1 << 20
+# Characters, longer messages are rejected by twitch
+MAX_MESSAGE_LENGTH = 500
+
+# Seconds
+PING_INTERVAL = 60.0
+PONG_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 10.0
+SEND_TIMEOUT = 10.0
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+_LINES_RECEIVED = metrics.counter(
+    "aptbot_lines_received_total", "Lines received from twitch"
+)
+_PARSE_SECONDS = metrics.histogram(
+    "aptbot_parse_seconds", "Time to parse a line into a Message, 1 in 16 lines"
+)
+_PARSED = itertools.count()
+_MESSAGES_QUEUED = metrics.counter(
+    "aptbot_messages_queued_total", "Chat messages queued to be sent", ("channel",)
+)
+_RECONNECTS = metrics.counter(
+    "aptbot_reconnects_total", "Connections restored after being lost", ("connection",)
+)
+_RECONNECT_SECONDS = metrics.histogram(
+    "aptbot_reconnect_seconds", "Time from losing a connection to restoring it"
+)
+
+_CONNECT_IN_PROGRESS = {
+    0,
+    errno.EINPROGRESS,
+    errno.EWOULDBLOCK,
+    getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK),
+}
+
 
 class Commands(Enum):
     CLEARCHAT = "CLEARCHAT"
@@ -28,13 +73,206 @@ class Commands(Enum):
     PONG = "PONG"
 
 
-@dataclass
+_COMMANDS = {command.value: command for command in Commands}
+_get_command = _COMMANDS.get
+
+
+def _unescape_tag_value(tag_value: str) -> str:
+    # https://ircv3.net/specs/extensions/message-tags#escaping-values
+    if "\\" not in tag_value:
+        return tag_value
+    # Escaped backslashes are swapped out first, so they can't be mistaken
+    # for the start of another escape. NUL can never appear in an IRC line.
+    return (
+        tag_value.replace("\\\\", "\0")
+        .replace("\\:", ";")
+        .replace("\\s", " ")
+        .replace("\\r", "\r")
+        .replace("\\n", "\n")
+        # Unknown escapes drop the backslash, as does a trailing backslash
+        .replace("\\", "")
+        .replace("\0", "\\")
+    )
+
+
+def _decode_tags(raw_tags: str) -> dict[str, str]:
+    tags = {}
+    for tag in raw_tags.split(";"):
+        key, _, value = tag.partition("=")
+        tags[sys.intern(key)] = value
+    # Most lines have no escaped tag values at all
+    if "\\" in raw_tags:
+        for key, value in tags.items():
+            if "\\" in value:
+                tags[key] = _unescape_tag_value(value)
+    body = tags.get("reply-parent-msg-body")
+    if body:
+        # Remove extra whitespace
+        tags["reply-parent-msg-body"] = " ".join(body.split())
+    return tags
+
+
 class Message:
-    tags: dict[str, str] = field(default_factory=dict)
-    nick: str = ""
-    command: Optional[Commands] = None
-    channel: str = ""
-    value: str = ""
+    # Tags are kept as the raw "key=value;..." slice of the line
+    # and only decoded into a dict the first time they are accessed.
+    __slots__ = ("_raw_tags", "_tags", "nick", "command", "channel", "value")
+
+    def __init__(
+        self,
+        tags: Optional[dict[str, str]] = None,
+        nick: str = "",
+        command: Optional[Commands] = None,
+        channel: str = "",
+        value: str = "",
+        raw_tags: str = "",
+    ):
+        self._raw_tags = raw_tags
+        self._tags = tags
+        self.nick = nick
+        self.command = command
+        self.channel = channel
+        self.value = value
+
+    @property
+    def tags(self) -> dict[str, str]:
+        tags = self._tags
+        if tags is None:
+            tags = self._tags = _decode_tags(self._raw_tags) if self._raw_tags else {}
+        return tags
+
+    @tags.setter
+    def tags(self, tags: dict[str, str]):
+        self._tags = tags
+
+    @property
+    def raw_tags(self) -> str:
+        return self._raw_tags
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (
+            self.nick == other.nick
+            and self.command == other.command
+            and self.channel == other.channel
+            and self.value == other.value
+            and self.tags == other.tags
+        )
+
+    __hash__ = None
+
+    # Pickled as a plain tuple, with the tags still undecoded
+    # unless they were set directly
+    def __reduce__(self):
+        command = self.command.value if self.command else None
+        tags = self._tags if self._tags is not None and not self._raw_tags else None
+        return (
+            _restore_message,
+            (self._raw_tags, tags, self.nick, command, self.channel, self.value),
+        )
+
+    def __repr__(self):
+        return (
+            f"Message(tags={self.tags!r}, nick={self.nick!r}, "
+            f"command={self.command!r}, channel={self.channel!r}, value={self.value!r})"
+        )
+
+
+def _restore_message(
+    raw_tags: str,
+    tags: Optional[dict[str, str]],
+    nick: str,
+    command: Optional[str],
+    channel: str,
+    value: str,
+) -> Message:
+    return Message(tags, nick, _COMMANDS.get(command), channel, value, raw_tags)
+
+
+class LineFramer:
+    def __init__(self, max_line_length: int = MAX_LINE_LENGTH):
+        self._buffer = bytearray()
+        self._max_line_length = max_line_length
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def clear(self) -> None:
+        self._buffer.clear()
+
+    def feed(self, data: bytes) -> list[str]:
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b"\r\n")
+        if end == -1:
+            if len(buffer) > self._max_line_length:
+                logger.warning(f"Discarding {len(buffer)} bytes without a line ending")
+                buffer.clear()
+            return []
+        # Only complete lines are decoded. "\r\n" can never appear inside
+        # a multi-byte UTF-8 sequence, so the split is always safe.
+        with memoryview(buffer) as view:
+            complete = bytes(view[:end])
+        del buffer[: end + 2]
+        return [
+            line for line in complete.decode("utf-8", "replace").split("\r\n") if line
+        ]
+
+
+def _registration(nick: str, oauth_token: str) -> bytes:
+    commands = [
+        f"NICK {nick}",
+        f"CAP REQ :twitch.tv/membership twitch.tv/tags twitch.tv/commands",
+    ]
+    for command in commands:
+        logs.log_sent("", command)
+    commands.insert(0, f"PASS oauth:{oauth_token}")
+    return "".join(command + "\r\n" for command in commands).encode()
+
+
+def _is_moderator(message: Message) -> bool:
+    badges = message.tags.get("badges", "")
+    return "moderator/" in badges or "broadcaster/" in badges
+
+
+# Splits on whitespace, only words longer than the limit are cut
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    if len(text) <= limit and "\n" not in text and "\r" not in text:
+        return [text]
+    parts = []
+    current = ""
+    for word in text.split():
+        while len(word) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(word[:limit])
+            word = word[limit:]
+        if not current:
+            current = word
+        elif len(current) + 1 + len(word) <= limit:
+            current += " " + word
+        else:
+            parts.append(current)
+            current = word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _privmsgs(
+    messages: Iterable[tuple[str, Union[list[str], str], Optional[str]]],
+) -> Iterator[tuple[str, str]]:
+    for channel, text, reply in messages:
+        prefix = f"@reply-parent-msg-id={reply} " if reply else ""
+        prefix += f"{Commands.PRIVMSG.value} #{channel} :"
+        for t in [text] if isinstance(text, str) else text:
+            for part in split_message(t):
+                command = prefix + part
+                logs.log_sent(channel, command)
+                _MESSAGES_QUEUED.inc(channel)
+                yield command, channel
 
 
 class ABCBot(ABC):
@@ -42,160 +280,566 @@ class ABCBot(ABC):
     def send_message(self, channel: str, text: Union[list[str], str], reply=None):
         pass
 
+    # Takes (channel, text, reply) items, e.g. to send the same text to many channels
+    def send_messages(
+        self, messages: Iterable[tuple[str, Union[list[str], str], Optional[str]]]
+    ):
+        for channel, text, reply in messages:
+            self.send_message(channel, text, reply=reply)
+
+
+class _State(Enum):
+    DISCONNECTED = "DISCONNECTED"
+    CONNECTING = "CONNECTING"
+    CONNECTED = "CONNECTED"
+
+
+class _Connection:
+    def __init__(self, shard: int):
+        self.shard = shard
+        self.socket: Optional[socket.socket] = None
+        self.framer = LineFramer()
+        self.channels: set[str] = set()
+        self.lock = threading.Lock()
+        self.state = _State.DISCONNECTED
+        self.last_received = 0.0
+        self.ping_sent: Optional[float] = None
+        self.connect_started = 0.0
+        self.retry_at = 0.0
+        self.attempts = 0
+        self.lost_at: Optional[float] = None
+        self.write_failed = False
+
+    def sendall(self, data: bytes):
+        with self.lock:
+            if not self.socket:
+                raise OSError(f"Connection {self.shard} is not connected")
+            self.socket.sendall(data)
+
 
 class Bot(ABCBot):
-    def __init__(self, nick: str, oauth_token: str):
-        self._server = "irc.chat.twitch.tv"
-        self._port = 6667
+    def __init__(
+        self,
+        nick: str,
+        oauth_token: str,
+        server: str = "irc.chat.twitch.tv",
+        port: int = 6667,
+        connections: int = 1,
+    ):
+        self._server = server
+        self._port = port
         self._nick = nick
         self._oauth_token = oauth_token
-        self._connected_channels = set()
+        self._connections = [_Connection(shard) for shard in range(connections)]
+        self._shards: dict[str, _Connection] = {}
+        self._shards_lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
         self._buffered_messages = []
-        self.empty_message_count = 0
+        self._outbound = OutboundQueue(self._sendall, self._write_failed)
+        self.ping_interval = PING_INTERVAL
+        self.pong_timeout = PONG_TIMEOUT
+        self.reconnects = 0
+        self.reconnect_latencies: deque[float] = deque(maxlen=100)
+        # A capture.Recorder, to record the raw lines that are received
+        self.recorder = None
+
+    @property
+    def outbound(self) -> OutboundQueue:
+        return self._outbound
 
-    def _send_command(self, command: str):
+    @property
+    def shards(self) -> dict[str, int]:
+        return {
+            channel: connection.shard for channel, connection in self._shards.items()
+        }
+
+    # Lines for channels without a shard, e.g. a PART for a channel that was
+    # never joined, go to the first connection and are paused and resumed with it
+    def _shard(self, channel: Optional[str]) -> int:
+        connection = self._shards.get(channel) if channel is not None else None
+        return connection.shard if connection else 0
+
+    def _sendall(self, shard: int, data: bytes):
+        self._connections[shard].sendall(data)
+
+    # Called by the writer thread, the connection is restarted by get_messages
+    def _write_failed(self, shard: int):
+        self._connections[shard].write_failed = True
+
+    def _send_command(
+        self,
+        command: str,
+        priority: Priority = Priority.CONTROL,
+        channel: Optional[str] = None,
+        shard: Optional[int] = None,
+    ):
         if "PASS" not in command:
-            logger.info(f"< {command}")
-        self._irc.send((command + "\r\n").encode())
+            logs.log_sent(channel or "", command)
+        if shard is None:
+            shard = self._shard(channel)
+        self._outbound.put(command, priority, channel, shard)
 
     def connect(self) -> bool:
-        self._connect()
-        connected = self._connected()
+        connected = True
+        for connection in self._connections:
+            self._connect(connection)
+            connected = self._connected(connection) and connected
         return connected
 
-    def _connect(self) -> None:
-        self._irc = socket.socket()
-        self._irc.connect((self._server, self._port))
-        logger.debug("Connecting...")
-        self._send_command(f"PASS oauth:{self._oauth_token}")
-        self._send_command(f"NICK {self._nick}")
-        self._send_command(
-            f"CAP REQ :twitch.tv/membership twitch.tv/tags twitch.tv/commands"
-        )
+    def _connect(self, connection: _Connection) -> None:
+        logger.debug(f"Connecting shard {connection.shard}...")
+        sock = socket.create_connection((self._server, self._port), CONNECT_TIMEOUT)
+        connection.socket = sock
+        self._selector.register(sock, selectors.EVENT_READ, connection)
+        self._registered(connection, time.monotonic())
+        self._outbound.start()
+
+    def _start_connect(self, connection: _Connection, now: float) -> None:
+        logger.debug(f"Reconnecting shard {connection.shard}...")
+        sock = socket.socket()
+        sock.setblocking(False)
+        connection.socket = sock
+        connection.state = _State.CONNECTING
+        connection.connect_started = now
+        try:
+            error = sock.connect_ex((self._server, self._port))
+        except OSError as e:
+            self._connection_lost(connection, e, now)
+            return
+        if error not in _CONNECT_IN_PROGRESS:
+            self._connection_lost(connection, errno.errorcode.get(error, error), now)
+            return
+        self._selector.register(sock, selectors.EVENT_WRITE, connection)
+
+    def _finish_connect(self, connection: _Connection, now: float) -> None:
+        error = connection.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._connection_lost(connection, errno.errorcode.get(error, error), now)
+            return
+        self._selector.modify(connection.socket, selectors.EVENT_READ, connection)
+        try:
+            self._registered(connection, now)
+        except OSError as e:
+            self._connection_lost(connection, e, now)
+            return
+        for channel in list(connection.channels):
+            self._send_command(
+                f"{Commands.JOIN.value} #{channel}",
+                Priority.JOIN,
+                channel,
+                connection.shard,
+            )
+
+    def _registered(self, connection: _Connection, now: float) -> None:
+        connection.socket.settimeout(SEND_TIMEOUT)
+        connection.framer.clear()
+        # Registration has to reach twitch before anything that is queued
+        connection.sendall(_registration(self._nick, self._oauth_token))
+        connection.state = _State.CONNECTED
+        connection.last_received = now
+        connection.ping_sent = None
+        connection.write_failed = False
+        self._outbound.resume(connection.shard)
+
+    # New channels go to the connection with the fewest channels
+    def _assign_shard(self, channel: str) -> _Connection:
+        with self._shards_lock:
+            connection = self._shards.get(channel)
+            if connection is None:
+                connection = min(self._connections, key=lambda c: len(c.channels))
+                connection.channels.add(channel)
+                self._shards[channel] = connection
+            return connection
 
     def join_channel(self, channel: str):
-        self._send_command(f"{Commands.JOIN.value} #{channel}")
-        self._connected_channels.add(channel)
+        connection = self._assign_shard(channel)
+        self._send_command(
+            f"{Commands.JOIN.value} #{channel}",
+            Priority.JOIN,
+            channel,
+            connection.shard,
+        )
 
     def join_channels(self, channels: Iterable):
         for channel in channels:
             self.join_channel(channel)
 
     def leave_channel(self, channel: str):
-        self._send_command(f"{Commands.PART.value} #{channel}")
-        try:
-            self._connected_channels.remove(channel)
-        except KeyError as e:
-            logger.exception("Account isn't enabled")
-            logger.exception(e)
+        self._send_command(f"{Commands.PART.value} #{channel}", channel=channel)
+        with self._shards_lock:
+            connection = self._shards.pop(channel, None)
+            if connection:
+                connection.channels.discard(channel)
+        if not connection:
+            logger.error(f"Account {channel} isn't enabled")
 
     def send_message(self, channel: str, text: Union[list[str], str], reply=None):
-        if reply:
-            replied_command = f"@reply-parent-msg-id={reply} "
-        else:
-            replied_command = ""
-        if isinstance(text, list):
-            for t in text:
-                command = replied_command + f"{Commands.PRIVMSG.value} #{channel} :{t}"
-                self._send_command(command)
-        else:
-            command = replied_command + f"{Commands.PRIVMSG.value} #{channel} :{text}"
-            self._send_command(command)
+        self.send_messages(((channel, text, reply),))
 
-    @staticmethod
-    def _replace_escaped_characters_in_tags(tag_value: str) -> str:
-        new_tag_value = ""
-        ignore_next = False
-        for i in range(len(tag_value)):
-            if ignore_next:
-                ignore_next = False
-                continue
-            if tag_value[i] != "\\":
-                new_tag_value += tag_value[i]
-                ignore_next = False
-                continue
-            if i + 1 == len(tag_value):
-                new_tag_value += tag_value[i]
-                break
-            if tag_value[i + 1] == "\\":
-                new_tag_value += "\\"
-            elif tag_value[i + 1] == "s":
-                new_tag_value += " "
-            elif tag_value[i + 1] == ":":
-                new_tag_value += ";"
-            ignore_next = True
-        return new_tag_value
+    # Everything is queued at once, so the writer can send it in as few writes
+    # as the rate limits allow
+    def send_messages(
+        self, messages: Iterable[tuple[str, Union[list[str], str], Optional[str]]]
+    ):
+        self._outbound.put_many(
+            (command, Priority.MESSAGE, channel, self._shard(channel))
+            for command, channel in _privmsgs(messages)
+        )
+
+    _replace_escaped_characters_in_tags = staticmethod(_unescape_tag_value)
 
     @staticmethod
     def _parse_message(received_msg: str) -> Message:
-        split = re.search(
-            r"(?:@(.+)\s)?:(?:(?:(\w+)!\w+@\w+\.)?.+)\s(\w+)\s(?:\#(\w+)|\*)\s?:?(.+)?",
-            received_msg,
-        )
+        # [@tags] [:prefix] COMMAND [#channel|*] [:value]
+        rest = received_msg
+        raw_tags = ""
+        if rest[:1] == "@":
+            raw_tags, _, rest = rest.partition(" ")
+            raw_tags = raw_tags[1:]
 
-        if not split:
+        nick = ""
+        if rest[:1] == ":":
+            prefix, _, rest = rest.partition(" ")
+            bang = prefix.find("!")
+            if bang != -1:
+                nick = sys.intern(prefix[1:bang])
+
+        command_name, _, rest = rest.partition(" ")
+        command = _get_command(command_name)
+        if command is None:
             return Message()
 
-        tags = {}
-        if split[1]:
-            for tag in split[1].split(";"):
-                split_tag = tag.split("=")
-                tag_name = split_tag[0]
-                tag_value = "=".join(split_tag[1:])
-                if split_tag[0] == "reply-parent-msg-body":
-                    tag_value = Bot._replace_escaped_characters_in_tags(tag_value)
-                # Remove extra whitespace
-                tags[tag_name] = " ".join(tag_value.split())
-
-        nick = split[2] if split[2] else ""
-        try:
-            command = Commands[split[3]]
-        except KeyError:
+        channel = ""
+        first = rest[:1]
+        if first == "#":
+            channel, _, rest = rest.partition(" ")
+            channel = sys.intern(channel[1:])
+        elif first == "*":
+            rest = rest[2:]
+
+        if rest[:1] == ":":
+            rest = rest[1:]
+        # Most values have no extra whitespace to remove
+        if rest and (
+            "  " in rest or rest[0] == " " or rest[-1] == " " or not rest.isprintable()
+        ):
+            rest = " ".join(rest.split())
+
+        # Positional arguments are noticeably cheaper on every line
+        return Message(None, nick, command, channel, rest, raw_tags)
+
+    def _handle_message(
+        self, received_msg: str, connection: Optional[_Connection] = None
+    ) -> Message:
+        connection = connection or self._connections[0]
+        if received_msg == "PING :tmi.twitch.tv":
+            logs.log_received("", received_msg)
+            self._send_command(
+                "PONG :tmi.twitch.tv", Priority.PONG, shard=connection.shard
+            )
+            return Message(command=Commands.PING)
+        elif received_msg == ":tmi.twitch.tv RECONNECT":
+            self._restart_connection(connection)
+        elif not received_msg:
             return Message()
-        channel = split[4] if split[4] else ""
+        if next(_PARSED) & 15:
+            message = Bot._parse_message(received_msg)
+        else:
+            start = time.perf_counter()
+            message = Bot._parse_message(received_msg)
+            _PARSE_SECONDS.observe(time.perf_counter() - start)
+        logs.log_received(message.channel, received_msg)
+        if message.command == Commands.USERSTATE:
+            self._outbound.set_moderator(message.channel, _is_moderator(message))
+        return message
+
+    def _receive_messages(self, connection: _Connection) -> list[str]:
+        try:
+            received_bytes = connection.socket.recv(RECV_SIZE)
+        except OSError as e:
+            self._connection_lost(connection, e, time.monotonic())
+            return []
+        now = time.monotonic()
+        if not received_bytes:
+            self._connection_lost(connection, "closed by twitch", now)
+            return []
+        connection.last_received = now
+        connection.ping_sent = None
+        if connection.lost_at is not None:
+            latency = now - connection.lost_at
+            self.reconnects += 1
+            self.reconnect_latencies.append(latency)
+            _RECONNECTS.inc(str(connection.shard))
+            _RECONNECT_SECONDS.observe(latency)
+            logger.info(f"Connection {connection.shard} restored in {latency:.2f}s")
+            connection.lost_at = None
+            connection.attempts = 0
+        lines = connection.framer.feed(received_bytes)
+        _LINES_RECEIVED.inc(amount=len(lines))
+        if self.recorder:
+            self.recorder.record(lines, now)
+        return lines
+
+    def _connected(self, connection: _Connection) -> bool:
+        received_msgs = []
+        while not received_msgs:
+            if connection.state != _State.CONNECTED:
+                return False
+            received_msgs = self._receive_messages(connection)
+        messages = [
+            self._handle_message(received_msg, connection)
+            for received_msg in received_msgs
+        ]
+        self._buffered_messages.extend(messages)
+        if messages[0] == Message(
+            {},
+            "",
+            Commands.NOTICE,
+            "",
+            "Login authentication failed",
+        ):
+            logger.debug(f"Not connected")
+            return False
+        logger.debug(f"Connected")
+        return True
+
+    def get_messages(self) -> list[Message]:
+        messages = self._buffered_messages
+        self._buffered_messages = []
+        while not messages:
+            timeout = self._supervise(time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                connection = key.data
+                if connection.state == _State.CONNECTING:
+                    self._finish_connect(connection, time.monotonic())
+                    continue
+                for received_msg in self._receive_messages(connection):
+                    messages.append(self._handle_message(received_msg, connection))
+        return messages
+
+    # Sends heartbeats, detects dead connections and reconnects them.
+    # Returns how long get_messages can wait before it has to run again.
+    def _supervise(self, now: float) -> float:
+        timeout = self.ping_interval
+        for connection in self._connections:
+            if connection.state == _State.CONNECTED:
+                if connection.write_failed:
+                    self._connection_lost(connection, "write failed", now)
+                elif connection.ping_sent is not None:
+                    waited = now - connection.ping_sent
+                    if waited >= self.pong_timeout:
+                        self._connection_lost(connection, "PONG timeout", now)
+                    else:
+                        timeout = min(timeout, self.pong_timeout - waited)
+                        continue
+                else:
+                    idle = now - connection.last_received
+                    if idle >= self.ping_interval:
+                        connection.ping_sent = now
+                        self._send_command(
+                            "PING :tmi.twitch.tv", Priority.PONG, shard=connection.shard
+                        )
+                        timeout = min(timeout, self.pong_timeout)
+                    else:
+                        timeout = min(timeout, self.ping_interval - idle)
+                    continue
+            if connection.state == _State.CONNECTING:
+                waited = now - connection.connect_started
+                if waited >= CONNECT_TIMEOUT:
+                    self._connection_lost(connection, "connect timeout", now)
+                else:
+                    timeout = min(timeout, CONNECT_TIMEOUT - waited)
+                    continue
+            if connection.state == _State.DISCONNECTED:
+                if now >= connection.retry_at:
+                    self._start_connect(connection, now)
+                    timeout = min(timeout, CONNECT_TIMEOUT)
+                else:
+                    timeout = min(timeout, connection.retry_at - now)
+        return max(timeout, 0.0)
+
+    def _connection_lost(self, connection: _Connection, reason, now: float):
+        logger.warning(f"Connection {connection.shard} lost: {reason}")
+        self._outbound.pause(connection.shard)
+        self._disconnect(connection)
+        if connection.lost_at is None:
+            connection.lost_at = now
+        # Exponential backoff with jitter, so shards don't reconnect in lockstep
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**connection.attempts)
+        delay *= random.uniform(0.5, 1.0)
+        connection.attempts += 1
+        connection.retry_at = now + delay
+        logger.info(f"Reconnecting shard {connection.shard} in {delay:.2f}s")
+
+    def disconnect(self) -> None:
+        logger.debug("Disconnecting...")
+        for connection in self._connections:
+            self._disconnect(connection)
+
+    def _disconnect(self, connection: _Connection) -> None:
+        connection.state = _State.DISCONNECTED
+        if not connection.socket:
+            return
+        try:
+            self._selector.unregister(connection.socket)
+        except (KeyError, ValueError):
+            pass
+        with connection.lock:
+            connection.socket.close()
+            connection.socket = None
+
+    def _restart_connection(self, connection: Optional[_Connection] = None):
+        now = time.monotonic()
+        for connection in [connection] if connection else self._connections:
+            connection.attempts = 0
+            self._connection_lost(connection, "restart requested", now)
+
+    # Aliasing method names for backwards compatibility
+    send_privmsg = send_message
+
+
+class AsyncBot(ABCBot):
+    def __init__(
+        self,
+        nick: str,
+        oauth_token: str,
+        server: str = "irc.chat.twitch.tv",
+        port: int = 6667,
+    ):
+        self._server = server
+        self._port = port
+        self._nick = nick
+        self._oauth_token = oauth_token
+        self._connected_channels = set()
+        self._buffered_messages = []
+        self._framer = LineFramer()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # A capture.Recorder, to record the raw lines that are received
+        self.recorder = None
+        self._outbound = OutboundQueue(self._write_threadsafe)
+        self.reconnects = 0
+        self.reconnect_latencies: deque[float] = deque(maxlen=100)
+
+    @property
+    def outbound(self) -> OutboundQueue:
+        return self._outbound
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._loop
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _write(self, data: bytes):
+        if self._writer and not self._writer.is_closing():
+            self._writer.write(data)
+
+    def _write_threadsafe(self, connection: Optional[int], data: bytes):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._write, data)
+
+    # Can be called from any thread,
+    # e.g. from synchronous channel modules running in an executor.
+    def _send_command(
+        self,
+        command: str,
+        priority: Priority = Priority.CONTROL,
+        channel: Optional[str] = None,
+    ):
+        if "PASS" not in command:
+            logs.log_sent(channel or "", command)
+        self._outbound.put(command, priority, channel)
+
+    async def connect(self) -> bool:
+        await self._connect()
+        return await self._connected()
+
+    async def _connect(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._framer.clear()
+        logger.debug("Connecting...")
+        self._reader, self._writer = await asyncio.open_connection(
+            self._server, self._port
+        )
+        # Registration has to reach twitch before anything that is queued
+        self._write(_registration(self._nick, self._oauth_token))
+        self._outbound.start()
+
+    def join_channel(self, channel: str):
+        self._send_command(f"{Commands.JOIN.value} #{channel}", Priority.JOIN, channel)
+        self._connected_channels.add(channel)
+
+    def join_channels(self, channels: Iterable):
+        for channel in channels:
+            self.join_channel(channel)
+
+    def leave_channel(self, channel: str):
+        self._send_command(f"{Commands.PART.value} #{channel}", channel=channel)
         try:
-            value = " ".join(split[5].split())
-        except AttributeError:
-            value = ""
-
-        return Message(
-            tags=tags,
-            nick=nick,
-            command=command,
-            channel=channel,
-            value=value,
+            self._connected_channels.remove(channel)
+        except KeyError as e:
+            logger.exception("Account isn't enabled")
+            logger.exception(e)
+
+    def send_message(self, channel: str, text: Union[list[str], str], reply=None):
+        self.send_messages(((channel, text, reply),))
+
+    def send_messages(
+        self, messages: Iterable[tuple[str, Union[list[str], str], Optional[str]]]
+    ):
+        self._outbound.put_many(
+            (command, Priority.MESSAGE, channel, None)
+            for command, channel in _privmsgs(messages)
         )
 
-    def _handle_message(self, received_msg: str) -> Message:
-        logger.info(f"> {received_msg}")
+    async def _handle_message(self, received_msg: str) -> Message:
         if received_msg == "PING :tmi.twitch.tv":
-            self._send_command("PONG :tmi.twitch.tv")
+            logs.log_received("", received_msg)
+            self._send_command("PONG :tmi.twitch.tv", Priority.PONG)
             return Message(command=Commands.PING)
         elif received_msg == ":tmi.twitch.tv RECONNECT":
-            self._restart_connection()
-        elif not received_msg:
-            return Message()
-        return Bot._parse_message(received_msg)
+            await self._restart_connection()
+        if next(_PARSED) & 15:
+            message = Bot._parse_message(received_msg)
+        else:
+            start = time.perf_counter()
+            message = Bot._parse_message(received_msg)
+            _PARSE_SECONDS.observe(time.perf_counter() - start)
+        logs.log_received(message.channel, received_msg)
+        if message.command == Commands.USERSTATE:
+            self._outbound.set_moderator(message.channel, _is_moderator(message))
+        return message
 
-    def _receive_messages(self) -> bytes:
-        for _ in range(10):
+    async def _receive_messages(self) -> list[str]:
+        while True:
             try:
-                received_msgs = self._irc.recv(2048)
-            except ConnectionResetError as e:
-                logger.exception(e)
-                time.sleep(1)
-                self._restart_connection()
+                received_bytes = await self._reader.read(RECV_SIZE)
+            except OSError as e:
+                logger.warning(f"Connection lost: {e}")
             else:
-                break
-        else:
-            logger.error("Unable to connect to twitch. Exiting")
-            sys.exit(1)
-        return received_msgs
-
-    def _connected(self) -> bool:
-        received_msgs = self._receive_messages()
-        for received_msg in received_msgs.decode("utf-8").split("\r\n"):
-            self._buffered_messages.append(self._handle_message(received_msg))
+                if received_bytes:
+                    break
+                # An empty read means twitch closed the connection.
+                logger.warning("Connection closed by twitch")
+            await self._restart_connection()
+        lines = self._framer.feed(received_bytes)
+        _LINES_RECEIVED.inc(amount=len(lines))
+        if self.recorder:
+            self.recorder.record(lines)
+        return lines
+
+    async def _connected(self) -> bool:
+        received_msgs = []
+        while not received_msgs:
+            received_msgs = await self._receive_messages()
+        for received_msg in received_msgs:
+            self._buffered_messages.append(await self._handle_message(received_msg))
         if self._buffered_messages[0] == Message(
             {},
             "",
@@ -208,39 +852,49 @@ class Bot(ABCBot):
         logger.debug(f"Connected")
         return True
 
-    def get_messages(self) -> list[Message]:
-        messages = []
-        messages.extend(self._buffered_messages)
+    async def get_messages(self) -> list[Message]:
+        messages = self._buffered_messages
         self._buffered_messages = []
-        received_msgs = self._receive_messages()
-        for received_msg in received_msgs.decode("utf-8").split("\r\n"):
-            message = self._handle_message(received_msg)
-            messages.append(message)
-
-            # If twitch closes the connection,
-            # we get spammed by empty messages.
-            # So we restart the connection
-            if message == Message():
-                self.empty_message_count += 1
-            else:
-                self.empty_message_count = 0
-            if self.empty_message_count > 10:
-                self.empty_message_count = 0
-                self._restart_connection()
-                return messages
+        for received_msg in await self._receive_messages():
+            messages.append(await self._handle_message(received_msg))
         return messages
 
+    # Can be called from any thread
     def disconnect(self) -> None:
         logger.debug("Disconnecting...")
-        self._irc.close()
+        if not self._writer:
+            return
+        if self._in_loop() or not self._loop or self._loop.is_closed():
+            self._writer.close()
+        else:
+            self._loop.call_soon_threadsafe(self._writer.close)
 
-    def _restart_connection(self):
+    # Retries with the same backoff as Bot until twitch can be reached again.
+    # Queued lines are kept until then.
+    async def _restart_connection(self):
         logger.warning("Restarting twitch connection")
+        lost_at = time.monotonic()
+        self._outbound.pause(None)
         self.disconnect()
-        time.sleep(2)
-        self._connect()
+        attempts = 0
+        while True:
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempts)
+            delay *= random.uniform(0.5, 1.0)
+            attempts += 1
+            logger.info(f"Reconnecting in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except OSError as e:
+                logger.warning(f"Unable to reconnect: {e}")
+            else:
+                break
+        latency = time.monotonic() - lost_at
+        self.reconnects += 1
+        self.reconnect_latencies.append(latency)
+        _RECONNECTS.inc("0")
+        _RECONNECT_SECONDS.observe(latency)
+        self._outbound.resume(None)
         self.join_channels(self._connected_channels)
-        time.sleep(2)
 
-    # Aliasing method names for backwards compatibility
     send_privmsg = send_message
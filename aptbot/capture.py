@@ -0,0 +1,265 @@
+import argparse
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Iterator, Optional, Union
+
+from .bot import ABCBot, Bot, Commands, Message
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".irc.gz"
+# Uncompressed bytes
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SECONDS = 3600
+FLUSH_INTERVAL = 1.0
+
+
+# Appends the raw lines the bot receives to gzip compressed segments in directory.
+# Each line is written as "<time.monotonic() in microseconds> <raw line>",
+# lines received by the same recv share their timestamp.
+# keep is the number of segments kept in the directory, at least the one
+# being written, None keeps them all.
+class Recorder:
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = SEGMENT_BYTES,
+        segment_seconds: float = SEGMENT_SECONDS,
+        keep: Optional[int] = None,
+    ):
+        if keep is not None and keep < 1:
+            raise ValueError("At least one segment has to be kept")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.keep = keep
+        self.lines = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._file: Optional[gzip.GzipFile] = None
+        self._path = ""
+        self._written = 0
+        self._opened = 0.0
+        self._count = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Called by the receiving thread, compression and
+    # writes happen on the recorder's own thread
+    def record(self, lines: list[str], now: Optional[float] = None):
+        if lines:
+            self._queue.put((time.monotonic() if now is None else now, lines))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            try:
+                if item:
+                    self._write(*item)
+                if self._file and time.monotonic() - flushed >= FLUSH_INTERVAL:
+                    # A sync flush, so a crash loses at most a second of traffic
+                    self._file.flush()
+                    flushed = time.monotonic()
+            except OSError as e:
+                logger.exception(f"Unable to write to {self._path}: {e}")
+                self._close_segment()
+        self._close_segment()
+
+    def _write(self, now: float, lines: list[str]):
+        if self._file is None or self._full():
+            self._close_segment()
+            self._open_segment()
+        stamp = f"{round(now * 1_000_000)} "
+        data = "".join(f"{stamp}{line}\n" for line in lines).encode()
+        self._file.write(data)
+        self._written += len(data)
+        self.lines += len(lines)
+
+    def _full(self) -> bool:
+        return (
+            self._written >= self.segment_bytes
+            or time.monotonic() - self._opened >= self.segment_seconds
+        )
+
+    def _open_segment(self):
+        started = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        name = f"capture-{started}-{os.getpid()}-{self._count:04d}{SUFFIX}"
+        self._count += 1
+        self._path = os.path.join(self.directory, name)
+        # Appending keeps what is already there, gzip readers join the members
+        self._file = gzip.open(self._path, "ab")
+        self._written = 0
+        self._opened = time.monotonic()
+        logger.debug(f"Recording to {self._path}")
+        self._remove_old_segments()
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError as e:
+            logger.exception(f"Unable to close {self._path}: {e}")
+        self._file = None
+
+    def _remove_old_segments(self):
+        if self.keep is None:
+            return
+        for path in segments(self.directory)[: -self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# The segments of a capture in the order they were written
+def segments(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path) if name.endswith(SUFFIX)
+    )
+
+
+# Yields (seconds, raw line) for every line of a capture,
+# a directory or a single segment.
+# A segment cut short, e.g. by a crash, is read up to where it stops.
+def read_capture(path: str) -> Iterator[tuple[float, str]]:
+    for segment in segments(path):
+        try:
+            with gzip.open(segment, "rt", encoding="utf-8", newline="\n") as f:
+                for record in f:
+                    stamp, _, line = record.rstrip("\n").partition(" ")
+                    yield int(stamp) / 1_000_000, line
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.warning(f"{segment} is incomplete: {e}")
+
+
+# Plays a capture back through get_messages, the messages of one recv are
+# returned together. speed 1.0 is real time, None as fast as possible.
+# Gaps longer than max_gap, e.g. between two runs of the bot, are shortened to it.
+# What handlers send is kept in sent.
+class ReplayBot(ABCBot):
+    def __init__(self, path: str, speed: Optional[float] = None, max_gap: float = 60.0):
+        self.speed = speed
+        self.max_gap = max_gap
+        self.lines = 0
+        self.sent: list[tuple[str, Union[list[str], str], Optional[str]]] = []
+        self.finished = threading.Event()
+        self._records = read_capture(path)
+        self._next = next(self._records, None)
+        self._started: Optional[float] = None
+        self._offset = 0.0
+        self._last = 0.0
+
+    def send_message(self, channel: str, text: Union[list[str], str], reply=None):
+        self.sent.append((channel, text, reply))
+
+    def join_channel(self, channel: str):
+        pass
+
+    def join_channels(self, channels):
+        pass
+
+    def leave_channel(self, channel: str):
+        pass
+
+    # Once the capture has been played, the call after the last batch
+    # sets finished and blocks, like a connection that stays quiet
+    def get_messages(self) -> list[Message]:
+        if self._next is None:
+            self.finished.set()
+            threading.Event().wait()
+        stamp = self._next[0]
+        lines = []
+        while self._next is not None and self._next[0] == stamp:
+            lines.append(self._next[1])
+            self._next = next(self._records, None)
+        self._wait(stamp)
+        self.lines += len(lines)
+        return [self._handle_message(line) for line in lines]
+
+    def _wait(self, stamp: float):
+        now = time.perf_counter()
+        if self._started is None:
+            self._started = now
+            self._offset = 0.0
+            self._last = stamp
+            return
+        self._offset += min(max(stamp - self._last, 0.0), self.max_gap)
+        self._last = stamp
+        if self.speed is None:
+            return
+        delay = self._started + self._offset / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _handle_message(received_msg: str) -> Message:
+        if received_msg == "PING :tmi.twitch.tv":
+            return Message(command=Commands.PING)
+        return Bot._parse_message(received_msg)
+
+
+def replay(path: str, speed: Optional[float] = None) -> ReplayBot:
+    from .main import ChannelTable, create_dispatcher, handle_message, load_modules
+
+    bot = ReplayBot(path, speed)
+    channels = ChannelTable()
+    load_modules(bot, channels)
+    dispatcher = create_dispatcher()
+    threading.Thread(
+        target=handle_message, args=(bot, channels, dispatcher), daemon=True
+    ).start()
+    bot.finished.wait()
+    while dispatcher.backlog or dispatcher.active:
+        time.sleep(0.01)
+    dispatcher.stop()
+    return bot
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m aptbot.capture",
+        description="Replay a capture through the accounts' modules",
+    )
+    parser.add_argument("path", help="A capture directory or a single segment")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        help="1 is real time, 2 twice as fast, default as fast as possible",
+    )
+    parser.add_argument(
+        "--cat", action="store_true", help="Print the raw lines instead"
+    )
+    args = parser.parse_args()
+    if args.cat:
+        for _, line in read_capture(args.path):
+            print(line)
+        return
+    logging.basicConfig(level=logging.WARNING)
+    start = time.perf_counter()
+    bot = replay(args.path, args.speed)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Replayed {bot.lines} lines in {elapsed:.2f}s "
+        f"({bot.lines / elapsed:,.0f} lines/s), {len(bot.sent)} messages sent"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,17 @@ import sys
 if os.name == "posix":
     if "XDG_CONFIG_HOME" in os.environ and "XDG_CACHE_HOME" in os.environ:
         CONFIG_PATH = os.path.join(os.environ["XDG_CONFIG_HOME"], f"aptbot")
-        CONFIG_LOGS = os.path.join(os.environ["XDG_CACHE_HOME"], "aptbot")
+        CONFIG_CACHE = os.path.join(os.environ["XDG_CACHE_HOME"], "aptbot")
+        CONFIG_LOGS = CONFIG_CACHE
     else:
         CONFIG_PATH = os.path.join(os.environ["HOME"], ".config/aptbot")
-        CONFIG_LOGS = os.path.join(os.environ["HOME"], ".cache/aptbot/logs")
+        CONFIG_CACHE = os.path.join(os.environ["HOME"], ".cache/aptbot")
+        CONFIG_LOGS = os.path.join(CONFIG_CACHE, "logs")
 elif os.name == "nt":
     if "APPDATA" in os.environ:
         CONFIG_PATH = os.path.join(os.environ["APPDATA"], "aptbot/accounts")
-        CONFIG_LOGS = os.path.join(os.environ["APPDATA"], "aptbot/logs")
+        CONFIG_CACHE = os.path.join(os.environ["APPDATA"], "aptbot")
+        CONFIG_LOGS = os.path.join(CONFIG_CACHE, "logs")
     else:
         print(
             "APPDATA is not set, something must be very wrong.",
@@ -27,9 +30,32 @@ MAIN_FILE_NAME = "main.py"
 
 PORT = 26538
 LOCALHOST = "127.0.0.1"
+# Used instead of PORT where unix sockets are available
+CONTROL_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR", CONFIG_CACHE), "aptbot.sock"
+)
+
+# Can be overridden with APTBOT_CONNECTIONS
+CONNECTIONS = 1
+
+# Can be overridden with APTBOT_WORKERS, APTBOT_MAX_QUEUED_MESSAGES
+# and APTBOT_SHED_POLICY (drop_oldest, drop_newest or block)
+WORKERS = 8
+# Per channel
+MAX_QUEUED_MESSAGES = 1000
+SHED_POLICY = "drop_oldest"
+
+# Can be overridden with APTBOT_PROCESSES, for accounts
+# that set PROCESS_POOL = True in their main.py
+PROCESSES = os.cpu_count() or 1
 
 os.makedirs(CONFIG_LOGS, exist_ok=True)
 CONFIG_FILE = os.path.join(CONFIG_LOGS, "aptbot.log")
+TRAFFIC_FILE = os.path.join(CONFIG_LOGS, "traffic.log")
+
+# Lines to and from twitch logged a second for each channel, in traffic.log.
+# Can be overridden with APTBOT_TRAFFIC_LOG_RATE, 0 logs none and inf all of them.
+TRAFFIC_LOG_RATE = 20.0
 # open(CONFIG_FILE, "a").close()
 
 LOGGING_DICT = {
@@ -53,13 +79,27 @@ LOGGING_DICT = {
             "utc": True,
             "backupCount": 3,
         },
+        "traffic": {
+            "class": "logging.handlers.TimedRotatingFileHandler",
+            "level": "INFO",
+            "formatter": "simple",
+            "filename": TRAFFIC_FILE,
+            "when": "w0",
+            "utc": True,
+            "backupCount": 3,
+        },
     },
     "loggers": {
         "basicLogger": {
             "level": "DEBUG",
             "handlers": ["console", "file"],
             "propagate": "no",
-        }
+        },
+        "aptbot.traffic": {
+            "level": "INFO",
+            "handlers": ["traffic"],
+            "propagate": False,
+        },
     },
     "root": {
         "level": "DEBUG",
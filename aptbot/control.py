@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Iterable, Optional, Union
+
+from .constants import CONTROL_SOCKET, LOCALHOST, PORT
+
+logger = logging.getLogger(__name__)
+
+RECV_SIZE = 65536
+MAX_REQUEST_LENGTH = 1 << 16
+# Keeps a client from filling both socket buffers before it reads
+PIPELINE_DEPTH = 1000
+
+Address = Union[str, tuple[str, int]]
+
+
+# One JSON object per line in both directions:
+#     {"id": 1, "command": "SEND", "channel": "foo", "message": "hi"}
+#     {"id": 1, "ok": true}
+#     {"id": 2, "ok": false, "error": "Unknown command: FOO"}
+# Requests can be pipelined, every request gets a response in order.
+def default_address() -> Address:
+    if hasattr(socket, "AF_UNIX") and os.name == "posix":
+        return CONTROL_SOCKET
+    return (LOCALHOST, PORT)
+
+
+def _family(address: Address) -> int:
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+def _encode(response: dict) -> bytes:
+    return json.dumps(response, separators=(",", ":")).encode() + b"\n"
+
+
+class ControlServer:
+    def __init__(
+        self,
+        handlers: dict[str, Callable[[dict], object]],
+        address: Optional[Address] = None,
+    ):
+        self._handlers = handlers
+        self._address = address or default_address()
+        # Commands change the bot's state, they are run one at a time
+        self._lock = threading.Lock()
+        self._socket: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+        self.handled = 0
+
+    @property
+    def address(self) -> Address:
+        return self._address
+
+    def bind(self):
+        address = self._address
+        s = socket.socket(_family(address))
+        if isinstance(address, str):
+            self._remove_stale_socket(address)
+            s.bind(address)
+            os.chmod(address, 0o600)
+        else:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(address)
+            self._address = s.getsockname()
+        s.listen(64)
+        self._socket = s
+
+    @staticmethod
+    def _remove_stale_socket(path: str):
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            raise OSError(f"Another aptbot is listening on {path}")
+        finally:
+            probe.close()
+
+    def serve_forever(self):
+        if self._socket is None:
+            self.bind()
+        clients = []
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            thread.start()
+            clients = [c for c in clients if c.is_alive()]
+            clients.append(thread)
+        # Lets the client that stopped the server get its response
+        deadline = time.monotonic() + 1.0
+        for thread in clients:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def stop(self):
+        self._stopped.set()
+        if self._socket is None:
+            return
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        if isinstance(self._address, str):
+            try:
+                os.unlink(self._address)
+            except FileNotFoundError:
+                pass
+
+    def _serve(self, conn: socket.socket):
+        buffer = bytearray()
+        with conn:
+            while not self._stopped.is_set():
+                try:
+                    data = conn.recv(RECV_SIZE)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                end = buffer.rfind(b"\n")
+                if end == -1:
+                    if len(buffer) > MAX_REQUEST_LENGTH:
+                        conn.sendall(_encode(_error(None, "Request too long")))
+                        return
+                    continue
+                lines = bytes(buffer[:end]).split(b"\n")
+                del buffer[: end + 1]
+                # Everything that arrived together is answered together
+                responses = b"".join(
+                    _encode(self._handle(line)) for line in lines if line.strip()
+                )
+                try:
+                    conn.sendall(responses)
+                except OSError:
+                    return
+
+    def _handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return _error(None, f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            return _error(None, "A request must be a JSON object")
+        request_id = request.get("id")
+        handler = self._handlers.get(request.get("command"))
+        if handler is None:
+            return _error(request_id, f"Unknown command: {request.get('command')}")
+        try:
+            with self._lock:
+                result = handler(request)
+        except Exception as e:
+            logger.exception(e)
+            return _error(request_id, str(e))
+        finally:
+            self.handled += 1
+        response = {"id": request_id, "ok": True}
+        if result is not None:
+            response["result"] = result
+        return response
+
+
+def _error(request_id, error: str) -> dict:
+    return {"id": request_id, "ok": False, "error": error}
+
+
+class ControlError(Exception):
+    pass
+
+
+class ControlClient:
+    def __init__(self, address: Optional[Address] = None, timeout: float = 10.0):
+        address = address or default_address()
+        self._socket = socket.socket(_family(address))
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(address)
+        except OSError:
+            self._socket.close()
+            raise
+        self._buffer = bytearray()
+        self._next_id = 0
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, command: str, **arguments) -> dict:
+        return self.pipeline(((command, arguments),))[0]
+
+    # Sends up to PIPELINE_DEPTH requests before reading their responses
+    def pipeline(self, requests: Iterable[tuple[str, dict]]) -> list[dict]:
+        responses = []
+        data = []
+        for command, arguments in requests:
+            self._next_id += 1
+            data.append(_encode({"id": self._next_id, "command": command, **arguments}))
+            if len(data) == PIPELINE_DEPTH:
+                responses.extend(self._exchange(data))
+                data = []
+        if data:
+            responses.extend(self._exchange(data))
+        return responses
+
+    def _exchange(self, data: list[bytes]) -> list[dict]:
+        self._socket.sendall(b"".join(data))
+        return [self._read_response() for _ in data]
+
+    def _read_response(self) -> dict:
+        while True:
+            end = self._buffer.find(b"\n")
+            if end != -1:
+                line = bytes(self._buffer[:end])
+                del self._buffer[: end + 1]
+                return json.loads(line)
+            data = self._socket.recv(RECV_SIZE)
+            if not data:
+                raise ControlError("The bot closed the connection")
+            self._buffer += data
+
+
+def connect(address: Optional[Address] = None) -> Optional[ControlClient]:
+    try:
+        return ControlClient(address)
+    except OSError:
+        return None
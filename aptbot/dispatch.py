@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from enum import Enum
+from typing import Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class ShedPolicy(Enum):
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+
+
+# Every channel has its own ordered queue, which is processed by one
+# worker at a time. Channels with waiting work take turns round-robin,
+# a channel's weight is how many of its calls run per turn.
+class Dispatcher:
+    def __init__(
+        self,
+        workers: int,
+        max_queued: int,
+        policy: ShedPolicy = ShedPolicy.DROP_OLDEST,
+    ):
+        self._workers = workers
+        self._max_queued = max_queued
+        self._policy = policy
+        self._queues: dict[Hashable, deque] = {}
+        self._ready: deque = deque()
+        # The channels in _ready, each is there at most once
+        self._scheduled: set[Hashable] = set()
+        self._running: set[Hashable] = set()
+        self._weights: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._threads: list[threading.Thread] = []
+        self._stopped = False
+        self._backlog = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.active = 0
+
+    @property
+    def policy(self) -> ShedPolicy:
+        return self._policy
+
+    @property
+    def max_queued(self) -> int:
+        return self._max_queued
+
+    @property
+    def backlog(self) -> int:
+        return self._backlog
+
+    def backlog_of(self, channel: Hashable) -> int:
+        queue = self._queues.get(channel)
+        return len(queue) if queue else 0
+
+    def backlogs(self) -> dict[Hashable, int]:
+        with self._lock:
+            return {channel: len(queue) for channel, queue in self._queues.items()}
+
+    def set_weight(self, channel: Hashable, weight: int):
+        with self._lock:
+            self._weights[channel] = max(1, weight)
+
+    def start(self):
+        self._stopped = False
+        for i in range(self._workers):
+            thread = threading.Thread(
+                target=self._run, name=f"aptbot-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            self._not_full.notify_all()
+        self._threads.clear()
+
+    def submit(self, channel: Hashable, function: Callable, *args) -> bool:
+        with self._condition:
+            queue = self._queues.get(channel)
+            if queue is None:
+                queue = self._queues[channel] = deque()
+            if len(queue) >= self._max_queued:
+                if self._policy == ShedPolicy.DROP_NEWEST:
+                    self._drop(channel)
+                    return False
+                if self._policy == ShedPolicy.DROP_OLDEST:
+                    queue.popleft()
+                    self._backlog -= 1
+                    self._drop(channel)
+                else:
+                    while len(queue) >= self._max_queued and not self._stopped:
+                        self._not_full.wait()
+                    # A worker may have emptied and removed it meanwhile
+                    queue = self._queues.setdefault(channel, queue)
+            queue.append((function, args))
+            self._backlog += 1
+            self.submitted += 1
+            if channel not in self._scheduled and channel not in self._running:
+                self._schedule(channel)
+        return True
+
+    def _schedule(self, channel: Hashable):
+        self._ready.append(channel)
+        self._scheduled.add(channel)
+        self._condition.notify()
+
+    def _drop(self, channel: Hashable):
+        self.dropped += 1
+        _log_drop(channel, self._max_queued, self.dropped)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._ready and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                channel = self._ready.popleft()
+                self._scheduled.discard(channel)
+                queue = self._queues[channel]
+                weight = self._weights.get(channel, 1)
+                calls = [queue.popleft() for _ in range(min(weight, len(queue)))]
+                self._running.add(channel)
+                self._backlog -= len(calls)
+                self.active += 1
+                self._not_full.notify_all()
+            failed = 0
+            for function, args in calls:
+                try:
+                    function(*args)
+                except Exception as e:
+                    logger.exception(e)
+                    failed += 1
+            with self._condition:
+                self._running.discard(channel)
+                if queue:
+                    self._schedule(channel)
+                elif self._queues.get(channel) is queue:
+                    del self._queues[channel]
+                self.active -= 1
+                self.completed += len(calls)
+                self.failed += failed
+
+
+# Runs coroutines on the running event loop, in order for each channel
+# like Dispatcher does with threads. Every channel has an asyncio.Queue
+# and one task that awaits its calls one after the other.
+class AsyncDispatcher:
+    def __init__(self, max_queued: int, policy: ShedPolicy = ShedPolicy.DROP_OLDEST):
+        self._max_queued = max_queued
+        self._policy = policy
+        self._queues: dict[Hashable, asyncio.Queue] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.active = 0
+
+    @property
+    def backlog(self) -> int:
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def backlog_of(self, channel: Hashable) -> int:
+        queue = self._queues.get(channel)
+        return queue.qsize() if queue else 0
+
+    def backlogs(self) -> dict[Hashable, int]:
+        return {channel: queue.qsize() for channel, queue in self._queues.items()}
+
+    # Waits for room in the channel's queue with ShedPolicy.BLOCK
+    async def submit(
+        self, channel: Hashable, function: Callable[..., Awaitable], *args
+    ) -> bool:
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = asyncio.Queue(self._max_queued)
+            self._tasks[channel] = asyncio.create_task(self._run(queue))
+        if queue.full():
+            if self._policy == ShedPolicy.DROP_NEWEST:
+                self._drop(channel)
+                return False
+            if self._policy == ShedPolicy.DROP_OLDEST:
+                queue.get_nowait()
+                self._drop(channel)
+        await queue.put((function, args))
+        self.submitted += 1
+        return True
+
+    def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._queues.clear()
+
+    def _drop(self, channel: Hashable):
+        self.dropped += 1
+        _log_drop(channel, self._max_queued, self.dropped)
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            function, args = await queue.get()
+            self.active += 1
+            try:
+                await function(*args)
+            except Exception as e:
+                logger.exception(e)
+                self.failed += 1
+            finally:
+                self.active -= 1
+                self.completed += 1
+
+
+def _log_drop(channel: Hashable, max_queued: int, dropped: int):
+    # Don't flood the log during a burst
+    if dropped & (dropped - 1) == 0:
+        logger.warning(
+            f"Dispatch queue of {channel} is full ({max_queued}), "
+            f"{dropped} messages dropped so far"
+        )
@@ -0,0 +1,316 @@
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+from . import capture
+from .bot import LineFramer, RECV_SIZE
+
+logger = logging.getLogger(__name__)
+
+HOST = "tmi.twitch.tv"
+
+
+def privmsg(
+    channel: str,
+    text: str,
+    nick: str = "viewer",
+    tags: Optional[dict[str, str]] = None,
+) -> str:
+    tags = {
+        "badge-info": "",
+        "badges": "",
+        "color": "#1E90FF",
+        "display-name": nick,
+        "emotes": "",
+        "id": "0c1ff4b4-2b6f-4bd2-a8f0-53c5ab0e3b8b",
+        "mod": "0",
+        "room-id": "1",
+        "subscriber": "0",
+        "tmi-sent-ts": str(int(time.time() * 1000)),
+        "user-id": "1",
+        "user-type": "",
+        **(tags or {}),
+    }
+    raw_tags = ";".join(f"{key}={value}" for key, value in tags.items())
+    return f"@{raw_tags} :{nick}!{nick}@{nick}.{HOST} PRIVMSG #{channel} :{text}"
+
+
+class Client:
+    def __init__(self, server: "FakeTwitch", conn: socket.socket):
+        self.server = server
+        self.conn = conn
+        self.nick = ""
+        self.channels: set[str] = set()
+        self.registered = threading.Event()
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def send(self, lines: Iterable[str]):
+        data = "".join(line + "\r\n" for line in lines).encode()
+        with self._lock:
+            self.conn.sendall(data)
+
+    def close(self):
+        self.closed = True
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+
+
+# A local stand-in for twitch's IRC server. It answers the registration,
+# CAP, PING, JOIN and PART, records what clients send,
+# and can send clients chat lines, PINGs and RECONNECTs.
+class FakeTwitch:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        moderator: bool = False,
+        answer_pings: bool = True,
+        accept_login: bool = True,
+    ):
+        self.moderator = moderator
+        self.answer_pings = answer_pings
+        self.accept_login = accept_login
+        self.clients: list[Client] = []
+        # (client index, time.perf_counter(), line) for every line received
+        self.received: list[tuple[int, float, str]] = []
+        self.on_privmsg: Optional[Callable[[Client, str, str], None]] = None
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen()
+        self.host, self.port = self._socket.getsockname()[:2]
+        self._lock = threading.Lock()
+        self._stopped = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._stopped = True
+        self._socket.close()
+        for client in list(self.clients):
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _accept(self):
+        while not self._stopped:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = Client(self, conn)
+            with self._lock:
+                self.clients.append(client)
+                index = len(self.clients) - 1
+            threading.Thread(
+                target=self._serve, args=(client, index), daemon=True
+            ).start()
+
+    def _serve(self, client: Client, index: int):
+        framer = LineFramer()
+        while True:
+            try:
+                data = client.conn.recv(RECV_SIZE)
+            except OSError:
+                break
+            if not data:
+                break
+            now = time.perf_counter()
+            for line in framer.feed(data):
+                self.received.append((index, now, line))
+                try:
+                    self._handle(client, line)
+                except OSError:
+                    break
+        client.closed = True
+        client.channels.clear()
+
+    def _handle(self, client: Client, line: str):
+        if line[:1] == "@":
+            line = line.partition(" ")[2]
+        command, _, rest = line.partition(" ")
+        if command == "NICK":
+            client.nick = rest
+            if not self.accept_login:
+                client.send([f":{HOST} NOTICE * :Login authentication failed"])
+                return
+            client.send(
+                [
+                    f":{HOST} 001 {rest} :Welcome, GLHF!",
+                    f":{HOST} 376 {rest} :>",
+                ]
+            )
+            client.registered.set()
+        elif command == "CAP":
+            client.send([f":{HOST} CAP * ACK {rest.partition(' ')[2]}"])
+        elif command == "PING" and self.answer_pings:
+            client.send([f"PONG {rest}"])
+        elif command == "JOIN":
+            lines = []
+            badges = "moderator/1" if self.moderator else ""
+            for channel in rest.split(","):
+                channel = channel.lstrip("#")
+                client.channels.add(channel)
+                nick = client.nick
+                lines.append(f":{nick}!{nick}@{nick}.{HOST} JOIN #{channel}")
+                lines.append(
+                    f"@badge-info=;badges={badges};color=;display-name={nick};"
+                    f"emote-sets=0;mod={int(self.moderator)};subscriber=0;"
+                    f"user-type= :{HOST} USERSTATE #{channel}"
+                )
+                lines.append(
+                    f"@emote-only=0;followers-only=-1;r9k=0;room-id=1;slow=0;"
+                    f"subs-only=0 :{HOST} ROOMSTATE #{channel}"
+                )
+            client.send(lines)
+        elif command == "PART":
+            channel = rest.lstrip("#")
+            client.channels.discard(channel)
+            nick = client.nick
+            client.send([f":{nick}!{nick}@{nick}.{HOST} PART #{channel}"])
+        elif command == "PRIVMSG" and self.on_privmsg:
+            channel, _, text = rest.partition(" :")
+            self.on_privmsg(client, channel.lstrip("#"), text)
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def wait_for_joins(self, channels: Iterable[str], timeout: float = 5.0) -> bool:
+        channels = set(channels)
+        return self.wait_for(
+            lambda: channels
+            <= set().union(*(client.channels for client in self.connected)),
+            timeout,
+        )
+
+    def received_lines(self, client: Optional[int] = None) -> list[str]:
+        return [
+            line
+            for index, _, line in list(self.received)
+            if client is None or index == client
+        ]
+
+    @property
+    def connected(self) -> list[Client]:
+        return [client for client in list(self.clients) if not client.closed]
+
+    # Sends each line to the clients that joined its channel,
+    # lines without a channel go to every client
+    def send(self, lines: Iterable[str]):
+        clients = self.connected
+        members: dict[str, list[Client]] = {"": clients}
+        batches: dict[Client, list[str]] = {}
+        for line in lines:
+            channel = _channel_of(line)
+            if channel not in members:
+                members[channel] = [c for c in clients if channel in c.channels]
+            for client in members[channel]:
+                batches.setdefault(client, []).append(line)
+        for client, batch in batches.items():
+            try:
+                client.send(batch)
+            except OSError:
+                pass
+
+    # rate is in lines per second, None sends them as fast as possible.
+    # Returns how many lines were sent.
+    def play(self, lines: Iterable[str], rate: Optional[float] = None) -> int:
+        sent = 0
+        batch = []
+        start = time.perf_counter()
+        lines = iter(lines)
+        while True:
+            if rate is not None:
+                # Wait before taking the line, it may be made when it is taken
+                delay = start + (sent + len(batch)) / rate - time.perf_counter()
+                if delay > 0.001:
+                    self.send(batch)
+                    sent += len(batch)
+                    batch = []
+                    time.sleep(delay)
+            line = next(lines, None)
+            if line is None:
+                break
+            batch.append(line)
+            if len(batch) >= 256:
+                self.send(batch)
+                sent += len(batch)
+                batch = []
+        self.send(batch)
+        return sent + len(batch)
+
+    def ping(self):
+        self.send([f"PING :{HOST}"])
+
+    # Asks every client to reconnect and closes their connections
+    def reconnect(self, grace: float = 0.1):
+        clients = self.connected
+        self.send([f":{HOST} RECONNECT"])
+        time.sleep(grace)
+        for client in clients:
+            client.close()
+
+
+def _channel_of(line: str) -> str:
+    if line.startswith("@"):
+        line = line.partition(" ")[2]
+    if line.startswith(":"):
+        line = line.partition(" ")[2]
+    target = line.partition(" ")[2].partition(" ")[0]
+    return target[1:] if target.startswith("#") else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m aptbot.fake_twitch",
+        description="Serve a fake twitch IRC server and replay chat to it",
+    )
+    parser.add_argument("--port", type=int, default=6667)
+    parser.add_argument("--moderator", action="store_true")
+    parser.add_argument(
+        "--replay",
+        type=str,
+        help="File of raw IRC lines or a capture to send once a client joins",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="Lines per second, default as fast as possible"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = FakeTwitch(port=args.port, moderator=args.moderator)
+    logger.info(f"Listening on {server.host}:{server.port}")
+    if args.replay:
+        server.wait_for(
+            lambda: any(client.channels for client in server.connected),
+            timeout=float("inf"),
+        )
+        if os.path.isdir(args.replay) or args.replay.endswith(capture.SUFFIX):
+            lines = (line for _, line in capture.read_capture(args.replay))
+            sent = server.play((line for line in lines if line), args.rate)
+        else:
+            with open(args.replay, encoding="utf-8") as f:
+                lines = (line.rstrip("\r\n") for line in f)
+                sent = server.play((line for line in lines if line), args.rate)
+        logger.info(f"Sent {sent} lines")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
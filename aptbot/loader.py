@@ -0,0 +1,144 @@
+import hashlib
+import importlib.abc
+import importlib.util
+import logging
+import os
+import sys
+import traceback
+from types import ModuleType
+from typing import Optional
+
+from .constants import MAIN_FILE_NAME
+
+logger = logging.getLogger(__name__)
+
+PACKAGE_PREFIX = "aptbot_channel_"
+
+
+def package_name(channel_name: str) -> str:
+    return PACKAGE_PREFIX + channel_name
+
+
+def module_files(channel_path: str) -> list[str]:
+    files = []
+    for root, dirs, names in os.walk(channel_path):
+        dirs[:] = sorted(
+            d for d in dirs if not d.startswith(".") and d != "__pycache__"
+        )
+        files.extend(
+            os.path.join(root, name) for name in sorted(names) if name.endswith(".py")
+        )
+    return files
+
+
+# Cheap to compute, changes whenever a file is saved
+def stat_signature(files: list[str]) -> tuple:
+    signature = []
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+# Only changes when the code does, e.g. not when a file is just touched
+def content_digest(files: list[str]) -> str:
+    digest = hashlib.sha1()
+    for path in files:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        digest.update(path.encode())
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _belongs_to(module: ModuleType, package: str, channel_path: str) -> bool:
+    if not isinstance(module, ModuleType):
+        return False
+    name = module.__name__
+    if name == package or name.startswith(package + "."):
+        return True
+    path = getattr(module, "__file__", None)
+    if not path:
+        return False
+    try:
+        return (
+            os.path.commonpath([channel_path, os.path.realpath(path)]) == channel_path
+        )
+    except ValueError:
+        return False
+
+
+# Forgets every module imported from the channel's directory,
+# so that the next import loads the siblings that changed.
+def unload_channel(channel_name: str, channel_path: str):
+    package = package_name(channel_name)
+    channel_path = os.path.realpath(channel_path)
+    for name, module in list(sys.modules.items()):
+        if _belongs_to(module, package, channel_path):
+            del sys.modules[name]
+
+
+# Resolves `import sibling` in a channel's modules to <package>.sibling, as
+# `from . import sibling` would, so that two channels can each have a helper.py.
+# Only used while the channel loads, after every other finder.
+class _SiblingFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def __init__(self, package: str, channel_path: str):
+        self.package = package
+        self.channel_path = channel_path
+
+    def find_spec(self, name, path=None, target=None):
+        if "." in name:
+            return None
+        sibling = os.path.join(self.channel_path, name)
+        if not (
+            os.path.isfile(sibling + ".py")
+            or os.path.isfile(os.path.join(sibling, "__init__.py"))
+        ):
+            return None
+        return importlib.util.spec_from_loader(f"{self.package}.{name}", self)
+
+    def create_module(self, spec):
+        return importlib.import_module(spec.name)
+
+    def exec_module(self, module):
+        pass
+
+
+# Each channel's main.py is loaded as <PACKAGE_PREFIX><channel>.main,
+# so channels don't overwrite each other and can use relative imports.
+# Bytecode is cached in the channel's __pycache__ by the source loader.
+def load_channel_module(channel_name: str, channel_path: str) -> Optional[ModuleType]:
+    package = package_name(channel_name)
+    unload_channel(channel_name, channel_path)
+
+    package_module = ModuleType(package)
+    package_module.__path__ = [channel_path]
+    package_module.__package__ = package
+    sys.modules[package] = package_module
+
+    module_path = os.path.join(channel_path, MAIN_FILE_NAME)
+    spec = importlib.util.spec_from_file_location(f"{package}.main", module_path)
+    if not spec or not spec.loader:
+        logger.warning(f"Problem loading for {channel_path}")
+        return None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    # Allows `import sibling` in main.py, as in earlier versions
+    finder = _SiblingFinder(package, channel_path)
+    sys.meta_path.append(finder)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        logger.exception(f"Problem Loading Module: {e}")
+        logger.exception(traceback.format_exc())
+        sys.modules.pop(spec.name, None)
+        return None
+    finally:
+        sys.meta_path.remove(finder)
+    return module
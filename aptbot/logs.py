@@ -0,0 +1,129 @@
+import atexit
+import logging
+import logging.config
+import logging.handlers
+import queue
+import time
+from typing import Optional
+
+from . import metrics
+
+# The lines received from and sent to twitch,
+# configured apart from the rest of the bot's logging
+traffic = logging.getLogger("aptbot.traffic")
+
+_SKIPPED = metrics.counter(
+    "aptbot_traffic_log_skipped_total",
+    "Lines to and from twitch not logged because their channel went over the rate",
+    ("direction",),
+)
+
+# (logger, its QueueHandler, the listener writing its records)
+_listeners: list[
+    tuple[logging.Logger, logging.Handler, logging.handlers.QueueListener]
+] = []
+
+
+# Lets through rate lines a second for each channel, in bursts of up to burst lines
+class ChannelRateLimit:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if burst is None:
+            burst = max(rate, 1.0) if rate else 0.0
+        self.rate = rate
+        self.burst = burst
+        # channel -> [tokens, time.monotonic() of the last update]
+        self._buckets: dict[str, list[float]] = {}
+
+    # Called from several threads without a lock,
+    # a race can let through an extra line
+    def allow(self, channel: str) -> bool:
+        now = time.monotonic()
+        bucket = self._buckets.get(channel)
+        if bucket is None:
+            bucket = self._buckets[channel] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+
+# None logs every line
+_received: Optional[ChannelRateLimit] = None
+_sent: Optional[ChannelRateLimit] = None
+
+
+# Lines a second for each channel and direction,
+# None logs every line and 0 none of them
+def set_traffic_rate(rate: Optional[float]):
+    global _received, _sent
+    if rate is None or rate == float("inf"):
+        _received = _sent = None
+    else:
+        _received = ChannelRateLimit(rate)
+        _sent = ChannelRateLimit(rate)
+
+
+def log_received(channel: str, line: str):
+    if not traffic.isEnabledFor(logging.INFO):
+        return
+    if _received and not _received.allow(channel):
+        _SKIPPED.inc(">")
+        return
+    traffic.info("> %s", line)
+
+
+def log_sent(channel: str, line: str):
+    if not traffic.isEnabledFor(logging.INFO):
+        return
+    if _sent and not _sent.allow(channel):
+        _SKIPPED.inc("<")
+        return
+    traffic.info("< %s", line)
+
+
+# Queues the record as it is, the message is formatted by the listener's thread.
+# Arguments changed right after logging could show their new value.
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# Applies config, then gives each configured logger's handlers a thread of their own.
+# Logging only puts the record on a queue, the writes to the terminal
+# and the files happen on those threads.
+def configure(config: dict):
+    stop()
+    logging.config.dictConfig(config)
+    for name in ["", *config.get("loggers", {})]:
+        logger = logging.getLogger(name)
+        handlers = logger.handlers[:]
+        if not handlers:
+            continue
+        records = queue.SimpleQueue()
+        for handler in handlers:
+            logger.removeHandler(handler)
+        queue_handler = _QueueHandler(records)
+        # Records no handler would write aren't formatted or queued
+        queue_handler.setLevel(min(handler.level for handler in handlers))
+        logger.addHandler(queue_handler)
+        listener = logging.handlers.QueueListener(
+            records, *handlers, respect_handler_level=True
+        )
+        listener.start()
+        _listeners.append((logger, queue_handler, listener))
+
+
+# Writes what is still queued and gives the loggers their handlers back
+def stop():
+    while _listeners:
+        logger, queue_handler, listener = _listeners.pop()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+
+
+atexit.register(stop)
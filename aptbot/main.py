@@ -1,33 +1,59 @@
-import importlib
-import importlib.util
+import asyncio
+import dataclasses
+import itertools
 import logging
-import logging.config
 import os
-import socket
 import sys
 import time
-import traceback
+from concurrent.futures import Future
 from dataclasses import dataclass
-from threading import Event, Thread
+from threading import Event, Lock, Thread
 from types import ModuleType
+from typing import Iterable, Iterator, Optional, Union
 
 from dotenv import load_dotenv
 
-from . import args_logic
+from . import args_logic, control, loader, logs, metrics
+from .capture import Recorder
 from .args import parse_arguments
-from .bot import Bot, Message
+from .bot import ABCBot, AsyncBot, Bot, Message
 from .constants import (
     CONFIG_LOGS,
     CONFIG_PATH,
-    LOCALHOST,
+    CONNECTIONS,
     LOGGING_DICT,
-    MAIN_FILE_NAME,
-    PORT,
+    MAX_QUEUED_MESSAGES,
+    PROCESSES,
+    SHED_POLICY,
+    TRAFFIC_LOG_RATE,
+    WORKERS,
 )
+from .control import ControlServer
+from .dispatch import AsyncDispatcher, Dispatcher, ShedPolicy
+from .processes import ProcessPool
+from .registry import CommandRegistry
 
-logging.config.dictConfig(LOGGING_DICT)
+logs.configure(LOGGING_DICT)
 logger = logging.getLogger(__name__)
 
+_MESSAGES = metrics.counter(
+    "aptbot_messages_total", "Messages routed to a channel", ("channel",)
+)
+_DISPATCH_WAIT_SECONDS = metrics.histogram(
+    "aptbot_dispatch_wait_seconds",
+    "Time a handler call waits in its channel's dispatch queue, 1 in 16 calls",
+    ("channel",),
+)
+_SUBMITTED = itertools.count()
+_HANDLER_SECONDS = metrics.histogram(
+    "aptbot_handler_seconds",
+    "Time spent in a channel's handlers, 1 in 16 calls",
+    ("channel",),
+)
+_HANDLER_ERRORS = metrics.counter(
+    "aptbot_handler_errors_total", "Handler calls that raised", ("channel",)
+)
+
 load_dotenv()
 
 
@@ -35,8 +61,11 @@ load_dotenv()
 class Channel:
     name: str
     module: ModuleType
-    thread: Thread
+    # None when the module has no start function
+    thread: Optional[Thread]
     stop_event: Event
+    stats: tuple = ()
+    digest: str = ""
 
     def __hash__(self):
         return hash(self.name)
@@ -44,54 +73,342 @@ class Channel:
     def __eq__(self, other):
         return self.name == other.name
 
+    # The module's main gets every message, registered commands
+    # only the messages that match them
+    def handlers(self, message: Message) -> list:
+        registry = getattr(self.module, "registry", None)
+        handlers = []
+        if isinstance(registry, CommandRegistry):
+            handlers = registry.match(message)
+        main = getattr(self.module, "main", None)
+        if main:
+            handlers.insert(0, main)
+        return handlers
+
+    @property
+    def in_process(self) -> bool:
+        return bool(getattr(self.module, "PROCESS_POOL", False))
+
+
+# Routes messages to channels by name. Readers never lock,
+# writers build a new dict and swap it in, so a reload can't
+# change the routes while handle_message is looking them up.
+class ChannelTable:
+    def __init__(self):
+        self._routes: dict[str, Channel] = {}
+        self.lock = Lock()
+
+    def get(self, name: str) -> Optional[Channel]:
+        return self._routes.get(name)
+
+    @property
+    def routes(self) -> dict[str, Channel]:
+        return self._routes
+
+    def replace(self, routes: dict[str, Channel]):
+        self._routes = routes
+
+    def remove(self, name: str) -> Optional[Channel]:
+        with self.lock:
+            routes = dict(self._routes)
+            channel = routes.pop(name, None)
+            self._routes = routes
+        return channel
+
+    def __iter__(self) -> Iterator[Channel]:
+        return iter(self._routes.values())
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+
+def run_module_function(bot: ABCBot, function, *args):
+    if not asyncio.iscoroutinefunction(function):
+        return function(*args)
+    if isinstance(bot, AsyncBot) and bot.loop:
+        return asyncio.run_coroutine_threadsafe(function(*args), bot.loop).result()
+    return asyncio.run(function(*args))
+
+
+# submitted is 0 for the calls that aren't timed
+def run_handler(channel_name: str, submitted: float, function, *args):
+    if not submitted:
+        try:
+            return function(*args)
+        except Exception:
+            _HANDLER_ERRORS.inc(channel_name)
+            raise
+    start = time.perf_counter()
+    _DISPATCH_WAIT_SECONDS.observe(start - submitted, channel_name)
+    try:
+        return function(*args)
+    except Exception:
+        _HANDLER_ERRORS.inc(channel_name)
+        raise
+    finally:
+        _HANDLER_SECONDS.observe(time.perf_counter() - start, channel_name)
+
 
-def handle_message(bot: Bot, channels: set[Channel]):
+# run_handler for coroutines, awaited on the bot's loop
+async def run_handler_async(channel_name: str, submitted: float, function, *args):
+    if not submitted:
+        try:
+            return await function(*args)
+        except Exception:
+            _HANDLER_ERRORS.inc(channel_name)
+            raise
+    start = time.perf_counter()
+    _DISPATCH_WAIT_SECONDS.observe(start - submitted, channel_name)
+    try:
+        return await function(*args)
+    except Exception:
+        _HANDLER_ERRORS.inc(channel_name)
+        raise
+    finally:
+        _HANDLER_SECONDS.observe(time.perf_counter() - start, channel_name)
+
+
+def submit_handler(
+    bot: ABCBot,
+    channel: Channel,
+    dispatcher: Dispatcher,
+    pool: Optional[ProcessPool],
+    function,
+    message: Message,
+):
+    if pool and channel.in_process:
+        call = (
+            pool.call,
+            bot,
+            channel.name,
+            os.path.join(CONFIG_PATH, channel.name),
+            channel.digest,
+            function,
+            message,
+        )
+    else:
+        call = (run_module_function, bot, function, bot, message)
+    submitted = 0.0 if next(_SUBMITTED) & 15 else time.perf_counter()
+    dispatcher.submit(channel.name, run_handler, channel.name, submitted, *call)
+
+
+def handle_message(
+    bot: Bot,
+    channels: ChannelTable,
+    dispatcher: Dispatcher,
+    pool: Optional[ProcessPool] = None,
+):
     while True:
         messages = bot.get_messages()
         for message in messages:
-            if not message.channel:
+            channel = channels.get(message.channel)
+            if not channel:
                 continue
-            for channel in channels:
-                if channel.name != message.channel:
-                    continue
-                Thread(
-                    target=channel.module.main, args=(bot, message), daemon=True
-                ).start()
-                break
+            _MESSAGES.inc(channel.name)
+            for function in channel.handlers(message):
+                submit_handler(bot, channel, dispatcher, pool, function, message)
 
 
-def run_start(channels: set[Channel]):
-    for channel in channels:
-        channel.thread.start()
+# Coroutine handlers are queued for their channel on the bot's loop, ordinary
+# ones go to the worker threads like without asyncio. Either way a channel's
+# handlers of that kind run in order and a busy channel sheds its own messages.
+async def handle_message_async(
+    bot: AsyncBot,
+    channels: ChannelTable,
+    dispatcher: Dispatcher,
+    pool: Optional[ProcessPool] = None,
+    async_dispatcher: Optional[AsyncDispatcher] = None,
+):
+    if async_dispatcher is None:
+        async_dispatcher = AsyncDispatcher(dispatcher.max_queued, dispatcher.policy)
+    loop = asyncio.get_running_loop()
+    # A full queue would otherwise hold up the loop that runs the handlers
+    blocking = dispatcher.policy == ShedPolicy.BLOCK
+    while True:
+        messages = await bot.get_messages()
+        for message in messages:
+            channel = channels.get(message.channel)
+            if not channel:
+                continue
+            _MESSAGES.inc(channel.name)
+            in_process = pool and channel.in_process
+            for function in channel.handlers(message):
+                if asyncio.iscoroutinefunction(function) and not in_process:
+                    submitted = 0.0 if next(_SUBMITTED) & 15 else time.perf_counter()
+                    await async_dispatcher.submit(
+                        channel.name,
+                        run_handler_async,
+                        channel.name,
+                        submitted,
+                        function,
+                        bot,
+                        message,
+                    )
+                elif blocking:
+                    await loop.run_in_executor(
+                        None,
+                        submit_handler,
+                        bot,
+                        channel,
+                        dispatcher,
+                        pool,
+                        function,
+                        message,
+                    )
+                else:
+                    submit_handler(bot, channel, dispatcher, pool, function, message)
+
+
+# Runs handle_message_async on the bot's loop, and starts it again if it fails,
+# so that an error doesn't silently stop the bot from reading chat
+def start_handle_message_async(
+    bot: AsyncBot,
+    channels: ChannelTable,
+    dispatcher: Dispatcher,
+    pool: Optional[ProcessPool] = None,
+    async_dispatcher: Optional[AsyncDispatcher] = None,
+) -> Future:
+    if async_dispatcher is None:
+        async_dispatcher = AsyncDispatcher(dispatcher.max_queued, dispatcher.policy)
+    future = asyncio.run_coroutine_threadsafe(
+        handle_message_async(bot, channels, dispatcher, pool, async_dispatcher),
+        bot.loop,
+    )
+
+    def restart(future: Future):
+        if future.cancelled() or bot.loop.is_closed():
+            return
+        e = future.exception()
+        logger.error(f"Reading chat failed, restarting: {e!r}", exc_info=e)
+        start_handle_message_async(bot, channels, dispatcher, pool, async_dispatcher)
+
+    future.add_done_callback(restart)
+    return future
 
 
-def disable_channel(channel_name: str, channels: set[Channel]):
+def run_start(channels: Iterable[Channel]):
     for channel in channels:
-        if channel.name != channel_name:
-            continue
-        channel.stop_event.set()
-        logger.debug(f"Event set for {channel}")
-        channels.remove(channel)
-        logger.debug(f"{channel} removed")
-        break
+        if channel.thread:
+            channel.thread.start()
+
 
+def disable_channel(channel_name: str, channels: ChannelTable):
+    channel = channels.remove(channel_name)
+    if not channel:
+        return
+    channel.stop_event.set()
+    logger.debug(f"Event set for {channel}")
+    logger.debug(f"{channel} removed")
 
-def enable(bot: Bot, channels: set[Channel]):
+
+def create_dispatcher() -> Dispatcher:
+    workers = int(os.getenv("APTBOT_WORKERS", WORKERS))
+    max_queued = int(os.getenv("APTBOT_MAX_QUEUED_MESSAGES", MAX_QUEUED_MESSAGES))
+    policy = ShedPolicy(os.getenv("APTBOT_SHED_POLICY", SHED_POLICY))
+    logger.debug(f"Dispatching with {workers} workers, {max_queued} queued, {policy}")
+    dispatcher = Dispatcher(workers, max_queued, policy)
+    dispatcher.start()
+    return dispatcher
+
+
+def register_metrics(
+    bot: Union[Bot, AsyncBot],
+    dispatcher: Dispatcher,
+    async_dispatcher: Optional[AsyncDispatcher] = None,
+):
+    dispatchers = [dispatcher]
+    if async_dispatcher:
+        dispatchers.append(async_dispatcher)
+
+    def backlogs() -> dict[tuple, float]:
+        totals: dict[tuple, float] = {}
+        for d in dispatchers:
+            for c, n in d.backlogs().items():
+                totals[(str(c),)] = totals.get((str(c),), 0) + n
+        return totals
+
+    metrics.gauge(
+        "aptbot_dispatch_backlog",
+        "Handler calls waiting in each channel's dispatch queue",
+        backlogs,
+        ("channel",),
+    )
+    metrics.gauge(
+        "aptbot_dispatch_active",
+        "Handlers running",
+        lambda: sum(d.active for d in dispatchers),
+    )
+    metrics.gauge(
+        "aptbot_dispatch_dropped_total",
+        "Messages dropped because a channel's dispatch queue was full",
+        lambda: sum(d.dropped for d in dispatchers),
+        type="counter",
+    )
+    metrics.gauge(
+        "aptbot_send_queue_depth",
+        "Lines waiting to be sent to twitch",
+        lambda: bot.outbound.depth,
+    )
+    metrics.gauge(
+        "aptbot_lines_sent_total",
+        "Lines written to twitch",
+        lambda: bot.outbound.sent,
+        type="counter",
+    )
+    port = os.getenv("APTBOT_METRICS_PORT")
+    if port:
+        metrics.serve(int(port))
+
+
+def create_process_pool() -> ProcessPool:
+    processes = int(os.getenv("APTBOT_PROCESSES", PROCESSES))
+    logger.debug(f"Process pool with {processes} processes")
+    return ProcessPool(processes)
+
+
+def create_recorder() -> Optional[Recorder]:
+    directory = os.getenv("APTBOT_RECORD_DIR")
+    if not directory:
+        return None
+    keep = os.getenv("APTBOT_RECORD_KEEP")
+    logger.debug(f"Recording received lines to {directory}")
+    return Recorder(directory, keep=int(keep) if keep else None)
+
+
+def enable(
+    bot: ABCBot,
+    channels: ChannelTable,
+    dispatcher: Dispatcher,
+    pool: Optional[ProcessPool] = None,
+    async_dispatcher: Optional[AsyncDispatcher] = None,
+):
     load_modules(bot, channels)
+    if isinstance(bot, AsyncBot):
+        start_handle_message_async(bot, channels, dispatcher, pool, async_dispatcher)
+        return
     message_handler_thread = Thread(
         target=handle_message,
         args=(
             bot,
             channels,
+            dispatcher,
+            pool,
         ),
         daemon=True,
     )
     message_handler_thread.start()
 
 
-def load_modules(bot: Bot, channels: set[Channel]):
-    old_channels = channels.copy()
-    channels.clear()
+def load_modules(bot: ABCBot, channels: ChannelTable):
+    with channels.lock:
+        _load_modules(bot, channels)
+
+
+def _load_modules(bot: ABCBot, channels: ChannelTable):
+    old_channels = channels.routes
+    new_channels: dict[str, Channel] = {}
+    # Channels whose start thread was created by this load
+    started: list[str] = []
     channel_names = [
         c
         for c in os.listdir(CONFIG_PATH)
@@ -100,56 +417,60 @@ def load_modules(bot: Bot, channels: set[Channel]):
     channel_names = filter(lambda x: not x.startswith("."), channel_names)
     for channel_name in channel_names:
         channel_path = os.path.join(CONFIG_PATH, channel_name)
-        sys.path.append(channel_path)
-        module_path = os.path.join(channel_path, MAIN_FILE_NAME)
-        spec = importlib.util.spec_from_file_location(
-            "main",
-            module_path,
-        )
-        if not spec or not spec.loader:
-            logger.warning(f"Problem loading for {channel_path}")
-            sys.path.remove(channel_path)
+        channel = old_channels.get(channel_name)
+        files = loader.module_files(channel_path)
+        stats = loader.stat_signature(files)
+        if channel and channel.stats == stats:
+            new_channels[channel_name] = channel
             continue
-        module = importlib.util.module_from_spec(spec)
-        try:
-            spec.loader.exec_module(module)
-        except Exception as e:
-            logger.exception(f"Problem Loading Module: {e}")
-            logger.exception(traceback.format_exc())
+        digest = loader.content_digest(files)
+        if channel and channel.digest == digest:
+            new_channels[channel_name] = dataclasses.replace(channel, stats=stats)
+            continue
+
+        logger.debug(f"Loading module for account: {channel_name}")
+        module = loader.load_channel_module(channel_name, channel_path)
+        if module is None:
+            # Keep running the last version that loaded
+            if channel:
+                new_channels[channel_name] = channel
+            continue
+        if channel:
+            stop_event = channel.stop_event
+            thread = channel.thread
+            logger.debug(f"Copied stop_event and thread for account: {channel.name}")
         else:
-            for channel in old_channels:
-                if channel_name != channel.name:
-                    continue
-                stop_event = channel.stop_event
-                thread = channel.thread
-                logger.debug(
-                    f"Copied stop_event and thread for account: {channel.name}"
-                )
-                break
-            else:
-                stop_event = Event()
-                thread = Thread(
-                    target=module.start,
-                    args=(bot, Message(channel=channel_name), stop_event),
-                    daemon=True,
-                )
-                logger.debug(
-                    f"Created stop event and thread for account: {channel_name}"
-                )
-            channels.add(
-                Channel(
-                    name=channel_name,
-                    module=module,
-                    thread=thread,
-                    stop_event=stop_event,
+            stop_event = Event()
+            thread = None
+            logger.debug(f"Created stop event for account: {channel_name}")
+        start = getattr(module, "start", None)
+        if thread is None and start:
+            thread = Thread(
+                target=run_module_function,
+                args=(
+                    bot,
+                    start,
+                    bot,
+                    Message(channel=channel_name),
+                    stop_event,
                 ),
+                daemon=True,
             )
-        sys.path.remove(channel_path)
-    new_channels = channels.difference(old_channels)
-    run_start(new_channels)
+            started.append(channel_name)
+            logger.debug(f"Created thread for account: {channel_name}")
+        new_channels[channel_name] = Channel(
+            name=channel_name,
+            module=module,
+            thread=thread,
+            stop_event=stop_event,
+            stats=stats,
+            digest=digest,
+        )
+    channels.replace(new_channels)
+    run_start(new_channels[channel_name] for channel_name in started)
 
 
-def initialize(bot: Bot):
+def initialize(bot: ABCBot):
     logger.debug("Initializing...")
     channels = [
         c
@@ -160,65 +481,99 @@ def initialize(bot: Bot):
     bot.join_channels(channels)
 
 
-def listener():
+def connect_async(bot: AsyncBot) -> bool:
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(bot.connect(), loop).result()
+
+
+def listener(use_asyncio: bool = False):
     NICK = os.getenv("APTBOT_NICK")
     OAUTH = os.getenv("APTBOT_PASS")
     if NICK and OAUTH:
-        bot = Bot(NICK, OAUTH)
+        connections = int(os.getenv("APTBOT_CONNECTIONS", CONNECTIONS))
+        if use_asyncio:
+            bot = AsyncBot(NICK, OAUTH)
+        else:
+            bot = Bot(NICK, OAUTH, connections=connections)
     else:
         logger.error(
             "The environment variables:\nAPTBOT_NICK\nAPTBOT_PASS\nare not set."
         )
         time.sleep(3)
         sys.exit(1)
-    if not bot.connect():
+    logs.set_traffic_rate(float(os.getenv("APTBOT_TRAFFIC_LOG_RATE", TRAFFIC_LOG_RATE)))
+    bot.recorder = create_recorder()
+    connected = connect_async(bot) if use_asyncio else bot.connect()
+    if not connected:
         logger.error("Twitch couldn't authenticate your credentials")
         time.sleep(3)
         sys.exit(1)
     initialize(bot)
-    channels: set[Channel] = set()
+    channels = ChannelTable()
+    dispatcher = create_dispatcher()
+    pool = create_process_pool()
+    async_dispatcher = None
+    if use_asyncio:
+        async_dispatcher = AsyncDispatcher(dispatcher.max_queued, dispatcher.policy)
+    register_metrics(bot, dispatcher, async_dispatcher)
     message_loop = Thread(
         target=enable,
         args=(
             bot,
             channels,
+            dispatcher,
+            pool,
+            async_dispatcher,
         ),
         daemon=True,
     )
     message_loop.start()
-    s = socket.socket()
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    logger.debug("setsockopt")
-    s.bind((LOCALHOST, PORT))
-    s.listen(5)
 
-    while True:
-        c, _ = s.accept()
-        msg = c.recv(1024).decode()
-        msg = msg.split("===")
-        try:
-            command = msg[0]
-            channel = msg[1]
-            msg = msg[2]
-        except IndexError:
-            pass
-        else:
-            if args_logic.BotCommands.JOIN.value in command:
-                bot.join_channel(channel)
-            elif args_logic.BotCommands.SEND.value in command:
-                bot.send_message(channel, msg)
-            elif args_logic.BotCommands.KILL.value in command:
-                bot.disconnect()
-                c.close()
-                s.close()
-                sys.exit()
-            elif args_logic.BotCommands.UPDATE.value in command:
-                load_modules(bot, channels)
-            elif args_logic.BotCommands.PART.value in command:
-                disable_channel(channel, channels)
-                bot.leave_channel(channel)
-
-        time.sleep(1)
+    def join(request: dict):
+        bot.join_channel(_channel(request))
+
+    def part(request: dict):
+        channel = _channel(request)
+        disable_channel(channel, channels)
+        bot.leave_channel(channel)
+
+    def send(request: dict):
+        bot.send_message(_channel(request), str(request.get("message", "")))
+
+    def update(request: dict):
+        load_modules(bot, channels)
+
+    def metrics_text(request: dict) -> str:
+        return metrics.REGISTRY.render()
+
+    def kill(request: dict):
+        bot.disconnect()
+        pool.shutdown()
+        if bot.recorder:
+            bot.recorder.close()
+        server.stop()
+
+    server = ControlServer(
+        {
+            args_logic.BotCommands.JOIN.value: join,
+            args_logic.BotCommands.PART.value: part,
+            args_logic.BotCommands.SEND.value: send,
+            args_logic.BotCommands.UPDATE.value: update,
+            args_logic.BotCommands.KILL.value: kill,
+            args_logic.BotCommands.METRICS.value: metrics_text,
+        }
+    )
+    logger.debug(f"Listening for commands on {server.address}")
+    server.serve_forever()
+    sys.exit()
+
+
+def _channel(request: dict) -> str:
+    channel = request.get("channel")
+    if not channel or not isinstance(channel, str):
+        raise ValueError("A channel is required")
+    return channel
 
 
 def main():
@@ -226,25 +581,24 @@ def main():
     os.makedirs(CONFIG_PATH, exist_ok=True)
     os.makedirs(CONFIG_LOGS, exist_ok=True)
     if argsv.enable:
-        listener()
+        listener(argsv.asyncio)
 
-    s = socket.socket()
-    try:
-        s.connect((LOCALHOST, PORT))
-    except ConnectionRefusedError:
-        pass
+    client = control.connect()
 
     if argsv.add_account:
-        args_logic.add_account(s, argsv.add_account)
+        args_logic.add_account(client, argsv.add_account)
     if argsv.disable_account:
-        args_logic.disable_account(s, argsv.disable_account)
+        args_logic.disable_account(client, argsv.disable_account)
     if argsv.send_message:
-        args_logic.send_msg(s, argsv.send_message)
+        args_logic.send_msg(client, argsv.send_message)
     if argsv.disable:
-        args_logic.disable(s)
+        args_logic.disable(client)
     if argsv.update:
-        args_logic.update(s)
-    s.close()
+        args_logic.update(client)
+    if argsv.metrics:
+        args_logic.print_metrics(client)
+    if client:
+        client.close()
 
 
 if __name__ == "__main__":
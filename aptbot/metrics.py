@@ -0,0 +1,287 @@
+import bisect
+import logging
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+# Seconds
+LATENCY_BUCKETS = (
+    0.00001,
+    0.00005,
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    60.0,
+)
+
+Sample = tuple[str, tuple[tuple[str, str], ...], float]
+
+
+# Dropped with the thread local values of a thread that ended
+class _Owner:
+    pass
+
+
+# Every thread updates its own values, so recording never takes a lock.
+# They are only added up when the metrics are collected. The values of
+# threads that ended are added to _retired, so their shards don't pile up.
+class _Sharded:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._retired: dict[tuple, object] = {}
+        # _retire may run from the garbage collector while it is held
+        self._lock = threading.RLock()
+
+    def _new_shard(self) -> dict:
+        values = self._local.values = {}
+        owner = self._local.owner = _Owner()
+        with self._lock:
+            self._shards.append(values)
+        weakref.finalize(owner, self._retire, values)
+        return values
+
+    def _retire(self, values: dict):
+        with self._lock:
+            self._shards = [shard for shard in self._shards if shard is not values]
+            for labels, value in values.items():
+                total = self._retired.get(labels)
+                self._retired[labels] = (
+                    value if total is None else self._merge(total, value)
+                )
+
+    @staticmethod
+    def _merge(total, value):
+        return total + value
+
+    def _items(self) -> Iterator[tuple[tuple, object]]:
+        with self._lock:
+            shards = list(self._shards)
+            retired = list(self._retired.items())
+        yield from retired
+        for values in shards:
+            yield from list(values.items())
+
+
+class Counter(_Sharded):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def inc(self, *labels: str, amount: float = 1):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return sum(value for key, value in self._items() if key == labels)
+
+    def samples(self) -> Iterator[Sample]:
+        totals: dict[tuple, float] = {}
+        for labels, value in self._items():
+            totals[labels] = totals.get(labels, 0) + value
+        for labels, value in totals.items():
+            yield "", tuple(zip(self.labels, labels)), value
+
+
+class Histogram(_Sharded):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._buckets = buckets
+
+    def observe(self, value: float, *labels: str):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        # [count per bucket..., count above the last bucket, sum]
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * (len(self._buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        counts[-1] += value
+
+    @staticmethod
+    def _merge(total: list, counts: list) -> list:
+        return [a + b for a, b in zip(total, counts)]
+
+    def _totals(self) -> dict[tuple, list]:
+        totals: dict[tuple, list] = {}
+        for labels, counts in self._items():
+            total = totals.get(labels)
+            if total is None:
+                totals[labels] = list(counts)
+            else:
+                totals[labels] = self._merge(total, counts)
+        return totals
+
+    def count(self, *labels: str) -> int:
+        counts = self._totals().get(labels)
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self) -> Iterator[Sample]:
+        for labels, counts in self._totals().items():
+            labels = tuple(zip(self.labels, labels))
+            total = 0
+            for bucket, count in zip(self._buckets + (float("inf"),), counts):
+                total += count
+                yield "_bucket", labels + (("le", _format(bucket)),), total
+            yield "_sum", labels, counts[-1]
+            yield "_count", labels, total
+
+
+# Read when the metrics are collected, e.g. the length of a queue
+class Gauge:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        function: Callable[[], Union[float, dict[tuple, float]]],
+        labels: tuple[str, ...] = (),
+        type: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.type = type
+        self._function = function
+
+    def samples(self) -> Iterator[Sample]:
+        values = self._function()
+        if not isinstance(values, dict):
+            yield "", (), values
+            return
+        for labels, value in values.items():
+            yield "", tuple(zip(self.labels, labels)), value
+
+
+Metric = Union[Counter, Histogram, Gauge]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    # A metric with the same name replaces the previous one
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.exception(e)
+                continue
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_labels(labels)} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def histogram(
+    name: str,
+    help: str,
+    labels: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = LATENCY_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def gauge(
+    name: str,
+    help: str,
+    function: Callable[[], Union[float, dict[tuple, float]]],
+    labels: tuple[str, ...] = (),
+    type: str = "gauge",
+) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, function, labels, type))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+# Serves /metrics on localhost
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.debug(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
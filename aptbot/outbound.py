@@ -0,0 +1,340 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Callable, Iterable, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# (messages, seconds), https://dev.twitch.tv/docs/irc#rate-limits
+USER_LIMIT = (20, 30.0)
+MODERATOR_LIMIT = (100, 30.0)
+CHANNEL_LIMIT = (1, 1.0)
+JOIN_LIMIT = (20, 10.0)
+
+MAX_BATCH_BYTES = 8192
+
+_SEND_WAIT_SECONDS = metrics.histogram(
+    "aptbot_send_wait_seconds",
+    "Time lines wait in the outbound queue before being written",
+    ("priority",),
+)
+
+
+class Priority(IntEnum):
+    PONG = 0
+    CONTROL = 1
+    JOIN = 2
+    MESSAGE = 3
+
+
+# Looking up Priority.name for every line sent costs more than recording it
+_PRIORITY_NAMES = [priority.name for priority in Priority]
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, period: float):
+        self._capacity = capacity
+        self._rate = capacity / period
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now <= self._updated:
+            return
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self._rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self._tokens -= 1
+
+
+class OutboundQueue:
+    def __init__(
+        self,
+        write: Callable[[Optional[int], bytes], None],
+        on_error: Optional[Callable[[Optional[int]], None]] = None,
+        user_limit: tuple[int, float] = USER_LIMIT,
+        moderator_limit: tuple[int, float] = MODERATOR_LIMIT,
+        channel_limit: tuple[int, float] = CHANNEL_LIMIT,
+        join_limit: tuple[int, float] = JOIN_LIMIT,
+        max_batch_bytes: int = MAX_BATCH_BYTES,
+    ):
+        # write(connection, data) is given the connection
+        # each line was queued for, or None.
+        self._write = write
+        self._on_error = on_error
+        self._paused: set[Optional[int]] = set()
+        self._max_batch_bytes = max_batch_bytes
+        self._user_bucket = TokenBucket(*user_limit)
+        self._moderator_bucket = TokenBucket(*moderator_limit)
+        self._join_bucket = TokenBucket(*join_limit)
+        self._joins: deque = deque()
+        self._channel_limit = channel_limit
+        self._channel_buckets: dict[str, TokenBucket] = {}
+        self._moderator_channels: set[str] = set()
+        # PONG and control lines, by priority
+        self._heap = []
+        # Messages are kept in order for each channel, and the channels
+        # with messages in a heap of (eligible from, first line, channel),
+        # so a rate limited channel is skipped without looking at its lines.
+        self._messages: dict[Optional[str], deque] = {}
+        self._ready: list[tuple[float, int, Optional[str]]] = []
+        self._queued_messages = 0
+        # Channels whose first message waits for a paused connection
+        self._parked: dict[Optional[int], list[Optional[str]]] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.sent = 0
+        self.writes = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._heap) + len(self._joins) + self._queued_messages
+
+    @property
+    def pending_joins(self) -> int:
+        return len(self._joins)
+
+    @property
+    def average_wait(self) -> float:
+        return self._total_wait / self.sent if self.sent else 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    # Lines for a paused connection are kept until it is resumed
+    def pause(self, connection: Optional[int]):
+        with self._condition:
+            self._paused.add(connection)
+
+    def resume(self, connection: Optional[int]):
+        with self._condition:
+            self._paused.discard(connection)
+            for channel in self._parked.pop(connection, ()):
+                heapq.heappush(
+                    self._ready, (0.0, self._messages[channel][0][1], channel)
+                )
+            self._condition.notify()
+
+    def is_moderator(self, channel: str) -> bool:
+        return channel in self._moderator_channels
+
+    def set_moderator(self, channel: str, is_moderator: bool):
+        with self._condition:
+            if is_moderator and channel not in self._moderator_channels:
+                self._moderator_channels.add(channel)
+                # It may be waiting for the channel limit it no longer has
+                self._ready = [
+                    (0.0, line, c) if c == channel else (eligible, line, c)
+                    for eligible, line, c in self._ready
+                ]
+                heapq.heapify(self._ready)
+            elif not is_moderator:
+                self._moderator_channels.discard(channel)
+            self._condition.notify()
+
+    def put(
+        self,
+        line: str,
+        priority: Priority = Priority.CONTROL,
+        channel: Optional[str] = None,
+        connection: Optional[int] = None,
+    ):
+        self.put_many(((line, priority, channel, connection),))
+
+    def put_many(
+        self, items: Iterable[tuple[str, Priority, Optional[str], Optional[int]]]
+    ):
+        now = time.monotonic()
+        with self._condition:
+            for line, priority, channel, connection in items:
+                item = (
+                    priority,
+                    next(self._counter),
+                    now,
+                    channel,
+                    connection,
+                    (line + "\r\n").encode(),
+                )
+                # JOINs are paced in the order they were asked for
+                if priority == Priority.JOIN:
+                    self._joins.append(item)
+                elif priority == Priority.MESSAGE:
+                    self._queue_message(item)
+                else:
+                    heapq.heappush(self._heap, item)
+            self._condition.notify()
+
+    def _queue_message(self, item: tuple, first: bool = False):
+        channel = item[3]
+        lines = self._messages.get(channel)
+        if lines is None:
+            lines = self._messages[channel] = deque()
+            heapq.heappush(self._ready, (0.0, item[1], channel))
+        if first:
+            lines.appendleft(item)
+        else:
+            lines.append(item)
+        self._queued_messages += 1
+
+    def _message_delay(self, channel: Optional[str], now: float) -> float:
+        if channel in self._moderator_channels:
+            return self._moderator_bucket.delay(now)
+        delay = max(self._user_bucket.delay(now), self._moderator_bucket.delay(now))
+        if channel is not None:
+            bucket = self._channel_buckets.get(channel)
+            if bucket is None:
+                bucket = self._channel_buckets[channel] = TokenBucket(
+                    *self._channel_limit
+                )
+            delay = max(delay, bucket.delay(now))
+        return delay
+
+    def _consume_message(self, channel: Optional[str], now: float):
+        self._moderator_bucket.consume(now)
+        if channel in self._moderator_channels:
+            return
+        self._user_bucket.consume(now)
+        if channel is not None:
+            self._channel_buckets[channel].consume(now)
+
+    def _add_to_batch(self, batch: list, item: tuple, now: float) -> int:
+        batch.append(item)
+        self.last_wait = now - item[2]
+        _SEND_WAIT_SECONDS.observe(self.last_wait, _PRIORITY_NAMES[item[0]])
+        self.max_wait = max(self.max_wait, self.last_wait)
+        self._total_wait += self.last_wait
+        return len(item[5])
+
+    def _take_batch(self, now: float) -> tuple[list[tuple], float]:
+        batch = []
+        size = 0
+        delay = 0.0
+        heap = self._heap
+        paused = self._paused
+        deferred = []
+        while heap and size < self._max_batch_bytes:
+            item = heapq.heappop(heap)
+            if item[4] in paused:
+                deferred.append(item)
+                continue
+            size += self._add_to_batch(batch, item, now)
+        for item in deferred:
+            heapq.heappush(heap, item)
+
+        held = []
+        while self._joins and size < self._max_batch_bytes:
+            if self._joins[0][4] in paused:
+                held.append(self._joins.popleft())
+                continue
+            delay = self._join_bucket.delay(now)
+            if delay:
+                break
+            self._join_bucket.consume(now)
+            size += self._add_to_batch(batch, self._joins.popleft(), now)
+        self._joins.extendleft(reversed(held))
+
+        ready = self._ready
+        while ready and size < self._max_batch_bytes:
+            eligible, _, channel = ready[0]
+            if eligible > now:
+                delay = _shortest(delay, eligible - now)
+                break
+            lines = self._messages[channel]
+            connection = lines[0][4]
+            if connection in paused:
+                heapq.heappop(ready)
+                self._parked.setdefault(connection, []).append(channel)
+                continue
+            message_delay = self._message_delay(channel, now)
+            if message_delay:
+                if self._moderator_bucket.delay(now):
+                    # Nothing else can be sent before the delay is over
+                    delay = _shortest(delay, message_delay)
+                    break
+                heapq.heapreplace(ready, (now + message_delay, lines[0][1], channel))
+                continue
+            self._consume_message(channel, now)
+            size += self._add_to_batch(batch, lines.popleft(), now)
+            self._queued_messages -= 1
+            if lines:
+                heapq.heapreplace(ready, (0.0, lines[0][1], channel))
+            else:
+                heapq.heappop(ready)
+                del self._messages[channel]
+        return batch, delay
+
+    def _requeue(self, items: list[tuple], connection: Optional[int]):
+        with self._condition:
+            self._paused.add(connection)
+            self.sent -= len(items)
+            for item in reversed(items):
+                if item[0] == Priority.JOIN:
+                    self._joins.appendleft(item)
+                elif item[0] == Priority.MESSAGE:
+                    self._queue_message(item, first=True)
+                else:
+                    heapq.heappush(self._heap, item)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self.depth and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                batch, delay = self._take_batch(time.monotonic())
+                if not batch:
+                    # Without a delay everything left is paused
+                    self._condition.wait(delay or None)
+                    continue
+                self.sent += len(batch)
+            for connection, items in _group_by_connection(batch):
+                self.writes += 1
+                try:
+                    self._write(connection, b"".join(item[5] for item in items))
+                except OSError as e:
+                    logger.warning(f"Unable to write to connection {connection}: {e}")
+                    self._requeue(items, connection)
+                    if self._on_error:
+                        self._on_error(connection)
+
+
+def _shortest(delay: float, other: float) -> float:
+    return min(delay, other) if delay else other
+
+
+def _group_by_connection(batch: list[tuple]) -> list[tuple[Optional[int], list[tuple]]]:
+    connections: dict[Optional[int], list[tuple]] = {}
+    for item in batch:
+        connections.setdefault(item[4], []).append(item)
+    return list(connections.items())
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from types import ModuleType
+from typing import Callable, Optional, Union
+
+from . import loader
+from .bot import ABCBot, Message
+
+logger = logging.getLogger(__name__)
+
+
+# Stands in for the bot inside a worker process,
+# what the module sends is replayed on the real bot.
+class ProxyBot(ABCBot):
+    def __init__(self):
+        self.sent: list[tuple[str, Union[list[str], str], Optional[str]]] = []
+
+    def send_message(self, channel: str, text: Union[list[str], str], reply=None):
+        self.sent.append((channel, text, reply))
+
+
+# channel name -> (digest, module), in each worker process
+_modules: dict[str, tuple[str, ModuleType]] = {}
+
+
+def _load(channel_name: str, channel_path: str, digest: str) -> ModuleType:
+    cached = _modules.get(channel_name)
+    if cached and cached[0] == digest:
+        return cached[1]
+    module = loader.load_channel_module(channel_name, channel_path)
+    if module is None:
+        raise RuntimeError(f"Unable to load the module of {channel_name}")
+    _modules[channel_name] = (digest, module)
+    return module
+
+
+def _call(
+    channel_name: str,
+    channel_path: str,
+    digest: str,
+    function_name: str,
+    message: Message,
+) -> list[tuple[str, Union[list[str], str], Optional[str]]]:
+    module = _load(channel_name, channel_path, digest)
+    function = getattr(module, function_name)
+    bot = ProxyBot()
+    if asyncio.iscoroutinefunction(function):
+        asyncio.run(function(bot, message))
+    else:
+        function(bot, message)
+    return bot.sent
+
+
+# Runs module functions in worker processes, which load the
+# channel's module themselves and reload it when its digest changes.
+class ProcessPool:
+    def __init__(self, processes: int):
+        self._processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads isn't safe
+                self._executor = ProcessPoolExecutor(
+                    self._processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    # A worker that dies breaks the whole executor,
+    # the next call starts a new one.
+    def _drop_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not executor:
+                return
+            logger.error("A worker process died, starting new worker processes")
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def call(
+        self,
+        bot: ABCBot,
+        channel_name: str,
+        channel_path: str,
+        digest: str,
+        function: Callable,
+        message: Message,
+    ):
+        executor = self._get_executor()
+        try:
+            sent = executor.submit(
+                _call, channel_name, channel_path, digest, function.__name__, message
+            ).result()
+        except BrokenProcessPool:
+            self._drop_executor(executor)
+            raise
+        if sent:
+            bot.send_messages(sent)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
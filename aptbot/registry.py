@@ -0,0 +1,106 @@
+import time
+from typing import Callable, Iterable, Optional
+
+from .bot import Commands, Message
+
+
+class _Handler:
+    __slots__ = ("function", "commands", "cooldown", "user_cooldown", "_used", "_users")
+
+    def __init__(
+        self,
+        function: Callable,
+        commands: frozenset,
+        cooldown: float,
+        user_cooldown: float,
+    ):
+        self.function = function
+        self.commands = commands
+        self.cooldown = cooldown
+        self.user_cooldown = user_cooldown
+        self._used = float("-inf")
+        self._users: dict[str, float] = {}
+
+    def ready(self, message: Message, now: float) -> bool:
+        if message.command not in self.commands:
+            return False
+        if now - self._used < self.cooldown:
+            return False
+        if self.user_cooldown:
+            if now - self._users.get(message.nick, float("-inf")) < self.user_cooldown:
+                return False
+            self._users[message.nick] = now
+            if len(self._users) > 10000:
+                self._users = {
+                    nick: used
+                    for nick, used in self._users.items()
+                    if now - used < self.user_cooldown
+                }
+        self._used = now
+        return True
+
+
+# Commands are indexed by their trigger, the first word of a message,
+# so a message that triggers nothing is dropped with one dict lookup.
+#
+#     registry = CommandRegistry()
+#
+#     @registry.command("!hello", cooldown=5)
+#     def hello(bot, message):
+#         ...
+class CommandRegistry:
+    def __init__(self):
+        self._triggers: dict[str, list[_Handler]] = {}
+        self._listeners: dict[Commands, list[_Handler]] = {}
+
+    def command(
+        self,
+        *triggers: str,
+        commands: Iterable[Commands] = (Commands.PRIVMSG,),
+        cooldown: float = 0.0,
+        user_cooldown: float = 0.0,
+    ):
+        if not triggers:
+            raise ValueError("A command needs at least one trigger")
+
+        def decorator(function: Callable) -> Callable:
+            handler = _Handler(function, frozenset(commands), cooldown, user_cooldown)
+            for trigger in triggers:
+                self._triggers.setdefault(trigger.lower(), []).append(handler)
+            return function
+
+        return decorator
+
+    # Handlers for every message of the given types, e.g. Commands.USERNOTICE
+    def on(self, *commands: Commands, cooldown: float = 0.0):
+        if not commands:
+            raise ValueError("A listener needs at least one message type")
+
+        def decorator(function: Callable) -> Callable:
+            handler = _Handler(function, frozenset(commands), cooldown, 0.0)
+            for command in commands:
+                self._listeners.setdefault(command, []).append(handler)
+            return function
+
+        return decorator
+
+    def match(self, message: Message, now: Optional[float] = None) -> list[Callable]:
+        listeners = self._listeners.get(message.command)
+        handlers = None
+        if self._triggers and message.value:
+            trigger = message.value.partition(" ")[0]
+            handlers = self._triggers.get(trigger) or self._triggers.get(
+                trigger.lower()
+            )
+        if not handlers and not listeners:
+            return []
+        if now is None:
+            now = time.monotonic()
+        matched = []
+        for handler in listeners or ():
+            if handler.ready(message, now):
+                matched.append(handler.function)
+        for handler in handlers or ():
+            if handler.ready(message, now):
+                matched.append(handler.function)
+        return matched
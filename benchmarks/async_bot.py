@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from threading import Event, Thread
+from types import SimpleNamespace
+
+from aptbot.bot import AsyncBot, Bot
+from aptbot.constants import WORKERS
+from aptbot.dispatch import AsyncDispatcher, Dispatcher
+from aptbot.main import Channel, ChannelTable, handle_message, handle_message_async
+
+MESSAGES = 100_000
+CHANNELS = 50
+LINE = (
+    "@badge-info=;badges=;color=#1E90FF;display-name=User{i};emotes=;"
+    "id=0c1ff4b4-2b6f-4bd2-a8f0-{i:012d};mod=0;room-id=1;subscriber=0;"
+    "tmi-sent-ts=1660000000000;turbo=0;user-id={i};user-type= "
+    ":user{i}!user{i}@user{i}.tmi.twitch.tv PRIVMSG #channel{c} :!hello number {i}"
+)
+
+
+# Serves a single connection, so a bot that is done can't reconnect
+# and be sent everything again while the next one is measured
+def serve(server: socket.socket, stream: bytes):
+    conn, _ = server.accept()
+    server.close()
+    conn.recv(4096)
+    conn.sendall(b":tmi.twitch.tv 001 aptbot :Welcome, GLHF!\r\n")
+    # Give the bot some time to process the welcome message
+    time.sleep(0.1)
+    conn.sendall(stream)
+    # Keep the connection open, the bot stops after MESSAGES messages
+    conn.recv(4096)
+    conn.close()
+
+
+def listen(stream: bytes) -> int:
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    threading.Thread(target=serve, args=(server, stream), daemon=True).start()
+    return server.getsockname()[1]
+
+
+def handler(bot, message):
+    if message.value.split()[0] == "!hello":
+        message.tags["display-name"]
+
+
+async def async_handler(bot, message):
+    handler(bot, message)
+
+
+def channel_table(main) -> ChannelTable:
+    module = SimpleNamespace(main=main)
+    channels = ChannelTable()
+    channels.replace(
+        {
+            f"channel{c}": Channel(f"channel{c}", module, Thread(), Event())
+            for c in range(CHANNELS)
+        }
+    )
+    return channels
+
+
+def bench_bot(stream: bytes) -> float:
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=listen(stream))
+    bot.connect()
+    dispatcher = Dispatcher(WORKERS, MESSAGES)
+    dispatcher.start()
+    channels = channel_table(handler)
+    start = time.perf_counter()
+    Thread(target=handle_message, args=(bot, channels, dispatcher), daemon=True).start()
+    while dispatcher.completed < MESSAGES:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+    bot.disconnect()
+    return elapsed
+
+
+async def bench_async_bot(stream: bytes, coroutine: bool) -> float:
+    bot = AsyncBot("aptbot", "token", server="127.0.0.1", port=listen(stream))
+    await bot.connect()
+    dispatcher = Dispatcher(WORKERS, MESSAGES)
+    dispatcher.start()
+    async_dispatcher = AsyncDispatcher(MESSAGES)
+    channels = channel_table(async_handler if coroutine else handler)
+    start = time.perf_counter()
+    task = asyncio.create_task(
+        handle_message_async(bot, channels, dispatcher, None, async_dispatcher)
+    )
+    while dispatcher.completed + async_dispatcher.completed < MESSAGES:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    async_dispatcher.stop()
+    dispatcher.stop()
+    bot.disconnect()
+    return elapsed
+
+
+def main():
+    # Neither the per message log lines nor the bots noticing
+    # that the server is gone once they are done are measured here
+    logging.disable(logging.WARNING)
+    stream = "".join(
+        LINE.format(i=i, c=i % CHANNELS) + "\r\n" for i in range(MESSAGES)
+    ).encode()
+    results = {
+        "Bot, handle_message, worker threads": bench_bot(stream),
+        "AsyncBot, sync handler, worker threads": asyncio.run(
+            bench_async_bot(stream, False)
+        ),
+        "AsyncBot, async handler, AsyncDispatcher": asyncio.run(
+            bench_async_bot(stream, True)
+        ),
+    }
+    for name, elapsed in results.items():
+        print(f"{name:<42} {MESSAGES / elapsed:>10,.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from aptbot.control import ControlClient, ControlServer
+
+COMMANDS = 20_000
+
+
+def legacy_server(s: socket.socket, handled: list):
+    # The previous listener, without its time.sleep(1) after every command
+    while True:
+        try:
+            c, _ = s.accept()
+        except OSError:
+            return
+        msg = c.recv(1024).decode().split("===")
+        handled.append(msg)
+        c.close()
+
+
+def bench_legacy(commands: int) -> float:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    s.listen(128)
+    handled = []
+    threading.Thread(target=legacy_server, args=(s, handled), daemon=True).start()
+    start = time.perf_counter()
+    for i in range(commands):
+        c = socket.socket()
+        c.connect(s.getsockname())
+        c.send(f"SEND===foo==={i}".encode())
+        c.close()
+    while len(handled) < commands:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    s.close()
+    return elapsed
+
+
+def bench_control(address, commands: int, clients: int, pipelined: bool) -> float:
+    handled = []
+    server = ControlServer({"SEND": lambda request: handled.append(request)}, address)
+    server.bind()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def run(count: int):
+        with ControlClient(server.address) as client:
+            requests = [
+                ("SEND", {"channel": "foo", "message": str(i)}) for i in range(count)
+            ]
+            if pipelined:
+                client.pipeline(requests)
+            else:
+                for command, arguments in requests:
+                    client.request(command, **arguments)
+
+    threads = [
+        threading.Thread(target=run, args=(commands // clients,))
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.stop()
+    assert len(handled) == commands // clients * clients
+    return elapsed
+
+
+def report(label: str, commands: int, elapsed: float):
+    print(f"{label:<42} {commands / elapsed:>9.0f} commands/s")
+
+
+def main():
+    commands = 2_000
+    # With the sleep it handled at most 1 command per second
+    report("legacy, connection per command, no sleep", commands, bench_legacy(commands))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "aptbot.sock")
+        for clients in (1, 4):
+            for pipelined in (False, True):
+                elapsed = bench_control(path, COMMANDS, clients, pipelined)
+                mode = "pipelined" if pipelined else "one at a time"
+                report(f"unix socket, {clients} client(s), {mode}", COMMANDS, elapsed)
+    elapsed = bench_control(("127.0.0.1", 0), COMMANDS, 1, True)
+    report("tcp, 1 client(s), pipelined", COMMANDS, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from threading import Event, Thread
+from types import SimpleNamespace
+
+from aptbot import logs
+from aptbot.bot import Bot, Commands
+from aptbot.constants import LOGGING_DICT
+from aptbot.dispatch import Dispatcher
+from aptbot.fake_twitch import FakeTwitch, privmsg
+from aptbot.main import Channel, ChannelTable, handle_message
+
+CHANNELS = 20
+# The moderator limit is 100 messages every 30 seconds
+REPLIES = 90
+
+
+class Results:
+    def __init__(self):
+        self.handled = 0
+        self.latencies: list[float] = []
+        self.round_trips: list[float] = []
+        self.lock = threading.Lock()
+
+    def wait(self, count: int, timeout: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.handled < count:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+
+def make_handler(results: Results):
+    def handler(bot, message):
+        now = time.perf_counter()
+        if message.command != Commands.PRIVMSG:
+            return
+        command, _, sent = message.value.partition(" ")
+        with results.lock:
+            results.handled += 1
+            results.latencies.append(now - float(sent))
+        if command == "!ping":
+            bot.send_message(message.channel, f"pong {sent}", reply=message.tags["id"])
+
+    return handler
+
+
+def chat(count: int, replies: int = 0):
+    every = count // replies if replies else 0
+    for i in range(count):
+        command = (
+            "!ping" if every and i % every == 0 and i // every < replies else "!hi"
+        )
+        # The timestamp is taken when the line is sent
+        yield privmsg(f"channel{i % CHANNELS}", f"{command} {time.perf_counter()!r}")
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    p50 = values[len(values) // 2]
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return (
+        f"p50 {p50 * 1e3:7.2f} ms, p99 {p99 * 1e3:7.2f} ms, "
+        f"max {values[-1] * 1e3:7.2f} ms"
+    )
+
+
+def run(messages: int, rate: float, workers: int):
+    server = FakeTwitch(moderator=True)
+    results = Results()
+
+    def on_privmsg(client, channel, text):
+        if text.startswith("pong "):
+            results.round_trips.append(time.perf_counter() - float(text[5:]))
+
+    server.on_privmsg = on_privmsg
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+    assert bot.connect()
+    names = [f"channel{i}" for i in range(CHANNELS)]
+    bot.join_channels(names)
+    assert server.wait_for_joins(names, timeout=30)
+
+    module = SimpleNamespace(main=make_handler(results))
+    channels = ChannelTable()
+    channels.replace({name: Channel(name, module, Thread(), Event()) for name in names})
+    dispatcher = Dispatcher(workers, max_queued=messages)
+    dispatcher.start()
+    Thread(target=handle_message, args=(bot, channels, dispatcher), daemon=True).start()
+
+    # As fast as possible
+    start = time.perf_counter()
+    server.play(chat(messages))
+    assert results.wait(messages)
+    elapsed = time.perf_counter() - start
+    print(f"{'throughput':<28} {messages / elapsed:,.0f} messages/s")
+    print(f"{'recv to handler, unpaced':<28} {percentiles(results.latencies)}")
+
+    # At a steady rate, with some messages answered
+    paced = int(rate * 5)
+    results.latencies.clear()
+    server.play(chat(paced, REPLIES), rate=rate)
+    assert results.wait(messages + paced)
+    server.wait_for(lambda: len(results.round_trips) >= REPLIES)
+    label = f"recv to handler, {rate:,.0f}/s"
+    print(f"{label:<28} {percentiles(results.latencies)}")
+    print(f"{'reply round trip':<28} {percentiles(results.round_trips)}")
+    print(f"{'dropped':<28} {dispatcher.dropped}")
+
+    dispatcher.stop()
+    bot.disconnect()
+    server.close()
+
+
+# Like LOGGING_DICT, without the terminal
+def log_config(directory: str) -> dict:
+    def file(name: str) -> dict:
+        return {
+            "class": "logging.FileHandler",
+            "formatter": "simple",
+            "filename": os.path.join(directory, name),
+        }
+
+    return {
+        "version": 1,
+        "formatters": LOGGING_DICT["formatters"],
+        "handlers": {"file": file("aptbot.log"), "traffic": file("traffic.log")},
+        "loggers": {
+            "aptbot.traffic": {
+                "level": "INFO",
+                "handlers": ["traffic"],
+                "propagate": False,
+            },
+        },
+        "root": {"level": "INFO", "handlers": ["file"]},
+        "disable_existing_loggers": False,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bot, handle_message and a Dispatcher against a fake twitch server"
+    )
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--rate", type=float, default=2_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--log",
+        action="store_true",
+        help="Keep the per message logging, written to a temporary directory",
+    )
+    parser.add_argument(
+        "--log-rate",
+        type=float,
+        help="Lines logged a second for each channel, default all of them",
+    )
+    args = parser.parse_args()
+
+    if args.log:
+        directory = tempfile.TemporaryDirectory()
+        logs.configure(log_config(directory.name))
+        logs.set_traffic_rate(args.log_rate)
+    else:
+        logging.disable(logging.INFO)
+    run(args.messages, args.rate, args.workers)
+    logs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+import ttv_api
+import ttv_api.cache
+import ttv_api.users
+from ttv_api.fake_helix import FakeHelix
+
+LOOKUPS = 200
+
+
+# What every ttv_api function did before the shared pool
+def new_pool_per_call(url: str):
+    http = urllib3.PoolManager()
+    return http.request("GET", url, headers=ttv_api.HEADER)
+
+
+def shared_pool(url: str):
+    return ttv_api.http.request("GET", url, headers=ttv_api.HEADER)
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    p50 = values[len(values) // 2]
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return f"p50 {p50 * 1e3:6.2f} ms, p99 {p99 * 1e3:6.2f} ms"
+
+
+def bench(function, url: str, requests: int, threads: int) -> tuple[list[float], float]:
+    def timed(_):
+        start = time.perf_counter()
+        assert function(url).status == 200
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = list(executor.map(timed, range(requests)))
+    return latencies, requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="ttv_api request latency against a local fake Helix"
+    )
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument(
+        "--handshake",
+        type=float,
+        default=0.0,
+        help="Milliseconds added to the first response of each connection, "
+        "e.g. 30 for a TLS handshake to twitch",
+    )
+    args = parser.parse_args()
+
+    with FakeHelix(handshake=args.handshake / 1000) as helix:
+        helix.add_user("141981764", "twitchdev")
+        ttv_api.BASE_URL = helix.url
+        url = helix.url + "users?id=141981764"
+        for threads in (1, 8):
+            for name, function in (
+                ("new pool per call", new_pool_per_call),
+                ("shared pool", shared_pool),
+            ):
+                connections = helix.connections
+                latencies, rate = bench(function, url, args.requests, threads)
+                print(
+                    f"{name:<18} {threads} thread{'s' if threads > 1 else ' '}: "
+                    f"{percentiles(latencies)}, {rate:7,.0f} requests/s, "
+                    f"{helix.connections - connections} connections"
+                )
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            ttv_api.cache.clear()
+            ttv_api.users.get_users(["141981764"])
+        elapsed = (time.perf_counter() - start) / args.requests
+        # Each one waits for the batch window
+        print(f"get_users one at a time: {elapsed * 1e3:6.2f} ms per call")
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            ttv_api.users.get_users(["141981764"])
+        elapsed = (time.perf_counter() - start) / args.requests
+        print(f"get_users cached:        {elapsed * 1e6:6.2f} us per call")
+
+        # One lookup from each of many handler threads at once
+        for i in range(LOOKUPS):
+            helix.add_user(str(i))
+        sent = len(helix.requests_to("users"))
+
+        def lookup(i: int) -> float:
+            start = time.perf_counter()
+            assert ttv_api.users.get_users([str(i)])[0].user_id == str(i)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(LOOKUPS) as executor:
+            latencies = list(executor.map(lookup, range(LOOKUPS)))
+        print(
+            f"{LOOKUPS} concurrent get_users: {percentiles(latencies)}, "
+            f"{len(helix.requests_to('users')) - sent} requests"
+        )
+
+
+if __name__ == "__main__":
+    main()
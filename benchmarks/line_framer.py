@@ -0,0 +1,54 @@
+import random
+import sys
+import time
+
+from aptbot.bot import RECV_SIZE, LineFramer
+
+PRIVMSG = (
+    "@badge-info=subscriber/8;badges=subscriber/6,premium/1;client-nonce=2b61d3ed;"
+    "color=#1E90FF;display-name=User{i};emotes=;first-msg=0;flags=;"
+    "id=0c1ff4b4-2b6f-4bd2-a8f0-{i:012d};mod=0;returning-chatter=0;"
+    "room-id=141981764;subscriber=1;tmi-sent-ts=1660000000000;turbo=0;"
+    "user-id={i};user-type= :user{i}!user{i}@user{i}.tmi.twitch.tv "
+    "PRIVMSG #twitchdev :message number {i} with some ünicode ✓ in it"
+)
+
+
+def synthetic_stream(lines: int) -> bytes:
+    return "".join(PRIVMSG.format(i=i) + "\r\n" for i in range(lines)).encode()
+
+
+def chunks(stream: bytes, max_size: int):
+    rng = random.Random(0)
+    i = 0
+    while i < len(stream):
+        size = rng.randint(1, max_size)
+        yield stream[i : i + size]
+        i += size
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            stream = f.read()
+    else:
+        stream = synthetic_stream(200_000)
+    expected = stream.count(b"\r\n")
+
+    for max_size in (2048, RECV_SIZE):
+        data = list(chunks(stream, max_size))
+        framer = LineFramer()
+        start = time.perf_counter()
+        lines = 0
+        for chunk in data:
+            lines += len(framer.feed(chunk))
+        elapsed = time.perf_counter() - start
+        assert lines == expected, (lines, expected)
+        print(
+            f"recv<={max_size:>6}: {lines} lines in {elapsed:.3f}s "
+            f"({lines / elapsed:,.0f} lines/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
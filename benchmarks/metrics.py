@@ -0,0 +1,99 @@
+import logging
+import statistics
+import time
+
+from aptbot import metrics
+from aptbot.bot import (
+    _LINES_RECEIVED,
+    _MESSAGES_QUEUED,
+    _PARSE_SECONDS,
+    _PARSED,
+    Bot,
+)
+from aptbot.main import _MESSAGES, _SUBMITTED, run_handler
+from aptbot.outbound import _PRIORITY_NAMES, _SEND_WAIT_SECONDS, Priority
+from benchmarks.parse_message import SAMPLE_LINES
+
+RATE = 5000
+
+
+def handler(bot, message):
+    pass
+
+
+# What the bot does for one received message handled by one handler,
+# without any of its metrics
+def uninstrumented(line: str):
+    message = Bot._parse_message(line)
+    handler(None, message)
+
+
+# The same with everything the bot records for it
+def instrumented(line: str):
+    _LINES_RECEIVED.inc(amount=1)
+    if next(_PARSED) & 15:
+        message = Bot._parse_message(line)
+    else:
+        start = time.perf_counter()
+        message = Bot._parse_message(line)
+        _PARSE_SECONDS.observe(time.perf_counter() - start)
+    _MESSAGES.inc("bar")
+    submitted = 0.0 if next(_SUBMITTED) & 15 else time.perf_counter()
+    run_handler("bar", submitted, handler, None, message)
+
+
+def unsent(line: str):
+    pass
+
+
+# What the bot records for one line it sends
+def sent(line: str):
+    _MESSAGES_QUEUED.inc("bar")
+    _SEND_WAIT_SECONDS.observe(0.001, _PRIORITY_NAMES[Priority.MESSAGE])
+
+
+def bench(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        function(SAMPLE_LINES[i % len(SAMPLE_LINES)])
+    return (time.perf_counter() - start) / repeat
+
+
+# The machine this runs on is rarely quiet, so both are timed back to back
+# many times and the median of the differences is kept.
+def overhead(plain, measured, repeat: int, runs: int = 31) -> tuple[float, float]:
+    plain_times = []
+    differences = []
+    for _ in range(runs):
+        plain_time = bench(plain, repeat)
+        plain_times.append(plain_time)
+        differences.append(bench(measured, repeat) - plain_time)
+    return statistics.median(plain_times), statistics.median(differences)
+
+
+def main():
+    # The per message log line isn't what is measured here
+    logging.disable(logging.INFO)
+    repeat = 20_000
+    baseline, received = overhead(uninstrumented, instrumented, repeat)
+    _, sending = overhead(unsent, sent, repeat)
+    print(f"receive and parse:       {baseline * 1e6:6.2f} us/message")
+    print(
+        f"metrics per message:     {received * 1e6:6.2f} us, "
+        f"{received * RATE * 100:.2f}% of a core at {RATE} messages/s"
+    )
+    print(
+        f"metrics per sent line:   {sending * 1e6:6.2f} us, "
+        f"{sending * RATE * 100:.2f}% of a core at {RATE} lines/s"
+    )
+
+    start = time.perf_counter()
+    text = metrics.REGISTRY.render()
+    print(
+        f"render:                  {(time.perf_counter() - start) * 1e3:6.2f} ms "
+        f"for {len(text.splitlines())} lines"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aptbot.bot import Bot, Commands, Message, _unescape_tag_value
+
+SAMPLE_LINES = [
+    "@badge-info=subscriber/8;badges=subscriber/6,premium/1;client-nonce=2b61d3ed;"
+    "color=#1E90FF;display-name=Ronni;emotes=;first-msg=0;flags=;"
+    "id=0c1ff4b4-2b6f-4bd2-a8f0-53c5ab0e3b8b;mod=0;returning-chatter=0;"
+    "room-id=141981764;subscriber=1;tmi-sent-ts=1660000000000;turbo=0;"
+    "user-id=1337;user-type= :ronni!ronni@ronni.tmi.twitch.tv "
+    "PRIVMSG #twitchdev :Kappa Keepo Kappa",
+    "@badge-info=;badges=;color=;display-name=foo;emotes=;id=1;mod=0;"
+    "reply-parent-display-name=bar;reply-parent-msg-body=hello\\sthere\\:\\\;"
+    "reply-parent-msg-id=2;reply-parent-user-id=3;reply-parent-user-login=bar;"
+    "room-id=4;subscriber=0;tmi-sent-ts=5;turbo=0;user-id=6;user-type= "
+    ":foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :@bar   hi  there ",
+    "@ban-duration=350;room-id=12345678;target-user-id=87654321;"
+    "tmi-sent-ts=1642715756806 :tmi.twitch.tv CLEARCHAT #dallas :ronni",
+    "@login=foo;room-id=;target-msg-id=94e6c7ff;tmi-sent-ts=1642720582342 "
+    ":tmi.twitch.tv CLEARMSG #bar :what a great day",
+    ":tmi.twitch.tv HOSTTARGET #abc :xyz 10",
+    "@msg-id=delete_message_success :tmi.twitch.tv NOTICE #bar "
+    ":The message from foo is now deleted.",
+    ":tmi.twitch.tv NOTICE * :Login authentication failed",
+    "@emote-only=0;followers-only=-1;r9k=0;room-id=12345678;slow=0;subs-only=0 "
+    ":tmi.twitch.tv ROOMSTATE #bar",
+    "@badge-info=;badges=staff/1,broadcaster/1,turbo/1;color=#008000;"
+    "display-name=ronni;emotes=;id=db25007f;login=ronni;mod=0;msg-id=resub;"
+    "msg-param-cumulative-months=6;msg-param-streak-months=2;"
+    "msg-param-should-share-streak=1;msg-param-sub-plan=Prime;"
+    "msg-param-sub-plan-name=Prime;room-id=12345678;subscriber=1;"
+    "system-msg=ronni\\shas\\ssubscribed\\sfor\\s6\\smonths!;"
+    "tmi-sent-ts=1507246572675;turbo=1;user-id=87654321;user-type=staff "
+    ":tmi.twitch.tv USERNOTICE #dallas :Great stream -- keep it up!",
+    "@badge-info=;badges=staff/1;color=#0D4200;display-name=ronni;"
+    "emote-sets=0,33,50,237,793,2126,3517,4578,5569,9400,10337,12239;mod=1;"
+    "subscriber=1;turbo=1;user-type=staff :tmi.twitch.tv USERSTATE #dallas",
+    ":ronni!ronni@ronni.tmi.twitch.tv JOIN #dallas",
+    ":ronni!ronni@ronni.tmi.twitch.tv PART #dallas",
+    ":tmi.twitch.tv PONG tmi.twitch.tv :tmi.twitch.tv",
+    ":tmi.twitch.tv 001 aptbot :Welcome, GLHF!",
+    ":tmi.twitch.tv CAP * ACK :twitch.tv/membership twitch.tv/tags",
+]
+
+
+@dataclass
+class LegacyMessage:
+    tags: dict[str, str] = field(default_factory=dict)
+    nick: str = ""
+    command: Optional[Commands] = None
+    channel: str = ""
+    value: str = ""
+
+
+def legacy_parse_message(received_msg: str) -> LegacyMessage:
+    split = re.search(
+        r"(?:@(.+)\s)?:(?:(?:(\w+)!\w+@\w+\.)?.+)\s(\w+)\s(?:\#(\w+)|\*)\s?:?(.+)?",
+        received_msg,
+    )
+
+    if not split:
+        return LegacyMessage()
+
+    tags = {}
+    if split[1]:
+        for tag in split[1].split(";"):
+            split_tag = tag.split("=")
+            tag_name = split_tag[0]
+            tag_value = "=".join(split_tag[1:])
+            if split_tag[0] == "reply-parent-msg-body":
+                tag_value = Bot._replace_escaped_characters_in_tags(tag_value)
+            tags[tag_name] = " ".join(tag_value.split())
+
+    nick = split[2] if split[2] else ""
+    try:
+        command = Commands[split[3]]
+    except KeyError:
+        return LegacyMessage()
+    channel = split[4] if split[4] else ""
+    try:
+        value = " ".join(split[5].split())
+    except AttributeError:
+        value = ""
+
+    return LegacyMessage(
+        tags=tags,
+        nick=nick,
+        command=command,
+        channel=channel,
+        value=value,
+    )
+
+
+# The lines the request is about, everything else in chat is much rarer
+TAGGED_LINES = [
+    line for line in SAMPLE_LINES if " PRIVMSG " in line or " USERNOTICE " in line
+]
+
+
+# Seconds per line, the best of several runs to leave out other processes
+def bench(parse, lines, repeat: int, runs: int = 15) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for line in lines:
+                parse(line)
+        best = min(best, time.perf_counter() - start)
+    return best / (repeat * len(lines))
+
+
+def same(legacy: LegacyMessage, message: Message) -> bool:
+    # The legacy parser only unescaped reply-parent-msg-body,
+    # every other tag is unescaped now
+    tags = {
+        key: value if key == "reply-parent-msg-body" else _unescape_tag_value(value)
+        for key, value in legacy.tags.items()
+    }
+    return Message(tags, legacy.nick, legacy.command, legacy.channel, legacy.value) == (
+        message
+    )
+
+
+def retained_bytes(parse, lines, repeat: int) -> float:
+    tracemalloc.start()
+    messages = [parse(line) for _ in range(repeat) for line in lines]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size / len(messages)
+
+
+def main():
+    mismatches = [
+        line
+        for line in SAMPLE_LINES
+        if not same(legacy_parse_message(line), Bot._parse_message(line))
+        # The legacy regex cannot parse a PONG and returns an empty Message for it
+        and legacy_parse_message(line).command is not None
+    ]
+    for line in mismatches:
+        print(f"parsed differently: {line}")
+
+    repeat = 1_000
+    for name, lines in (
+        ("all lines", SAMPLE_LINES),
+        ("PRIVMSG, USERNOTICE", TAGGED_LINES),
+    ):
+        legacy = bench(legacy_parse_message, lines, repeat)
+        current = bench(Bot._parse_message, lines, repeat)
+        with_tags = bench(lambda line: Bot._parse_message(line).tags, lines, repeat)
+        print(f"{name}:")
+        print(f"  legacy:  {1 / legacy:>12,.0f} lines/s ({legacy * 1e6:.2f} us/line)")
+        print(f"  current: {1 / current:>12,.0f} lines/s ({current * 1e6:.2f} us/line)")
+        print(f"  speedup: {legacy / current:.1f}x")
+        print(f"  speedup reading tags: {legacy / with_tags:.1f}x")
+
+    legacy_bytes = retained_bytes(legacy_parse_message, SAMPLE_LINES, 500)
+    current_bytes = retained_bytes(Bot._parse_message, SAMPLE_LINES, 500)
+    print(f"retained per message: legacy {legacy_bytes:.0f} B")
+    print(f"retained per message: current {current_bytes:.0f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import time
+
+from aptbot.bot import _unescape_tag_value
+
+SYSTEM_MSG = (
+    "An\\sanonymous\\suser\\sgifted\\sa\\sTier\\s1\\ssub\\sto\\sTenureCalculator!\\s"
+    "They\\shave\\sgiven\\s5\\sGift\\sSubs\\sin\\sthe\\schannel!\\:\\s\\\\o/"
+)
+
+
+def legacy_unescape(tag_value: str) -> str:
+    new_tag_value = ""
+    ignore_next = False
+    for i in range(len(tag_value)):
+        if ignore_next:
+            ignore_next = False
+            continue
+        if tag_value[i] != "\\":
+            new_tag_value += tag_value[i]
+            ignore_next = False
+            continue
+        if i + 1 == len(tag_value):
+            new_tag_value += tag_value[i]
+            break
+        if tag_value[i + 1] == "\\":
+            new_tag_value += "\\"
+        elif tag_value[i + 1] == "s":
+            new_tag_value += " "
+        elif tag_value[i + 1] == ":":
+            new_tag_value += ";"
+        ignore_next = True
+    return new_tag_value
+
+
+def bench(unescape, value: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        unescape(value)
+    return time.perf_counter() - start
+
+
+def main():
+    for copies in (1, 10, 100):
+        value = SYSTEM_MSG * copies
+        assert legacy_unescape(value) == _unescape_tag_value(value)
+        repeat = 20_000 // copies
+        legacy = bench(legacy_unescape, value, repeat)
+        current = bench(_unescape_tag_value, value, repeat)
+        print(
+            f"{len(value):>6} chars: legacy {legacy / repeat * 1e6:>9.2f} us, "
+            f"current {current / repeat * 1e6:>6.2f} us ({legacy / current:.0f}x)"
+        )
+
+    plain = "0c1ff4b4-2b6f-4bd2-a8f0-53c5ab0e3b8b"
+    repeat = 1_000_000
+    elapsed = bench(_unescape_tag_value, plain, repeat)
+    print(f"no backslash: {elapsed / repeat * 1e9:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+import asyncio
+import pickle
+import socket
+import threading
+import time
+
+import pytest
+
+import aptbot.bot
+from aptbot.bot import (
+    AsyncBot,
+    Bot,
+    Commands,
+    LineFramer,
+    Message,
+    _unescape_tag_value,
+    split_message,
+)
+
+
+def test_line_framer_keeps_partial_lines():
+    framer = LineFramer()
+    assert framer.feed(b"PING :tmi.twi") == []
+    assert framer.feed(b"tch.tv\r\n:tmi.twitch.tv RECON") == ["PING :tmi.twitch.tv"]
+    assert framer.pending == len(b":tmi.twitch.tv RECON")
+    assert framer.feed(b"NECT\r\n") == [":tmi.twitch.tv RECONNECT"]
+    assert framer.pending == 0
+
+
+def test_line_framer_split_multibyte_character():
+    data = "PRIVMSG #chan :καλημέρα\r\n".encode()
+    framer = LineFramer()
+    lines = []
+    for i in range(len(data)):
+        lines.extend(framer.feed(data[i : i + 1]))
+    assert lines == ["PRIVMSG #chan :καλημέρα"]
+
+
+def test_line_framer_split_line_ending():
+    framer = LineFramer()
+    assert framer.feed(b"a\r") == []
+    assert framer.feed(b"\nb\r\n\r\n") == ["a", "b"]
+
+
+def test_line_framer_discards_oversized_garbage():
+    framer = LineFramer(max_line_length=8)
+    assert framer.feed(b"0123456789") == []
+    assert framer.pending == 0
+    assert framer.feed(b"ok\r\n") == ["ok"]
+
+
+def test_parse_privmsg():
+    message = Bot._parse_message(
+        "@badges=;display-name=Foo;id=abc;reply-parent-msg-body=hi\\sthere "
+        ":foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :!hello   world "
+    )
+    assert message == Message(
+        tags={
+            "badges": "",
+            "display-name": "Foo",
+            "id": "abc",
+            "reply-parent-msg-body": "hi there",
+        },
+        nick="foo",
+        command=Commands.PRIVMSG,
+        channel="bar",
+        value="!hello world",
+    )
+
+
+def test_parse_without_tags_or_value():
+    assert Bot._parse_message(":foo!foo@foo.tmi.twitch.tv JOIN #bar") == Message(
+        nick="foo", command=Commands.JOIN, channel="bar"
+    )
+    assert Bot._parse_message(
+        ":tmi.twitch.tv NOTICE * :Login authentication failed"
+    ) == Message(command=Commands.NOTICE, value="Login authentication failed")
+    assert Bot._parse_message("@a=1 :tmi.twitch.tv GLOBALUSERSTATE") == Message(
+        tags={"a": "1"}, command=Commands.GLOBALUSERSTATE
+    )
+
+
+def test_parse_value_whitespace():
+    def value(text: str) -> str:
+        return Bot._parse_message(
+            f":foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :{text}"
+        ).value
+
+    assert value("hi there") == "hi there"
+    assert value(" hi  there ") == "hi there"
+    assert value("hi\tthere") == "hi there"
+    assert value("hi\u3000there") == "hi there"
+    assert value("hé ありがとう") == "hé ありがとう"
+
+
+def test_parse_unknown_command():
+    assert Bot._parse_message(":tmi.twitch.tv 001 aptbot :Welcome, GLHF!") == Message()
+    assert Bot._parse_message(":tmi.twitch.tv") == Message()
+    assert Bot._parse_message("@a=1") == Message()
+
+
+def test_message_tags_decoded_lazily():
+    message = Bot._parse_message(
+        "@id=1;display-name=Foo :foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :hi"
+    )
+    assert message.raw_tags == "id=1;display-name=Foo"
+    assert message._tags is None
+    assert message.tags is message.tags
+    assert message.tags == {"id": "1", "display-name": "Foo"}
+    assert (
+        message.channel is Bot._parse_message(":tmi.twitch.tv ROOMSTATE #bar").channel
+    )
+
+
+def test_message_pickles_raw_tags():
+    message = Bot._parse_message(
+        "@id=1;display-name=Foo :foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :hi"
+    )
+    copy = pickle.loads(pickle.dumps(message))
+    assert copy._tags is None
+    assert copy == message
+    message = Message(tags={"id": "1"}, command=Commands.JOIN)
+    assert pickle.loads(pickle.dumps(message)) == message
+
+
+def test_unescape_tag_value():
+    assert _unescape_tag_value("plain") == "plain"
+    assert _unescape_tag_value(r"a\sb\:c\\d\re\nf") == "a b;c\\d\re\nf"
+    assert _unescape_tag_value(r"\\s") == "\\s"
+    assert _unescape_tag_value(r"\\\s") == "\\ "
+    assert _unescape_tag_value(r"unknown\b") == "unknownb"
+    assert _unescape_tag_value("trailing\\") == "trailing"
+
+
+def test_all_tags_unescaped():
+    message = Bot._parse_message(
+        r"@system-msg=5\sraiders\sfrom\sfoo;msg-id=raid :tmi.twitch.tv USERNOTICE #bar"
+    )
+    assert message.tags["system-msg"] == "5 raiders from foo"
+
+
+def test_async_bot():
+    async def run():
+        received = []
+
+        async def handle(reader, writer):
+            received.append(await reader.readuntil(b"commands\r\n"))
+            writer.write(b":tmi.twitch.tv 001 aptbot :Welcome, GLHF!\r\n")
+            writer.write(b"PING :tmi.")
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.write(b"twitch.tv\r\n")
+            received.append(await reader.readuntil(b"PONG :tmi.twitch.tv\r\n"))
+            writer.write(b":foo!foo@foo.tmi.twitch.tv PRIVMSG #bar :hi\r\n")
+            received.append(await reader.readuntil(b"\r\n"))
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        bot = AsyncBot("aptbot", "token", server="127.0.0.1", port=port)
+        try:
+            assert await bot.connect()
+            messages = []
+            while len(messages) < 3:
+                messages.extend(await bot.get_messages())
+            commands = [m.command for m in messages[1:]]
+            assert commands == [Commands.PING, Commands.PRIVMSG]
+            bot.send_message("bar", "hello", reply="1")
+            while len(received) < 3:
+                await asyncio.sleep(0.01)
+            assert received[2] == b"@reply-parent-msg-id=1 PRIVMSG #bar :hello\r\n"
+        finally:
+            stop(bot)
+            server.close()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_async_bot_reconnects_after_the_server_goes_away(monkeypatch):
+    monkeypatch.setattr(aptbot.bot, "BACKOFF_BASE", 0.01)
+
+    async def run():
+        received = []
+
+        async def welcome(reader, writer):
+            writer.write(b":tmi.twitch.tv 001 aptbot :Welcome, GLHF!\r\n")
+            await writer.drain()
+            received.append(await reader.readuntil(b"JOIN #bar\r\n"))
+            writer.close()
+
+        async def goodbye(reader, writer):
+            await welcome(reader, writer)
+            server.close()
+
+        server = await asyncio.start_server(goodbye, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        bot = AsyncBot("aptbot", "token", server="127.0.0.1", port=port)
+        try:
+            assert await bot.connect()
+            bot.join_channel("bar")
+            messages = bot.get_messages()
+            # Nothing listens on the port for a while
+            await asyncio.sleep(0.2)
+            server = await asyncio.start_server(welcome, "127.0.0.1", port)
+            # The welcome messages of both connections
+            assert await messages == [Message(), Message()]
+            assert bot.reconnects == 1 and len(bot.reconnect_latencies) == 1
+            while len(received) < 2:
+                await asyncio.sleep(0.01)
+        finally:
+            stop(bot)
+            server.close()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+
+
+def test_async_bot_joins_are_paced():
+    bot = AsyncBot("aptbot", "token")
+    bot.join_channels(["a", "b"])
+    bot.leave_channel("a")
+    assert bot.outbound.pending_joins == 2
+    assert bot.outbound.depth == 3
+    (part,) = bot.outbound._heap
+    assert part[3] == "a" and part[5] == b"PART #a\r\n"
+
+
+# Closes the bot's connections and stops its writer thread
+def stop(bot):
+    bot.disconnect()
+    bot.outbound.stop()
+
+
+class Server:
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+        self.received: list[bytes] = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except OSError:
+                return
+            self.received.append(b"")
+            threading.Thread(
+                target=self._serve, args=(conn, len(self.received) - 1), daemon=True
+            ).start()
+
+    def _serve(self, conn: socket.socket, index: int):
+        with conn:
+            conn.sendall(b":tmi.twitch.tv 001 aptbot :Welcome, GLHF!\r\n")
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                self.received[index] += data
+
+    def wait_for(self, index: int, data: bytes):
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline:
+            if len(self.received) > index and data in self.received[index]:
+                return
+            time.sleep(0.01)
+
+    def close(self):
+        self.socket.close()
+
+
+def test_bot_shards_channels():
+    server = Server()
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port, connections=2)
+    try:
+        assert bot.connect()
+        bot.join_channels(["a", "b", "c", "d"])
+        assert bot.shards == {"a": 0, "b": 1, "c": 0, "d": 1}
+        bot.send_message("b", "hi")
+        server.wait_for(1, b"PRIVMSG")
+    finally:
+        stop(bot)
+        server.close()
+    assert b"JOIN #a\r\nJOIN #c\r\n" in server.received[0]
+    assert b"JOIN #b\r\nJOIN #d\r\nPRIVMSG #b :hi\r\n" in server.received[1]
+
+
+def test_bot_reconnects_after_pong_timeout(monkeypatch):
+    monkeypatch.setattr(aptbot.bot, "BACKOFF_BASE", 0.01)
+    # The server never answers PINGs
+    server = Server()
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+    bot.ping_interval = 0.05
+    bot.pong_timeout = 0.05
+    try:
+        assert bot.connect()
+        bot.join_channel("a")
+        # The welcome message of the first connection
+        assert bot.get_messages() == [Message()]
+        assert bot.get_messages() == [Message()]
+        assert len(server.received) == 2
+        assert b"PING :tmi.twitch.tv\r\n" in server.received[0]
+        assert bot.reconnects == 1 and len(bot.reconnect_latencies) == 1
+        bot.send_message("a", "hi")
+        server.wait_for(1, b"PRIVMSG")
+    finally:
+        stop(bot)
+        server.close()
+    assert b"JOIN #a\r\nPRIVMSG #a :hi\r\n" in server.received[1]
+
+
+def test_lines_without_a_shard_are_sent_after_a_failed_write(monkeypatch):
+    monkeypatch.setattr(aptbot.bot, "BACKOFF_BASE", 0.01)
+    server = Server()
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+    # Failed writes are noticed when get_messages wakes up
+    bot.ping_interval = 0.05
+    try:
+        assert bot.connect()
+        assert bot.get_messages() == [Message()]
+        connection = bot._connections[0]
+
+        def fail(data: bytes):
+            del connection.sendall
+            raise OSError("broken pipe")
+
+        connection.sendall = fail
+        bot.leave_channel("unknown")
+        bot.send_message("unknown", "hi")
+        assert bot.get_messages() == [Message()]
+        server.wait_for(1, b"PRIVMSG")
+    finally:
+        stop(bot)
+        server.close()
+    assert b"PART #unknown\r\nPRIVMSG #unknown :hi\r\n" in server.received[1]
+    assert bot.outbound.depth == 0
+
+
+def test_split_message():
+    assert split_message("hi  there") == ["hi  there"]
+    assert split_message("a\r\nb") == ["a b"]
+    assert split_message("aa bb cc dd", limit=5) == ["aa bb", "cc dd"]
+    assert split_message("a bbbbbbbbbbbb c", limit=5) == ["a", "bbbbb", "bbbbb", "bb c"]
+    text = " ".join(str(i) for i in range(1000))
+    parts = split_message(text)
+    assert max(map(len, parts)) <= 500
+    assert " ".join(parts) == text
+
+
+def test_bot_send_messages():
+    server = Server()
+    bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port, connections=2)
+    try:
+        assert bot.connect()
+        bot.join_channels(["a", "b"])
+        bot.outbound.set_moderator("a", True)
+        bot.outbound.set_moderator("b", True)
+        deadline = time.monotonic() + 2
+        while bot.outbound.depth and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        writes = bot.outbound.writes
+        bot.send_messages(
+            [
+                ("a", "x " * 300, "1"),
+                ("b", ["hi", "there"], None),
+            ]
+        )
+        server.wait_for(1, b"there")
+    finally:
+        stop(bot)
+        server.close()
+    first, second = (
+        "@reply-parent-msg-id=1 PRIVMSG #a :" + "x " * n for n in (250, 50)
+    )
+    assert f"{first.rstrip()}\r\n{second.rstrip()}\r\n".encode() in server.received[0]
+    assert b"PRIVMSG #b :hi\r\nPRIVMSG #b :there\r\n" in server.received[1]
+    # One write for each connection
+    assert bot.outbound.writes - writes == 2
+
+
+if __name__ == "__main__":
+    test_line_framer_keeps_partial_lines()
+    test_line_framer_split_multibyte_character()
+    test_line_framer_split_line_ending()
+    test_line_framer_discards_oversized_garbage()
+    test_parse_privmsg()
+    test_parse_without_tags_or_value()
+    test_parse_value_whitespace()
+    test_parse_unknown_command()
+    test_message_tags_decoded_lazily()
+    test_message_pickles_raw_tags()
+    test_unescape_tag_value()
+    test_all_tags_unescaped()
+    test_async_bot()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_async_bot_reconnects_after_the_server_goes_away(monkeypatch)
+    test_async_bot_joins_are_paced()
+    test_bot_shards_channels()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_bot_reconnects_after_pong_timeout(monkeypatch)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_lines_without_a_shard_are_sent_after_a_failed_write(monkeypatch)
+    test_split_message()
+    test_bot_send_messages()
+    print("Everything passed")
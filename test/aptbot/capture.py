@@ -0,0 +1,148 @@
+import gzip
+import os
+import tempfile
+import time
+from threading import Event, Thread
+from types import SimpleNamespace
+
+from aptbot.bot import Bot, Commands
+from aptbot.capture import Recorder, ReplayBot, read_capture, segments
+from aptbot.dispatch import Dispatcher
+from aptbot.fake_twitch import FakeTwitch, privmsg
+from aptbot.main import Channel, ChannelTable, handle_message
+
+
+def test_recorder_segments():
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = Recorder(directory, segment_bytes=1000, keep=3)
+        for i in range(100):
+            recorder.record([f"line {i}", f"line {i} again"], now=i / 10)
+        recorder.close()
+        assert recorder.lines == 200
+        assert len(segments(directory)) == 3
+        records = list(read_capture(directory))
+        assert records[-1] == (9.9, "line 99 again")
+        assert [line for _, line in records] == [
+            f"line {i}{again}"
+            for i in range(100 - len(records) // 2, 100)
+            for again in ("", " again")
+        ]
+
+
+def test_recorder_keeps_the_current_segment():
+    with tempfile.TemporaryDirectory() as directory:
+        for keep in (0, -1):
+            try:
+                Recorder(directory, keep=keep)
+            except ValueError:
+                pass
+            else:
+                assert False
+        recorder = Recorder(directory, segment_bytes=100, keep=1)
+        for i in range(20):
+            recorder.record([f"line {i}"], now=i / 10)
+        recorder.close()
+        assert len(segments(directory)) == 1
+        assert list(read_capture(directory))[-1] == (1.9, "line 19")
+
+
+def test_incomplete_segment():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "capture.irc.gz")
+        data = gzip.compress(
+            "".join(f"{i} PING :tmi.twitch.tv\n" for i in range(10000)).encode()
+        )
+        with open(path, "wb") as f:
+            f.write(data[: len(data) // 2])
+        records = list(read_capture(path))
+        assert 0 < len(records) < 10000
+        assert records[:2] == [
+            (0.0, "PING :tmi.twitch.tv"),
+            (0.000001, "PING :tmi.twitch.tv"),
+        ]
+
+
+def test_bot_records_what_it_receives():
+    with tempfile.TemporaryDirectory() as directory, FakeTwitch() as server:
+        bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+        bot.recorder = Recorder(directory)
+        assert bot.connect()
+        bot.join_channel("foo")
+        assert server.wait_for_joins(["foo"])
+        server.play(privmsg("foo", f"hello {i}") for i in range(50))
+        values = []
+        while len(values) < 50:
+            values.extend(
+                m.value for m in bot.get_messages() if m.command == Commands.PRIVMSG
+            )
+        bot.disconnect()
+        bot.recorder.close()
+        lines = [line for _, line in read_capture(directory)]
+        assert lines[0] == ":tmi.twitch.tv 001 aptbot :Welcome, GLHF!"
+        assert [line.rpartition(" :")[2] for line in lines[-50:]] == values
+
+
+def write_capture(directory: str, records: list[tuple[float, list[str]]]):
+    recorder = Recorder(directory)
+    for now, lines in records:
+        recorder.record(lines, now)
+    recorder.close()
+
+
+def test_replay():
+    with tempfile.TemporaryDirectory() as directory:
+        write_capture(
+            directory,
+            [
+                (
+                    100.0,
+                    [privmsg("foo", "!ping", tags={"id": "1"}), "PING :tmi.twitch.tv"],
+                ),
+                (100.1, [privmsg("bar", "!ping", tags={"id": "2"})]),
+                # A restart of the bot, the clock went back
+                (5.0, [privmsg("foo", "!ping", tags={"id": "3"})]),
+                (5.2, [privmsg("foo", "hello")]),
+            ],
+        )
+        bot = ReplayBot(directory)
+        first = bot.get_messages()
+        assert [m.command for m in first] == [Commands.PRIVMSG, Commands.PING]
+        assert [m.tags["id"] for m in bot.get_messages()] == ["2"]
+
+        def main(bot, message):
+            if message.value == "!ping":
+                bot.send_message(message.channel, "pong", reply=message.tags["id"])
+
+        bot = ReplayBot(directory, speed=2.0)
+        module = SimpleNamespace(main=main)
+        channels = ChannelTable()
+        channels.replace(
+            {name: Channel(name, module, Thread(), Event()) for name in ("foo", "bar")}
+        )
+        dispatcher = Dispatcher(2, 100)
+        dispatcher.start()
+        start = time.perf_counter()
+        Thread(
+            target=handle_message, args=(bot, channels, dispatcher), daemon=True
+        ).start()
+        assert bot.finished.wait(5)
+        # 0.1s and 0.2s of the capture at twice the speed
+        assert time.perf_counter() - start >= 0.15
+        while dispatcher.backlog or dispatcher.active:
+            time.sleep(0.001)
+        dispatcher.stop()
+        assert bot.lines == 5
+        assert sorted(bot.sent) == [
+            ("bar", "pong", "2"),
+            ("foo", "pong", "1"),
+            ("foo", "pong", "3"),
+        ]
+
+
+if __name__ == "__main__":
+    test_recorder_segments()
+    test_recorder_keeps_the_current_segment()
+    test_incomplete_segment()
+    test_bot_records_what_it_receives()
+    test_replay()
+    print("Everything passed")
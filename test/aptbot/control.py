@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from aptbot.control import ControlClient, ControlServer
+
+
+def start_server(handlers: dict, address) -> ControlServer:
+    server = ControlServer(handlers, address)
+    server.bind()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_pipelined_requests_are_acknowledged_in_order():
+    received = []
+
+    def send(request):
+        if not request.get("channel"):
+            raise ValueError("A channel is required")
+        received.append((request["channel"], request["message"]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "aptbot.sock")
+        server = start_server({"SEND": send}, path)
+        with ControlClient(path) as client:
+            responses = client.pipeline(
+                [("SEND", {"channel": "foo", "message": str(i)}) for i in range(2500)]
+                + [("SEND", {"message": "no channel"}), ("FOO", {})]
+            )
+            assert [r["ok"] for r in responses[:2500]] == [True] * 2500
+            assert [r["id"] for r in responses] == list(range(1, 2503))
+            assert responses[2500]["error"] == "A channel is required"
+            assert responses[2501]["error"] == "Unknown command: FOO"
+            assert client.request("SEND", channel="bar", message="hi")["ok"]
+        assert received[:3] == [("foo", "0"), ("foo", "1"), ("foo", "2")]
+        assert received[-1] == ("bar", "hi")
+        assert server.handled == 2502
+
+        # Malformed lines get an error and don't close the connection
+        with ControlClient(path) as client:
+            client._socket.sendall(b"not json\n[1]\n")
+            assert client._read_response()["error"].startswith("Invalid JSON")
+            assert client._read_response()["error"] == "A request must be a JSON object"
+            assert client.request("SEND", channel="foo", message="ok")["ok"]
+
+        server.stop()
+        assert not os.path.exists(path)
+
+
+def test_clients_are_served_concurrently():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "aptbot.sock")
+        server = start_server({"PING": lambda request: "pong"}, path)
+        # A client that never sends anything doesn't hold up the others
+        idle = ControlClient(path)
+        with ControlClient(path) as client:
+            assert client.request("PING") == {"id": 1, "ok": True, "result": "pong"}
+        idle.close()
+        server.stop()
+
+
+def test_stale_socket_is_replaced():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "aptbot.sock")
+        open(path, "w").close()
+        server = start_server({"PING": lambda request: None}, path)
+        with ControlClient(path) as client:
+            assert client.request("PING")["ok"]
+        try:
+            ControlServer({}, path).bind()
+        except OSError:
+            pass
+        else:
+            assert False
+        server.stop()
+
+
+def test_tcp_fallback():
+    server = start_server({"PING": lambda request: None}, ("127.0.0.1", 0))
+    with ControlClient(server.address) as client:
+        assert client.request("PING")["ok"]
+    server.stop()
+
+
+def test_socket_is_in_the_cache_directory():
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env.pop("XDG_RUNTIME_DIR", None)
+        env["XDG_CONFIG_HOME"] = os.path.join(directory, "config")
+        env["XDG_CACHE_HOME"] = os.path.join(directory, "cache")
+        path = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import aptbot.constants as c; print(c.CONTROL_SOCKET)",
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        assert path == os.path.join(directory, "cache", "aptbot", "aptbot.sock")
+
+
+if __name__ == "__main__":
+    test_pipelined_requests_are_acknowledged_in_order()
+    test_clients_are_served_concurrently()
+    test_stale_socket_is_replaced()
+    test_tcp_fallback()
+    test_socket_is_in_the_cache_directory()
+    print("Everything passed")
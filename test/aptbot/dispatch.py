@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+from aptbot.dispatch import AsyncDispatcher, Dispatcher, ShedPolicy
+
+
+def wait_until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_dispatcher_runs_everything():
+    results = []
+    dispatcher = Dispatcher(workers=4, max_queued=100)
+    dispatcher.start()
+    for i in range(50):
+        dispatcher.submit(i % 5, results.append, i)
+    dispatcher.submit("error", lambda: 1 / 0)
+    wait_until(lambda: dispatcher.completed == 51)
+    dispatcher.stop()
+    assert sorted(results) == list(range(50))
+    assert dispatcher.failed == 1
+    assert dispatcher.backlog == 0
+
+
+def test_channels_are_processed_in_order():
+    results = {}
+    running = set()
+    overlaps = []
+
+    def handler(channel, i):
+        if channel in running:
+            overlaps.append(channel)
+        running.add(channel)
+        time.sleep(0.001)
+        results.setdefault(channel, []).append(i)
+        running.discard(channel)
+
+    dispatcher = Dispatcher(workers=4, max_queued=100)
+    dispatcher.start()
+    for i in range(40):
+        for channel in "abc":
+            dispatcher.submit(channel, handler, channel, i)
+    wait_until(lambda: dispatcher.completed == 120)
+    dispatcher.stop()
+    assert overlaps == []
+    assert results == {channel: list(range(40)) for channel in "abc"}
+
+
+def test_quiet_channels_are_not_starved():
+    order = []
+    release = threading.Event()
+    dispatcher = Dispatcher(workers=1, max_queued=100)
+    dispatcher.start()
+    dispatcher.submit("busy", release.wait)
+    wait_until(lambda: dispatcher.active == 1)
+    for i in range(50):
+        dispatcher.submit("busy", order.append, "busy")
+    dispatcher.submit("quiet", order.append, "quiet")
+    assert dispatcher.backlog_of("busy") == 50
+    release.set()
+    wait_until(lambda: dispatcher.completed == 52)
+    dispatcher.stop()
+    assert order.index("quiet") == 0
+
+
+def test_weights():
+    order = []
+    release = threading.Event()
+    dispatcher = Dispatcher(workers=1, max_queued=100)
+    dispatcher.set_weight("a", 3)
+    dispatcher.start()
+    dispatcher.submit("block", release.wait)
+    wait_until(lambda: dispatcher.active == 1)
+    for _ in range(6):
+        dispatcher.submit("a", order.append, "a")
+        dispatcher.submit("b", order.append, "b")
+    release.set()
+    wait_until(lambda: dispatcher.completed == 13)
+    dispatcher.stop()
+    assert "".join(order) == "aaabaaabbbbb"
+
+
+def shed(policy: ShedPolicy) -> tuple[Dispatcher, list]:
+    release = threading.Event()
+    results = []
+    dispatcher = Dispatcher(workers=1, max_queued=2, policy=policy)
+    dispatcher.start()
+    dispatcher.submit("a", release.wait)
+    wait_until(lambda: dispatcher.active == 1)
+    for i in range(4):
+        dispatcher.submit("a", results.append, i)
+    dispatcher.submit("b", results.append, "b")
+    assert dispatcher.backlog == 3
+    release.set()
+    wait_until(lambda: dispatcher.completed == 4)
+    dispatcher.stop()
+    return dispatcher, results
+
+
+def test_dispatcher_drop_oldest():
+    dispatcher, results = shed(ShedPolicy.DROP_OLDEST)
+    assert sorted(results, key=str) == [2, 3, "b"]
+    assert dispatcher.dropped == 2
+
+
+def test_dispatcher_drop_newest():
+    dispatcher, results = shed(ShedPolicy.DROP_NEWEST)
+    assert sorted(results, key=str) == [0, 1, "b"]
+    assert dispatcher.dropped == 2
+
+
+def test_channels_are_scheduled_once():
+    results = []
+    dispatcher = Dispatcher(1, 1, ShedPolicy.DROP_OLDEST)
+    for i in range(3):
+        dispatcher.submit("c", results.append, i)
+    assert list(dispatcher._ready) == ["c"]
+    dispatcher.start()
+    wait_until(lambda: dispatcher.completed == 1)
+    dispatcher.submit("c", results.append, 3)
+    wait_until(lambda: dispatcher.completed == 2)
+    dispatcher.stop()
+    assert results == [2, 3]
+    assert dispatcher.failed == 0 and dispatcher.dropped == 2
+
+
+def test_async_dispatcher():
+    results = []
+
+    async def record(channel, i):
+        # Later calls finish sooner, unless they wait their turn
+        await asyncio.sleep(0.001 * (5 - i))
+        if i == 3:
+            raise ValueError(i)
+        results.append((channel, i))
+
+    async def run():
+        dispatcher = AsyncDispatcher(3, ShedPolicy.DROP_OLDEST)
+        for i in range(5):
+            for channel in ("a", "b"):
+                await dispatcher.submit(channel, record, channel, i)
+        assert dispatcher.backlogs() == {"a": 3, "b": 3}
+        while dispatcher.completed + dispatcher.dropped < 10:
+            await asyncio.sleep(0.005)
+        dispatcher.stop()
+        return dispatcher
+
+    dispatcher = asyncio.run(asyncio.wait_for(run(), 5))
+    assert [i for channel, i in results if channel == "a"] == [2, 4]
+    assert [i for channel, i in results if channel == "b"] == [2, 4]
+    assert dispatcher.dropped == 4 and dispatcher.failed == 2
+
+
+if __name__ == "__main__":
+    test_dispatcher_runs_everything()
+    test_channels_are_processed_in_order()
+    test_quiet_channels_are_not_starved()
+    test_weights()
+    test_dispatcher_drop_oldest()
+    test_dispatcher_drop_newest()
+    test_channels_are_scheduled_once()
+    test_async_dispatcher()
+    print("Everything passed")
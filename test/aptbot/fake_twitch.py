@@ -0,0 +1,100 @@
+import time
+
+import aptbot.bot
+from aptbot.bot import Bot, Commands
+from aptbot.fake_twitch import FakeTwitch, privmsg
+
+
+def collect(bot: Bot, count: int, timeout: float = 5.0) -> list:
+    messages = []
+    deadline = time.monotonic() + timeout
+    while len(messages) < count and time.monotonic() < deadline:
+        messages.extend(m for m in bot.get_messages() if m.command == Commands.PRIVMSG)
+    return messages
+
+
+def test_chat_is_delivered_and_answered():
+    with FakeTwitch(moderator=True) as server:
+        replies = []
+        server.on_privmsg = lambda client, channel, text: replies.append(
+            (channel, text)
+        )
+        bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+        assert bot.connect()
+        assert any(line.startswith("CAP REQ") for line in server.received_lines())
+        bot.join_channels(["foo", "bar"])
+        assert server.wait_for_joins(["foo", "bar"])
+        server.play(
+            privmsg(channel, f"!hello {i}", tags={"id": str(i)})
+            for i in range(100)
+            for channel in ("foo", "bar", "other")
+        )
+        messages = collect(bot, 200)
+        assert len(messages) == 200
+        assert {m.channel for m in messages} == {"foo", "bar"}
+        assert messages[0].tags["id"] == "0"
+        assert bot.outbound.is_moderator("foo")
+
+        bot.send_message("foo", "hello", reply="0")
+        assert server.wait_for(lambda: replies)
+        assert replies == [("foo", "hello")]
+        assert "@reply-parent-msg-id=0 PRIVMSG #foo :hello" in server.received_lines()
+        bot.disconnect()
+
+
+def test_bot_answers_pings_and_reconnects():
+    backoff = aptbot.bot.BACKOFF_BASE
+    aptbot.bot.BACKOFF_BASE = 0.01
+    try:
+        with FakeTwitch() as server:
+            bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+            assert bot.connect()
+            bot.join_channel("foo")
+            assert server.wait_for_joins(["foo"])
+            server.ping()
+            while Commands.PING not in [m.command for m in bot.get_messages()]:
+                pass
+            assert server.wait_for(
+                lambda: "PONG :tmi.twitch.tv" in server.received_lines()
+            )
+
+            server.reconnect()
+            deadline = time.monotonic() + 5
+            while len(server.connected) < 1 or not server.connected[0].channels:
+                bot.get_messages()
+                assert time.monotonic() < deadline
+            assert len(server.clients) == 2
+            assert server.received_lines(1).count("JOIN #foo") == 1
+            server.play([privmsg("foo", "back")])
+            assert collect(bot, 1)[0].value == "back"
+            bot.disconnect()
+    finally:
+        aptbot.bot.BACKOFF_BASE = backoff
+
+
+def test_rejected_login():
+    with FakeTwitch(accept_login=False) as server:
+        bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+        assert not bot.connect()
+        bot.disconnect()
+
+
+def test_play_at_a_rate():
+    with FakeTwitch() as server:
+        bot = Bot("aptbot", "token", server="127.0.0.1", port=server.port)
+        assert bot.connect()
+        bot.join_channel("foo")
+        assert server.wait_for_joins(["foo"])
+        start = time.perf_counter()
+        assert server.play((privmsg("foo", str(i)) for i in range(50)), rate=500) == 50
+        assert time.perf_counter() - start >= 0.09
+        assert [m.value for m in collect(bot, 50)] == [str(i) for i in range(50)]
+        bot.disconnect()
+
+
+if __name__ == "__main__":
+    test_chat_is_delivered_and_answered()
+    test_bot_answers_pings_and_reconnects()
+    test_rejected_login()
+    test_play_at_a_rate()
+    print("Everything passed")
@@ -0,0 +1,85 @@
+import logging
+import os
+import tempfile
+import threading
+
+from aptbot import logs
+from aptbot.bot import Bot
+from aptbot.logs import ChannelRateLimit
+
+
+def test_channel_rate_limit():
+    limit = ChannelRateLimit(2.0)
+    assert [limit.allow("foo") for _ in range(3)] == [True, True, False]
+    assert limit.allow("bar")
+    assert not ChannelRateLimit(0.0).allow("foo")
+    limit = ChannelRateLimit(1000.0, burst=1.0)
+    assert limit.allow("foo")
+    threading.Event().wait(0.01)
+    assert limit.allow("foo")
+
+
+def config(directory: str) -> dict:
+    def file(name: str) -> dict:
+        return {
+            "class": "logging.FileHandler",
+            "formatter": "simple",
+            "filename": os.path.join(directory, name),
+        }
+
+    return {
+        "version": 1,
+        "formatters": {"simple": {"format": "%(message)s"}},
+        "handlers": {"file": file("aptbot.log"), "traffic": file("traffic.log")},
+        "loggers": {
+            "aptbot.traffic": {
+                "level": "INFO",
+                "handlers": ["traffic"],
+                "propagate": False,
+            },
+        },
+        "root": {"level": "INFO", "handlers": ["file"]},
+        "disable_existing_loggers": False,
+    }
+
+
+def test_traffic_is_logged_apart_and_sampled():
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    with tempfile.TemporaryDirectory() as directory:
+        logs.configure(config(directory))
+        try:
+            logs.set_traffic_rate(5)
+            bot = Bot("aptbot", "token")
+            for i in range(20):
+                bot._handle_message(f":a!a@a.tmi.twitch.tv PRIVMSG #foo :{i}")
+                bot._handle_message(f":a!a@a.tmi.twitch.tv PRIVMSG #bar :{i}")
+            bot.send_message("foo", "hello")
+            logging.getLogger("aptbot").info("Connected")
+        finally:
+            logs.stop()
+            logs.set_traffic_rate(None)
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+                handler.close()
+            for handler in handlers:
+                root.addHandler(handler)
+            traffic = logging.getLogger("aptbot.traffic")
+            for handler in traffic.handlers[:]:
+                traffic.removeHandler(handler)
+                handler.close()
+            traffic.propagate = True
+        with open(os.path.join(directory, "traffic.log")) as f:
+            lines = f.read().splitlines()
+        with open(os.path.join(directory, "aptbot.log")) as f:
+            assert f.read().splitlines() == ["Connected"]
+    received = [line for line in lines if line.startswith("> ")]
+    assert len(received) == 10
+    assert sum("#foo" in line for line in received) == 5
+    assert lines[-1] == "< PRIVMSG #foo :hello"
+
+
+if __name__ == "__main__":
+    test_channel_rate_limit()
+    test_traffic_is_logged_apart_and_sampled()
+    print("Everything passed")
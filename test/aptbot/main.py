@@ -0,0 +1,331 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from threading import Event, Thread
+from types import ModuleType
+
+import aptbot.main
+from aptbot.bot import AsyncBot, Commands, Message
+from aptbot.dispatch import AsyncDispatcher, Dispatcher, ShedPolicy
+from aptbot.main import (
+    _HANDLER_ERRORS,
+    _HANDLER_SECONDS,
+    Channel,
+    ChannelTable,
+    disable_channel,
+    handle_message_async,
+    load_modules,
+    run_handler,
+    start_handle_message_async,
+)
+
+MODULE = """
+def start(bot, message, stop_event):
+    stop_event.wait()
+
+
+def main(bot, message):
+    bot.send_message(message.channel, "{reply}")
+"""
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, channel, text, reply=None):
+        self.sent.append((channel, text))
+
+
+def write_module(config_path: str, channel: str, reply: str):
+    os.makedirs(os.path.join(config_path, channel), exist_ok=True)
+    with open(os.path.join(config_path, channel, "main.py"), "w") as f:
+        f.write(MODULE.format(reply=reply))
+
+
+def test_load_modules_swaps_routes():
+    bot = FakeBot()
+    channels = ChannelTable()
+    config = aptbot.main.CONFIG_PATH
+    with tempfile.TemporaryDirectory() as config_path:
+        aptbot.main.CONFIG_PATH = config_path
+        write_module(config_path, "foo", "hi foo")
+        write_module(config_path, "bar", "hi bar")
+        os.makedirs(os.path.join(config_path, ".disabled"))
+
+        load_modules(bot, channels)
+        routes = channels.routes
+        assert sorted(routes) == ["bar", "foo"]
+        foo = channels.get("foo")
+        foo.module.main(bot, Message(channel="foo"))
+        assert bot.sent == [("foo", "hi foo")]
+
+        load_modules(bot, channels)
+        assert channels.routes is not routes
+        assert channels.get("foo").thread is foo.thread
+
+        disable_channel("foo", channels)
+        assert foo.stop_event.is_set()
+        assert channels.get("foo") is None
+        assert sorted(routes) == ["bar", "foo"]
+        disable_channel("bar", channels)
+        assert len(channels) == 0
+    aptbot.main.CONFIG_PATH = config
+
+
+def test_load_modules_only_reloads_changes():
+    bot = FakeBot()
+    channels = ChannelTable()
+    config = aptbot.main.CONFIG_PATH
+    with tempfile.TemporaryDirectory() as config_path:
+        aptbot.main.CONFIG_PATH = config_path
+        for channel in ("foo", "bar"):
+            write_module(config_path, channel, "unused")
+            with open(os.path.join(config_path, channel, "main.py"), "a") as f:
+                f.write("\nfrom . import helper\n")
+            with open(os.path.join(config_path, channel, "helper.py"), "w") as f:
+                f.write(f"NAME = '{channel}'\n")
+
+        load_modules(bot, channels)
+        foo, bar = channels.get("foo"), channels.get("bar")
+        assert foo.module.__name__ == "aptbot_channel_foo.main"
+        assert foo.module.helper.NAME == "foo"
+        assert bar.module.helper.NAME == "bar"
+
+        load_modules(bot, channels)
+        assert channels.get("foo").module is foo.module
+
+        # Touching a file without changing it doesn't reload
+        helper = os.path.join(config_path, "foo", "helper.py")
+        os.utime(helper, ns=(0, 0))
+        load_modules(bot, channels)
+        assert channels.get("foo").module is foo.module
+
+        # Changing a sibling reloads that channel only
+        with open(helper, "w") as f:
+            f.write("NAME = 'changed'\n")
+        load_modules(bot, channels)
+        assert channels.get("foo").module is not foo.module
+        assert channels.get("foo").module.helper.NAME == "changed"
+        assert channels.get("foo").thread is foo.thread
+        assert channels.get("bar").module is bar.module
+
+        # A module that fails to load keeps the previous version
+        with open(helper, "w") as f:
+            f.write("1 / 0\n")
+        reloaded = channels.get("foo").module
+        load_modules(bot, channels)
+        assert channels.get("foo").module is reloaded
+
+        disable_channel("foo", channels)
+        disable_channel("bar", channels)
+    aptbot.main.CONFIG_PATH = config
+
+
+def test_channels_import_their_own_siblings():
+    bot = FakeBot()
+    channels = ChannelTable()
+    config = aptbot.main.CONFIG_PATH
+    with tempfile.TemporaryDirectory() as config_path:
+        aptbot.main.CONFIG_PATH = config_path
+        for channel in ("foo", "bar"):
+            write_module(config_path, channel, "unused")
+            with open(os.path.join(config_path, channel, "main.py"), "a") as f:
+                f.write("\nimport helper\nfrom helper import NAME\n")
+            with open(os.path.join(config_path, channel, "helper.py"), "w") as f:
+                f.write(f"NAME = '{channel}'\n")
+
+        load_modules(bot, channels)
+        foo, bar = channels.get("foo").module, channels.get("bar").module
+        assert (foo.helper.NAME, foo.NAME) == ("foo", "foo")
+        assert (bar.helper.NAME, bar.NAME) == ("bar", "bar")
+        assert foo.helper.__name__ == "aptbot_channel_foo.helper"
+        assert "helper" not in sys.modules
+
+        disable_channel("foo", channels)
+        disable_channel("bar", channels)
+    aptbot.main.CONFIG_PATH = config
+
+
+REGISTRY_MODULE = """
+from aptbot import CommandRegistry
+
+registry = CommandRegistry()
+
+
+@registry.command("!hello")
+def hello(bot, message):
+    bot.send_message(message.channel, "hello")
+"""
+
+
+def test_registered_commands_are_routed():
+    bot = FakeBot()
+    channels = ChannelTable()
+    config = aptbot.main.CONFIG_PATH
+    with tempfile.TemporaryDirectory() as config_path:
+        aptbot.main.CONFIG_PATH = config_path
+        os.makedirs(os.path.join(config_path, "foo"))
+        with open(os.path.join(config_path, "foo", "main.py"), "w") as f:
+            f.write(REGISTRY_MODULE)
+        write_module(config_path, "bar", "hi bar")
+
+        load_modules(bot, channels)
+        foo = channels.get("foo")
+        assert foo.handlers(Message(command=Commands.JOIN, channel="foo")) == []
+        message = Message(command=Commands.PRIVMSG, channel="foo", value="!hello")
+        (handler,) = foo.handlers(message)
+        handler(bot, message)
+        assert bot.sent == [("foo", "hello")]
+
+        bar = channels.get("bar")
+        assert bar.handlers(message) == [bar.module.main]
+
+        # A registry is enough, the start thread is made once there is a start
+        assert foo.thread is None
+        with open(os.path.join(config_path, "foo", "main.py"), "a") as f:
+            f.write("\n\ndef start(bot, message, stop_event):\n    stop_event.wait()\n")
+        load_modules(bot, channels)
+        assert channels.get("foo").thread.is_alive()
+        assert channels.get("bar").thread is bar.thread
+
+        disable_channel("foo", channels)
+        disable_channel("bar", channels)
+    aptbot.main.CONFIG_PATH = config
+
+
+def test_run_handler_records_metrics():
+    count = _HANDLER_SECONDS.count("metrics")
+    submitted = time.perf_counter()
+    assert run_handler("metrics", submitted, max, 1, 2) == 2
+    try:
+        run_handler("metrics", submitted, max)
+    except TypeError:
+        pass
+    assert _HANDLER_SECONDS.count("metrics") == count + 2
+    assert _HANDLER_ERRORS.value("metrics") == 1
+
+    # Calls that aren't sampled only count errors
+    assert run_handler("metrics", 0.0, max, 1, 2) == 2
+    try:
+        run_handler("metrics", 0.0, max)
+    except TypeError:
+        pass
+    assert _HANDLER_SECONDS.count("metrics") == count + 2
+    assert _HANDLER_ERRORS.value("metrics") == 2
+
+
+class FakeAsyncBot(AsyncBot):
+    def __init__(self, messages: list[Message]):
+        super().__init__("aptbot", "token")
+        self.messages = messages
+
+    async def get_messages(self) -> list[Message]:
+        self._loop = asyncio.get_running_loop()
+        if not self.messages:
+            await asyncio.Event().wait()
+        messages, self.messages = self.messages, []
+        return messages
+
+
+def run_async_handlers(dispatcher: AsyncDispatcher, count: int) -> list:
+    events = []
+    module = ModuleType("async_handlers")
+
+    async def main(bot, message):
+        events.append(("start", message.value))
+        # Later messages finish sooner, unless they wait their turn
+        await asyncio.sleep(0.002 * (count - int(message.value)))
+        events.append(("end", message.value))
+
+    module.main = main
+    channels = ChannelTable()
+    channels.replace({"foo": Channel("foo", module, Thread(), Event())})
+    messages = [Message(channel="foo", value=str(i)) for i in range(count)]
+
+    # Coroutines never reach the worker threads
+    workers = Dispatcher(1, 1)
+
+    async def run():
+        bot = FakeAsyncBot(messages)
+        task = asyncio.create_task(
+            handle_message_async(bot, channels, workers, None, dispatcher)
+        )
+        while dispatcher.completed + dispatcher.dropped < count:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        dispatcher.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert workers.submitted == 0
+    return events
+
+
+def test_coroutine_handlers_are_queued_per_channel():
+    events = run_async_handlers(AsyncDispatcher(100), 10)
+    assert events == [(event, str(i)) for i in range(10) for event in ("start", "end")]
+
+    dispatcher = AsyncDispatcher(2, ShedPolicy.DROP_NEWEST)
+    events = run_async_handlers(dispatcher, 10)
+    assert dispatcher.dropped > 0
+    assert len(events) == 2 * dispatcher.completed
+
+    dispatcher = AsyncDispatcher(2, ShedPolicy.DROP_OLDEST)
+    events = run_async_handlers(dispatcher, 10)
+    assert dispatcher.dropped > 0
+    assert events[-1] == ("end", "9")
+
+    # Waiting for room in the queue doesn't hold up the loop the handlers run on
+    events = run_async_handlers(AsyncDispatcher(1, ShedPolicy.BLOCK), 5)
+    assert events == [(event, str(i)) for i in range(5) for event in ("start", "end")]
+
+
+class FailingAsyncBot(FakeAsyncBot):
+    def __init__(self, messages: list[Message]):
+        super().__init__(messages)
+        self.failures = 1
+
+    async def get_messages(self) -> list[Message]:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("connection reset")
+        return await super().get_messages()
+
+
+def test_reading_chat_is_restarted_after_a_failure():
+    handled = Event()
+    module = ModuleType("restarted")
+    module.main = lambda bot, message: handled.set()
+    channels = ChannelTable()
+    channels.replace({"foo": Channel("foo", module, Thread(), Event())})
+    bot = FailingAsyncBot([Message(channel="foo", value="hi")])
+    bot._loop = asyncio.new_event_loop()
+    Thread(target=bot.loop.run_forever, daemon=True).start()
+    dispatcher = Dispatcher(1, 10)
+    dispatcher.start()
+    try:
+        start_handle_message_async(bot, channels, dispatcher)
+        assert handled.wait(2)
+        assert bot.failures == 0
+    finally:
+        dispatcher.stop()
+
+        async def cancel():
+            for task in asyncio.all_tasks() - {asyncio.current_task()}:
+                task.cancel()
+
+        asyncio.run_coroutine_threadsafe(cancel(), bot.loop).result()
+        bot.loop.call_soon_threadsafe(bot.loop.stop)
+
+
+if __name__ == "__main__":
+    test_load_modules_swaps_routes()
+    test_load_modules_only_reloads_changes()
+    test_channels_import_their_own_siblings()
+    test_registered_commands_are_routed()
+    test_run_handler_records_metrics()
+    test_coroutine_handlers_are_queued_per_channel()
+    test_reading_chat_is_restarted_after_a_failure()
+    print("Everything passed")
@@ -0,0 +1,89 @@
+import threading
+import urllib.request
+
+import aptbot.metrics
+from aptbot.metrics import Counter, Gauge, Histogram, Registry, serve
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    counter = registry.register(Counter("messages_total", "Messages", ("channel",)))
+    counter.inc("foo")
+    counter.inc("foo", amount=2)
+    counter.inc('a"b\\c')
+    registry.register(Gauge("depth", "Depth", lambda: 1.5))
+    registry.register(Gauge("backlog", "Backlog", lambda: {("foo",): 3}, ("channel",)))
+    assert counter.value("foo") == 3
+    assert registry.render() == (
+        "# HELP messages_total Messages\n"
+        "# TYPE messages_total counter\n"
+        'messages_total{channel="foo"} 3\n'
+        'messages_total{channel="a\\"b\\\\c"} 1\n'
+        "# HELP depth Depth\n"
+        "# TYPE depth gauge\n"
+        "depth 1.5\n"
+        "# HELP backlog Backlog\n"
+        "# TYPE backlog gauge\n"
+        'backlog{channel="foo"} 3\n'
+    )
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = registry.register(Histogram("wait_seconds", "Wait", buckets=(0.1, 1.0)))
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+    assert histogram.count() == 4
+    assert registry.render().splitlines()[2:] == [
+        'wait_seconds_bucket{le="0.1"} 2',
+        'wait_seconds_bucket{le="1"} 3',
+        'wait_seconds_bucket{le="+Inf"} 4',
+        "wait_seconds_sum 2.65",
+        "wait_seconds_count 4",
+    ]
+
+
+def test_ended_threads_are_folded():
+    counter = Counter("threads_total", "Threads", ("channel",))
+    histogram = Histogram("thread_seconds", "Threads", buckets=(0.1, 1.0))
+
+    def record():
+        counter.inc("foo")
+        histogram.observe(0.5)
+
+    for _ in range(3):
+        threads = [threading.Thread(target=record) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    record()
+    # Only this thread still has its own values
+    assert len(counter._shards) == 1 and len(histogram._shards) == 1
+    assert counter.value("foo") == 31
+    assert histogram.count() == 31
+    assert list(histogram.samples())[1] == ("_bucket", (("le", "1"),), 31)
+
+
+def test_http_endpoint():
+    aptbot.metrics.counter("aptbot_test_total", "Test").inc()
+    server = serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            body = response.read().decode()
+        assert "aptbot_test_total 1\n" in body
+        assert "# TYPE aptbot_parse_seconds histogram\n" in body
+    finally:
+        server.shutdown()
+        aptbot.metrics.REGISTRY.unregister("aptbot_test_total")
+
+
+if __name__ == "__main__":
+    test_counter_and_gauge()
+    test_histogram()
+    test_ended_threads_are_folded()
+    test_http_endpoint()
+    print("Everything passed")
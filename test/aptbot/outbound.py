@@ -0,0 +1,175 @@
+import time
+
+from aptbot.outbound import OutboundQueue, Priority, TokenBucket
+
+
+class Recorder:
+    def __init__(self):
+        self.writes = []
+        self.connections = []
+
+    def __call__(self, connection, data: bytes):
+        self.connections.append(connection)
+        self.writes.append(data)
+
+    def lines(self) -> list[bytes]:
+        return b"".join(self.writes).splitlines()
+
+
+def wait_for_lines(recorder: Recorder, count: int, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while len(recorder.lines()) < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, 1.0)
+    now = time.monotonic()
+    assert bucket.delay(now) == 0
+    bucket.consume(now)
+    bucket.consume(now)
+    assert 0.49 < bucket.delay(now) <= 0.5
+    assert bucket.delay(now + 0.5) == 0
+
+
+def test_priority_and_batching():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder)
+    queue.put_many(
+        [
+            ("PRIVMSG #a :1", Priority.MESSAGE, "a", None),
+            ("JOIN #b", Priority.JOIN, "b", None),
+            ("PONG :tmi.twitch.tv", Priority.PONG, None, None),
+        ]
+    )
+    queue.start()
+    wait_for_lines(recorder, 3)
+    queue.stop()
+    assert recorder.writes == [b"PONG :tmi.twitch.tv\r\nJOIN #b\r\nPRIVMSG #a :1\r\n"]
+    assert queue.depth == 0
+    assert queue.sent == 3 and queue.writes == 1
+
+
+def test_channel_and_user_limits():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder, user_limit=(3, 60.0), channel_limit=(1, 60.0))
+    queue.start()
+    for i in range(2):
+        queue.put(f"PRIVMSG #a :{i}", Priority.MESSAGE, "a")
+        queue.put(f"PRIVMSG #b :{i}", Priority.MESSAGE, "b")
+    queue.put("PRIVMSG #c :0", Priority.MESSAGE, "c")
+    queue.put("PRIVMSG #d :0", Priority.MESSAGE, "d")
+    wait_for_lines(recorder, 3)
+    time.sleep(0.05)
+    assert recorder.lines() == [b"PRIVMSG #a :0", b"PRIVMSG #b :0", b"PRIVMSG #c :0"]
+    assert queue.depth == 3
+
+    # Moderators skip the user and channel limits
+    queue.set_moderator("a", True)
+    wait_for_lines(recorder, 4)
+    queue.stop()
+    assert recorder.lines()[3] == b"PRIVMSG #a :1"
+    assert queue.depth == 2
+
+
+def test_rate_limited_channels_are_skipped_cheaply():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder, channel_limit=(1, 60.0))
+    queue.put_many(
+        (f"PRIVMSG #a :{i}", Priority.MESSAGE, "a", None) for i in range(10000)
+    )
+    queue.put("PRIVMSG #b :hi", Priority.MESSAGE, "b")
+    now = time.monotonic()
+    batch, _ = queue._take_batch(now)
+    assert [item[5] for item in batch] == [b"PRIVMSG #a :0\r\n", b"PRIVMSG #b :hi\r\n"]
+    # The lines waiting for #a aren't looked at again
+    start = time.perf_counter()
+    for _ in range(1000):
+        batch, delay = queue._take_batch(now)
+    assert time.perf_counter() - start < 0.1
+    assert batch == [] and 59 < delay <= 60
+    assert queue.depth == 9999
+
+
+def test_joins_are_paced():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder, join_limit=(2, 60.0))
+    queue.start()
+    queue.put_many((f"JOIN #{i}", Priority.JOIN, str(i), None) for i in range(4))
+    queue.put("PRIVMSG #a :hi", Priority.MESSAGE, "a")
+    wait_for_lines(recorder, 3)
+    time.sleep(0.05)
+    queue.stop()
+    assert recorder.lines() == [b"JOIN #0", b"JOIN #1", b"PRIVMSG #a :hi"]
+    assert queue.pending_joins == 2
+
+
+def test_lines_are_written_to_their_connection():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder)
+    queue.put_many(
+        [
+            ("JOIN #a", Priority.CONTROL, None, 0),
+            ("JOIN #b", Priority.CONTROL, None, 1),
+            ("JOIN #c", Priority.CONTROL, None, 0),
+        ]
+    )
+    queue.start()
+    wait_for_lines(recorder, 3)
+    queue.stop()
+    assert list(zip(recorder.connections, recorder.writes)) == [
+        (0, b"JOIN #a\r\nJOIN #c\r\n"),
+        (1, b"JOIN #b\r\n"),
+    ]
+
+
+def test_paused_connections_keep_their_lines():
+    recorder = Recorder()
+    queue = OutboundQueue(recorder)
+    queue.pause(1)
+    queue.start()
+    queue.put("JOIN #a", Priority.JOIN, "a", 1)
+    queue.put("PRIVMSG #a :hi", Priority.MESSAGE, "a", 1)
+    queue.put("PRIVMSG #b :hi", Priority.MESSAGE, "b", 0)
+    wait_for_lines(recorder, 1)
+    time.sleep(0.05)
+    assert recorder.lines() == [b"PRIVMSG #b :hi"]
+    queue.resume(1)
+    wait_for_lines(recorder, 3)
+    queue.stop()
+    assert recorder.lines()[1:] == [b"JOIN #a", b"PRIVMSG #a :hi"]
+
+
+def test_failed_writes_are_requeued():
+    recorder = Recorder()
+    failed = []
+
+    def write(connection, data):
+        if not failed:
+            failed.append(connection)
+            raise ConnectionResetError()
+        recorder(connection, data)
+
+    queue = OutboundQueue(write, on_error=failed.append, channel_limit=(10, 1.0))
+    queue.start()
+    queue.put("JOIN #a", Priority.JOIN, "a", 0)
+    queue.put("PRIVMSG #a :hi", Priority.MESSAGE, "a", 0)
+    time.sleep(0.05)
+    assert failed == [0, 0]
+    assert queue.depth == 2
+    queue.resume(0)
+    wait_for_lines(recorder, 2)
+    queue.stop()
+    assert recorder.lines() == [b"JOIN #a", b"PRIVMSG #a :hi"]
+
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_priority_and_batching()
+    test_channel_and_user_limits()
+    test_rate_limited_channels_are_skipped_cheaply()
+    test_joins_are_paced()
+    test_lines_are_written_to_their_connection()
+    test_paused_connections_keep_their_lines()
+    test_failed_writes_are_requeued()
+    print("Everything passed")
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from aptbot.bot import ABCBot, Commands, Message
+from aptbot.processes import ProcessPool
+
+MODULE = """
+import os
+
+PROCESS_POOL = True
+
+
+def main(bot, message):
+    bot.send_message(message.channel, f"{{message.tags['id']}} {{os.getpid()}}")
+    bot.send_message(message.channel, ["{reply}", "{reply}"], reply="abc")
+
+
+def fail(bot, message):
+    raise ValueError("fail")
+
+
+def crash(bot, message):
+    os._exit(1)
+"""
+
+
+class FakeBot(ABCBot):
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, channel, text, reply=None):
+        self.sent.append((channel, text, reply))
+
+
+def write_module(channel_path: str, reply: str):
+    with open(os.path.join(channel_path, "main.py"), "w") as f:
+        f.write(MODULE.format(reply=reply))
+
+
+def main(bot, message):
+    pass
+
+
+def fail(bot, message):
+    pass
+
+
+def crash(bot, message):
+    pass
+
+
+def test_process_pool_replays_replies():
+    bot = FakeBot()
+    pool = ProcessPool(1)
+    message = Message(
+        command=Commands.PRIVMSG, channel="foo", value="hi", raw_tags="id=1"
+    )
+    with tempfile.TemporaryDirectory() as channel_path:
+        write_module(channel_path, "one")
+        pool.call(bot, "foo", channel_path, "1", main, message)
+        (_, pid, _), replies = bot.sent[0], bot.sent[1]
+        assert pid.split()[0] == "1"
+        assert int(pid.split()[1]) != os.getpid()
+        assert replies == ("foo", ["one", "one"], "abc")
+
+        # The worker keeps the module until the digest changes
+        write_module(channel_path, "two")
+        pool.call(bot, "foo", channel_path, "1", main, message)
+        assert bot.sent[3] == ("foo", ["one", "one"], "abc")
+        pool.call(bot, "foo", channel_path, "2", main, message)
+        assert bot.sent[5] == ("foo", ["two", "two"], "abc")
+
+        try:
+            pool.call(bot, "foo", channel_path, "2", fail, message)
+        except ValueError:
+            pass
+        else:
+            assert False
+    pool.shutdown()
+
+
+def test_process_pool_replaces_crashed_workers():
+    bot = FakeBot()
+    pool = ProcessPool(1)
+    message = Message(
+        command=Commands.PRIVMSG, channel="foo", value="hi", raw_tags="id=1"
+    )
+    with tempfile.TemporaryDirectory() as channel_path:
+        write_module(channel_path, "one")
+        try:
+            pool.call(bot, "foo", channel_path, "1", crash, message)
+        except BrokenProcessPool:
+            pass
+        else:
+            assert False
+        pool.call(bot, "foo", channel_path, "1", main, message)
+        assert bot.sent[1] == ("foo", ["one", "one"], "abc")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    test_process_pool_replays_replies()
+    test_process_pool_replaces_crashed_workers()
+    print("Everything passed")
@@ -0,0 +1,68 @@
+from aptbot.bot import Commands, Message
+from aptbot.registry import CommandRegistry
+
+
+def privmsg(value: str, nick: str = "foo") -> Message:
+    return Message(nick=nick, command=Commands.PRIVMSG, channel="bar", value=value)
+
+
+def test_commands_match_first_word():
+    registry = CommandRegistry()
+
+    @registry.command("!hello", "!hi")
+    def hello(bot, message):
+        pass
+
+    assert registry.match(privmsg("!hello")) == [hello]
+    assert registry.match(privmsg("!HI there")) == [hello]
+    assert registry.match(privmsg("say !hello")) == []
+    assert registry.match(privmsg("!hellooo")) == []
+    assert registry.match(Message(command=Commands.JOIN, value="!hello")) == []
+
+
+def test_listeners_match_message_types():
+    registry = CommandRegistry()
+
+    @registry.on(Commands.USERNOTICE, Commands.CLEARCHAT)
+    def notice(bot, message):
+        pass
+
+    @registry.command("!raid", commands=(Commands.USERNOTICE,))
+    def raid(bot, message):
+        pass
+
+    assert registry.match(Message(command=Commands.USERNOTICE)) == [notice]
+    assert registry.match(Message(command=Commands.USERNOTICE, value="!raid")) == [
+        notice,
+        raid,
+    ]
+    assert registry.match(Message(command=Commands.CLEARCHAT)) == [notice]
+    assert registry.match(privmsg("!raid")) == []
+
+
+def test_cooldowns():
+    registry = CommandRegistry()
+
+    @registry.command("!hello", cooldown=10)
+    def hello(bot, message):
+        pass
+
+    @registry.command("!dice", user_cooldown=10)
+    def dice(bot, message):
+        pass
+
+    assert registry.match(privmsg("!hello"), now=100) == [hello]
+    assert registry.match(privmsg("!hello", "baz"), now=105) == []
+    assert registry.match(privmsg("!hello"), now=110) == [hello]
+
+    assert registry.match(privmsg("!dice"), now=100) == [dice]
+    assert registry.match(privmsg("!dice"), now=105) == []
+    assert registry.match(privmsg("!dice", "baz"), now=105) == [dice]
+    assert registry.match(privmsg("!dice"), now=110) == [dice]
+
+
+if __name__ == "__main__":
+    test_commands_match_first_word()
+    test_listeners_match_message_types()
+    test_cooldowns()
+    print("Everything passed")
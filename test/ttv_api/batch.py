@@ -0,0 +1,105 @@
+import threading
+
+import ttv_api
+import ttv_api.channel
+import ttv_api.users
+from ttv_api.batch import Batcher, chunks
+from ttv_api.fake_helix import FakeHelix
+
+
+def concurrently(function, arguments: list) -> list:
+    results = [None] * len(arguments)
+    start = threading.Barrier(len(arguments))
+
+    def call(i: int):
+        start.wait()
+        results[i] = function(arguments[i])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(arguments))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_lookups_are_batched(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        for i in range(50):
+            helix.add_user(str(i))
+        results = concurrently(
+            lambda i: ttv_api.users.get_users([str(i % 25)]), list(range(50))
+        )
+        assert [[u.user_id for u in users] for users in results] == [
+            [str(i % 25)] for i in range(50)
+        ]
+        queries = helix.requests_to("users")
+        assert len(queries) < 5
+        ids = [i for query in queries for i in query["id"]]
+        assert sorted(ids, key=int) == [str(i) for i in range(25)]
+
+        results = concurrently(
+            lambda i: ttv_api.channel.get_channels(str(i), "missing"), list(range(10))
+        )
+        assert [[c.broadcaster_id for c in cs] for cs in results] == [
+            [str(i)] for i in range(10)
+        ]
+
+
+def test_large_lookups_are_split(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        for i in range(250):
+            helix.add_user(str(i))
+        users = ttv_api.users.get_users(
+            [str(i) for i in range(200)], [f"user{i}" for i in range(150, 250)]
+        )
+        assert [u.user_id for u in users] == [str(i) for i in range(250)]
+        queries = helix.requests_to("users")
+        assert len(queries) == 3
+        assert all(
+            len(q.get("id", [])) + len(q.get("login", [])) <= 100 for q in queries
+        )
+        assert ttv_api.users.get_users(user_logins=["USER1"])[0].user_id == "1"
+
+
+def test_failed_batch(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        helix.add_user("1")
+        helix.failures = [400]
+        assert (
+            concurrently(lambda i: ttv_api.channel.get_channels(i), ["1", "1", "2"])
+            == [None] * 3
+        )
+        assert ttv_api.channel.get_channels("1")[0].broadcaster_id == "1"
+
+
+def test_batcher_errors_reach_every_caller():
+    def fetch(keys, priority):
+        raise KeyError("data")
+
+    batcher = Batcher(fetch, lambda value: [value])
+    errors = concurrently(lambda key: _raises(batcher.load, [key]), ["a", "b"])
+    assert errors == [True, True]
+    assert chunks(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+
+
+def _raises(function, *args) -> bool:
+    try:
+        function(*args)
+    except KeyError:
+        return True
+    return False
+
+
+if __name__ == "__main__":
+    from conftest import helix_globals
+
+    with helix_globals() as use_helix:
+        test_concurrent_lookups_are_batched(use_helix)
+        test_large_lookups_are_split(use_helix)
+        test_failed_batch(use_helix)
+        test_batcher_errors_reach_every_caller()
+        print("Everything passed")
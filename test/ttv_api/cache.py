@@ -0,0 +1,123 @@
+import os
+import tempfile
+import time
+
+import ttv_api
+import ttv_api.cache
+import ttv_api.channel
+import ttv_api.emotes
+import ttv_api.users
+from ttv_api.cache import Cache
+from ttv_api.fake_helix import FakeHelix
+
+
+def wait_for(condition, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_hits_skip_the_request(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        for i in range(3):
+            helix.add_user(str(i))
+        assert ttv_api.users.get_users(["1"])[0].login == "user1"
+        # Cached by id and by login
+        assert [u.user_id for u in ttv_api.users.get_users(["1"], ["USER1"])] == ["1"]
+        assert len(helix.requests_to("users")) == 1
+        assert [u.user_id for u in ttv_api.users.get_users(["0", "1", "2"])] == [
+            "0",
+            "1",
+            "2",
+        ]
+        assert helix.requests_to("users")[1] == {"id": ["0", "2"]}
+
+        ttv_api.channel.get_channels("1")
+        ttv_api.channel.get_channels("1", "missing")
+        ttv_api.emotes.get_channel_emotes("1").clear()
+        assert len(ttv_api.emotes.get_channel_emotes("1")) == 1
+        ttv_api.emotes.get_global_emotes()
+        ttv_api.emotes.get_global_emotes()
+        assert len(helix.requests) == 6
+        assert ttv_api.cache.stats()["channels"]["misses"] == 2
+
+
+def test_stale_values_are_refreshed(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        helix.add_user("1")
+        user = ttv_api.users.get_users(["1"])[0]
+        old = time.time() - ttv_api.users.USERS_TTL - 1
+        ttv_api.users._cache.put(("id", "1"), user, old)
+        helix.users["1"]["display_name"] = "renamed"
+        # The stale value is returned at once and refreshed in the background
+        assert ttv_api.users.get_users(["1"])[0].display_name == "user1"
+        assert wait_for(lambda: len(helix.requests_to("users")) == 2)
+        assert wait_for(
+            lambda: ttv_api.users.get_users(["1"])[0].display_name == "renamed"
+        )
+        stats = ttv_api.users._cache.stats()
+        assert stats["stale_hits"] >= 1
+        assert stats["refreshes"] == 1
+
+
+def test_expiry_and_eviction():
+    fetched = []
+
+    def fetch(priority):
+        fetched.append(priority)
+        return len(fetched)
+
+    cache = Cache("test_expiry", ttl=0.05, stale=0.05, max_entries=2)
+    assert cache.get("a", fetch) == 1
+    assert cache.get("a", fetch) == 1
+    time.sleep(0.15)
+    # Too old to be served while it's refreshed
+    assert cache.get("a", fetch) == 2
+    assert fetched == [ttv_api.Priority.INTERACTIVE] * 2
+
+    cache.put("b", "b")
+    cache.get("a", fetch)
+    cache.put("c", "c")
+    assert list(cache.entries()) == ["a", "c"]
+    assert cache.stats() == {
+        "entries": 2,
+        "hits": 2,
+        "stale_hits": 0,
+        "misses": 2,
+        "refreshes": 0,
+    }
+
+
+def test_snapshot():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "helix.cache")
+        cache = Cache("test_snapshot", ttl=60)
+        cache.put("a", [1, 2])
+        cache.put("b", [3], time.time() - 600)
+        ttv_api.cache.save(path)
+
+        ttv_api.cache.SNAPSHOT = path
+        ttv_api.cache._snapshot = None
+        try:
+            cache = Cache("test_snapshot", ttl=60)
+        finally:
+            ttv_api.cache.SNAPSHOT = None
+        assert cache.get("a", lambda priority: None) == [1, 2]
+        # Older than ttl + stale when it was loaded
+        assert cache.get("b", lambda priority: None) is None
+
+
+if __name__ == "__main__":
+    from conftest import helix_globals
+
+    with helix_globals() as use_helix:
+        test_hits_skip_the_request(use_helix)
+        test_stale_values_are_refreshed(use_helix)
+        test_expiry_and_eviction()
+        test_snapshot()
+        print("Everything passed")
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+
+import pytest
+
+import ttv_api
+import ttv_api.cache
+from ttv_api.fake_helix import FakeHelix
+
+
+# Points ttv_api at a FakeHelix with a new pool, scheduler and empty caches,
+# and puts the previous ones back afterwards
+@contextmanager
+def helix_globals():
+    saved = ttv_api.BASE_URL, ttv_api.http, ttv_api.scheduler
+
+    def use(helix: FakeHelix, **pool):
+        ttv_api.BASE_URL = helix.url
+        ttv_api.http = ttv_api.create_pool_manager(**pool)
+        ttv_api.scheduler = ttv_api.Scheduler()
+        ttv_api.cache.clear()
+
+    try:
+        yield use
+    finally:
+        ttv_api.BASE_URL, ttv_api.http, ttv_api.scheduler = saved
+        ttv_api.cache.clear()
+
+
+@pytest.fixture
+def use_helix():
+    with helix_globals() as use:
+        yield use
@@ -0,0 +1,71 @@
+import ttv_api
+import ttv_api.cache
+import ttv_api.channel
+import ttv_api.emotes
+import ttv_api.stream
+import ttv_api.users
+from ttv_api.fake_helix import FakeHelix
+
+
+def test_connections_are_reused(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        helix.add_user("1", "foo", live=True)
+        helix.add_user("2", "bar")
+        for _ in range(5):
+            ttv_api.cache.clear()
+            assert [u.login for u in ttv_api.users.get_users(["1"], ["bar"])] == [
+                "foo",
+                "bar",
+            ]
+            assert ttv_api.channel.get_channels("2")[0].broadcaster_login == "bar"
+            assert [s.login for s in ttv_api.stream.get_streams()] == ["foo"]
+            assert ttv_api.emotes.get_channel_emotes("1")[0].emote_set_id == "1"
+            assert ttv_api.emotes.get_global_emotes() == []
+        assert len(helix.requests) == 25
+        assert helix.requests_to("chat/emotes/global") == [{}] * 5
+        assert helix.connections == 1
+
+
+def test_url_values_are_absolute(use_helix):
+    base = ttv_api.URL.users.value.removesuffix("users")
+    assert base.startswith("http") and base.endswith("/helix/")
+    with FakeHelix() as helix:
+        use_helix(helix)
+        helix.add_user("1")
+        assert ttv_api.users.get_users(["1"])[0].user_id == "1"
+        assert helix.requests_to("users") == [{"id": ["1"]}]
+    assert ttv_api.URL.users.value == base + "users"
+
+
+def test_server_errors_are_retried(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix, retries=2)
+        helix.add_user("1")
+        helix.failures = [503, 502]
+        assert ttv_api.users.get_users(["1"])[0].user_id == "1"
+        helix.failures = [503, 503, 503]
+        ttv_api.cache.clear()
+        assert ttv_api.users.get_users(["1"]) is None
+        assert len(helix.requests) == 6
+        helix.failures = [400]
+        ttv_api.cache.clear()
+        assert ttv_api.users.get_users(["1"]) is None
+        assert len(helix.requests) == 7
+
+
+def test_timeout(use_helix):
+    with FakeHelix(delay=0.5) as helix:
+        use_helix(helix, timeout=0.05, retries=0)
+        assert ttv_api.users.get_users(["1"]) is None
+
+
+if __name__ == "__main__":
+    from conftest import helix_globals
+
+    with helix_globals() as use_helix:
+        test_connections_are_reused(use_helix)
+        test_url_values_are_absolute(use_helix)
+        test_server_errors_are_retried(use_helix)
+        test_timeout(use_helix)
+        print("Everything passed")
@@ -0,0 +1,106 @@
+import threading
+import time
+
+import ttv_api
+import ttv_api.stream
+import ttv_api.users
+from ttv_api.fake_helix import FakeHelix
+from ttv_api.scheduler import Priority, Scheduler
+
+
+def headers(limit: int, remaining: int, reset: float) -> dict[str, str]:
+    return {
+        "Ratelimit-Limit": str(limit),
+        "Ratelimit-Remaining": str(remaining),
+        "Ratelimit-Reset": str(reset),
+    }
+
+
+def test_waits_for_the_reset():
+    scheduler = Scheduler()
+    scheduler.acquire()
+    scheduler.release(headers(10, 0, time.time() + 0.2))
+    start = time.perf_counter()
+    scheduler.acquire()
+    assert time.perf_counter() - start >= 0.15
+    assert scheduler.waited == 1
+    scheduler.release(headers(10, 9, time.time() + 60))
+    scheduler.acquire()
+    assert scheduler.waited == 1
+
+
+def test_interactive_goes_first():
+    scheduler = Scheduler()
+    scheduler.acquire()
+    scheduler.release(headers(10, 0, time.time() + 0.2))
+    order = []
+
+    def call(priority: Priority):
+        scheduler.acquire(priority)
+        order.append(priority)
+        scheduler.release()
+
+    threads = [threading.Thread(target=call, args=(Priority.BACKGROUND,))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=call, args=(Priority.INTERACTIVE,)))
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+def test_background_leaves_a_reserve():
+    scheduler = Scheduler(reserve=0.2)
+    scheduler.acquire()
+    scheduler.release(headers(10, 2, time.time() + 0.2))
+    scheduler.acquire(Priority.INTERACTIVE)
+    scheduler.release()
+    assert scheduler.waited == 0
+    start = time.perf_counter()
+    scheduler.acquire(Priority.BACKGROUND)
+    scheduler.release()
+    assert time.perf_counter() - start >= 0.15
+
+
+def test_requests_stay_within_the_limit(use_helix):
+    with FakeHelix(rate_limit=5, window=0.2) as helix:
+        use_helix(helix)
+        for i in range(12):
+            helix.add_user(str(i))
+        start = time.perf_counter()
+        for i in range(12):
+            assert ttv_api.users.get_users([str(i)])[0].user_id == str(i)
+        assert time.perf_counter() - start >= 0.4
+        assert helix.limited == 0
+
+
+def test_rate_limited_requests_are_retried(use_helix):
+    with FakeHelix(rate_limit=2, window=0.2, delay=0.05) as helix:
+        use_helix(helix)
+        helix.add_user("1", live=True)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(ttv_api.stream.get_streams(["1"]))
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert helix.limited == 2
+        assert [streams[0].user_id for streams in results] == ["1"] * 4
+
+
+if __name__ == "__main__":
+    from conftest import helix_globals
+
+    with helix_globals() as use_helix:
+        test_waits_for_the_reset()
+        test_interactive_goes_first()
+        test_background_leaves_a_reserve()
+        test_requests_stay_within_the_limit(use_helix)
+        test_rate_limited_requests_are_retried(use_helix)
+        print("Everything passed")
@@ -0,0 +1,80 @@
+import time
+
+import ttv_api
+import ttv_api.stream
+from ttv_api.fake_helix import FakeHelix, stream, user
+
+
+def add_streams(helix: FakeHelix, count: int, game_id: str, start: int = 0):
+    for i in range(start, start + count):
+        helix.streams.append(stream(user(str(i)), game_id))
+
+
+def test_filters_are_kept_on_every_page(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        add_streams(helix, 150, "1")
+        add_streams(helix, 150, "2", 150)
+        add_streams(helix, 100, "1", 300)
+        streams = list(ttv_api.stream.iter_streams(game_ids=["1"]))
+        assert [s.user_id for s in streams] == [
+            str(i) for i in list(range(150)) + list(range(300, 400))
+        ]
+        queries = helix.requests_to("streams")
+        assert len(queries) == 3
+        assert all(query["game_id"] == ["1"] for query in queries)
+
+        assert len(ttv_api.stream.get_streams(game_ids=["1"], max_streams=120)) == 120
+        assert [q["first"] for q in helix.requests_to("streams")[3:]] == [
+            ["100"],
+            ["100"],
+        ]
+        assert len(ttv_api.stream.get_streams(game_ids=["2"], max_streams=5)) == 5
+        assert helix.requests_to("streams")[-1]["first"] == ["5"]
+
+
+def test_next_page_is_prefetched(use_helix):
+    with FakeHelix(delay=0.05) as helix:
+        use_helix(helix)
+        add_streams(helix, 450, "1")
+        streams = ttv_api.stream.iter_streams(game_ids=["1"])
+        next(streams)
+        # The second page is on its way while the first is consumed
+        time.sleep(0.1)
+        assert len(helix.requests_to("streams")) == 2
+        start = time.perf_counter()
+        for _ in range(100):
+            next(streams)
+        assert time.perf_counter() - start < 0.04
+        time.sleep(0.1)
+        assert len(helix.requests_to("streams")) == 3
+        # Stopping early doesn't fetch the rest
+        streams.close()
+        time.sleep(0.1)
+        assert len(helix.requests_to("streams")) == 3
+
+
+def test_failed_page(use_helix):
+    with FakeHelix() as helix:
+        use_helix(helix)
+        add_streams(helix, 10, "1")
+        helix.failures = [400]
+        assert ttv_api.stream.get_streams(game_ids=["1"]) is None
+        helix.failures = [400]
+        try:
+            list(ttv_api.stream.iter_streams(game_ids=["1"]))
+        except ttv_api.stream.StreamsUnavailable:
+            pass
+        else:
+            assert False
+        assert len(ttv_api.stream.get_streams(game_ids=["1"])) == 10
+
+
+if __name__ == "__main__":
+    from conftest import helix_globals
+
+    with helix_globals() as use_helix:
+        test_filters_are_kept_on_every_page(use_helix)
+        test_next_page_is_prefetched(use_helix)
+        test_failed_page(use_helix)
+        print("Everything passed")
@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 from dataclasses import dataclass
 from datetime import datetime
@@ -8,8 +9,14 @@ from typing import Optional, Union
 import urllib3
 from dotenv import load_dotenv
 
+from .batch import Batcher
+from .cache import Cache
+from .scheduler import Priority, Scheduler
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 NICK = os.getenv("APTBOT_NICK")
 OAUTH = os.getenv("APTBOT_OAUTH")
 CLIENT_ID = os.getenv("APTBOT_CLIENT_ID")
@@ -20,7 +27,19 @@ HEADER = {
     "Content-Type": "application/json",
 }
 
-BASE_URL = "https://api.twitch.tv/helix/"
+BASE_URL = os.getenv("APTBOT_HELIX_URL", "https://api.twitch.tv/helix/")
+# Seconds, for connecting and for each read
+TIMEOUT = float(os.getenv("APTBOT_HELIX_TIMEOUT", 5.0))
+# Retries of failed connections and 5xx responses
+RETRIES = int(os.getenv("APTBOT_HELIX_RETRIES", 2))
+# Connections kept open to the API
+POOL_SIZE = 10
+# Times a request answered with 429 Too Many Requests is sent again
+RATE_LIMIT_RETRIES = 2
+
+
+# The BASE_URL the URL members were made with
+_URL_BASE = BASE_URL
 
 
 class URL(Enum):
@@ -31,3 +50,51 @@ class URL(Enum):
     emotes_global = BASE_URL + "chat/emotes/global"
     streams = BASE_URL + "streams"
     users = BASE_URL + "users"
+
+
+def create_pool_manager(
+    timeout: float = TIMEOUT, retries: int = RETRIES, maxsize: int = POOL_SIZE
+) -> urllib3.PoolManager:
+    return urllib3.PoolManager(
+        maxsize=maxsize,
+        timeout=urllib3.Timeout(connect=timeout, read=timeout),
+        retries=urllib3.Retry(
+            retries,
+            backoff_factor=0.2,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        ),
+    )
+
+
+# Shared by every request, so connections and TLS sessions are kept alive.
+# Can be replaced with one from create_pool_manager for other timeouts and retries.
+http = create_pool_manager()
+
+
+# Paces requests to stay within the rate limit
+scheduler = Scheduler()
+
+
+# BASE_URL can be changed after the URL members are made, e.g. for a test server
+def _full_url(url: URL) -> str:
+    return BASE_URL + url.value[len(_URL_BASE) :]
+
+
+# Returns None when the API can't be reached
+def request(
+    url: URL, params: str = "", priority: Priority = Priority.INTERACTIVE
+) -> Optional[urllib3.HTTPResponse]:
+    for _ in range(RATE_LIMIT_RETRIES + 1):
+        scheduler.acquire(priority)
+        try:
+            r = http.request("GET", _full_url(url) + params, headers=HEADER)
+        except urllib3.exceptions.HTTPError as e:
+            scheduler.release()
+            logger.warning(f"Request to {_full_url(url)} failed: {e}")
+            return None
+        scheduler.release(r.headers, r.status)
+        if r.status != 429:
+            break
+        logger.warning(f"Rate limited on {url.name}, retrying after the reset")
+    return r
@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+from .scheduler import Priority
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Seconds to wait for other lookups to join a batch
+BATCH_WINDOW = 0.005
+# Values Helix accepts in one request
+MAX_BATCH = 100
+
+_MISSING = object()
+_FAILED = object()
+
+
+def chunks(items: list, size: int = MAX_BATCH) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+# Collects the keys looked up by many threads within window, sends each key once
+# in requests of up to max_batch keys with fetch, and gives every caller the
+# values for its own keys. keys returns the keys a fetched value answers,
+# the first of them identifies the value.
+# The thread that starts a batch waits for the window and sends it.
+class Batcher(Generic[K, V]):
+    def __init__(
+        self,
+        fetch: Callable[[list[K], Priority], Optional[list[V]]],
+        keys: Callable[[V], Iterable[K]],
+        window: float = BATCH_WINDOW,
+        max_batch: int = MAX_BATCH,
+    ):
+        self.fetch = fetch
+        self.keys = keys
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self._pending: dict[K, Future] = {}
+        self._priorities: dict[K, Priority] = {}
+        self._in_flight: dict[K, Future] = {}
+        self._sending = False
+        self._condition = threading.Condition()
+
+    # Returns None if a request failed, values that weren't found are left out
+    def load(
+        self, keys: Iterable[K], priority: Priority = Priority.INTERACTIVE
+    ) -> Optional[list[V]]:
+        futures = []
+        with self._condition:
+            for key in keys:
+                future = self._in_flight.get(key) or self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = Future()
+                if key in self._pending:
+                    self._priorities[key] = min(
+                        self._priorities.get(key, priority), priority
+                    )
+                futures.append(future)
+            send = bool(self._pending) and not self._sending
+            if send:
+                self._sending = True
+            elif len(self._pending) >= self.max_batch:
+                self._condition.notify_all()
+        if send:
+            self._send_pending()
+        values = {}
+        for future in futures:
+            value = future.result()
+            if value is _FAILED:
+                return None
+            if value is not _MISSING:
+                values.setdefault(next(iter(self.keys(value))), value)
+        return list(values.values())
+
+    def _send_pending(self):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: len(self._pending) >= self.max_batch, self.window
+            )
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._sending = False
+                    return
+                batch = list(self._pending)[: self.max_batch]
+                priority = min(self._priorities.pop(key) for key in batch)
+                futures = {key: self._pending.pop(key) for key in batch}
+                self._in_flight.update(futures)
+            try:
+                self._send(futures, priority)
+            finally:
+                with self._condition:
+                    for key in batch:
+                        del self._in_flight[key]
+
+    def _send(self, futures: dict[K, Future], priority: Priority):
+        self.requests += 1
+        try:
+            values = self.fetch(list(futures), priority)
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+        if values is None:
+            for future in futures.values():
+                future.set_result(_FAILED)
+            return
+        found = {}
+        for value in values:
+            for key in self.keys(value):
+                found[key] = value
+        for key, future in futures.items():
+            future.set_result(found.get(key, _MISSING))
@@ -0,0 +1,248 @@
+import atexit
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+from .scheduler import Priority
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+MAX_ENTRIES = 10_000
+
+_MISSING = object()
+
+# Every cache by name, for stats and snapshots
+CACHES: dict[str, "Cache"] = {}
+# name -> pickled entries, read from SNAPSHOT when the first cache is created
+_snapshot: Optional[dict[str, bytes]] = None
+
+
+# Values younger than ttl seconds are fresh. Older values are returned while
+# they are refreshed in the background, until they are older than ttl + stale.
+# The least recently used values are dropped beyond max_entries.
+class Cache(Generic[K, V]):
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale: Optional[float] = None,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale = ttl if stale is None else stale
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        # key -> (value, time.time() when it was fetched)
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._refreshing: set[K] = set()
+        self._lock = threading.Lock()
+        for key, (value, fetched) in _read_snapshot(name).items():
+            self.put(key, value, fetched)
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
+
+    def entries(self) -> dict[K, tuple[V, float]]:
+        with self._lock:
+            return dict(self._entries)
+
+    # Drops every value and resets the counters
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = self.refreshes = 0
+
+    def put(self, key: K, value: V, now: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (value, time.time() if now is None else now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # Returns the value, or _MISSING, and whether it should be refreshed
+    def _get(self, key: K, now: float) -> tuple[object, bool]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING, False
+            value, fetched = entry
+            age = now - fetched
+            if age > self.ttl + self.stale:
+                del self._entries[key]
+                self.misses += 1
+                return _MISSING, False
+            self._entries.move_to_end(key)
+            if age <= self.ttl:
+                self.hits += 1
+                return value, False
+            self.stale_hits += 1
+            if key in self._refreshing:
+                return value, False
+            self._refreshing.add(key)
+            return value, True
+
+    # For lookups that return a single value, like a channel's emotes
+    def get(
+        self,
+        key: K,
+        fetch: Callable[[Priority], Optional[V]],
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Optional[V]:
+        value, refresh = self._get(key, time.time())
+        if value is _MISSING:
+            value = fetch(priority)
+            if value is not None:
+                self.put(key, value)
+            return value
+        if refresh:
+
+            def fetch_value() -> Optional[dict]:
+                value = fetch(Priority.BACKGROUND)
+                return None if value is None else {key: value}
+
+            self._refresh([key], fetch_value)
+        return value
+
+    # For lookups of many keys in one request. value_keys returns the keys
+    # a fetched value answers, the first of them identifies the value.
+    # Returns None if the request failed.
+    def get_many(
+        self,
+        keys: Iterable[K],
+        fetch: Callable[[list[K], Priority], Optional[list[V]]],
+        value_keys: Callable[[V], Iterable[K]],
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Optional[list[V]]:
+        now = time.time()
+        found: dict[K, object] = {}
+        missing = []
+        stale = []
+        for key in keys:
+            if key in found:
+                continue
+            value, refresh = self._get(key, now)
+            found[key] = value
+            if value is _MISSING:
+                missing.append(key)
+            elif refresh:
+                stale.append(key)
+
+        def fetch_values(keys: list[K], priority: Priority) -> Optional[dict]:
+            values = fetch(keys, priority)
+            if values is None:
+                return None
+            fetched = {}
+            for value in values:
+                for key in value_keys(value):
+                    fetched[key] = value
+            return fetched
+
+        if missing:
+            fetched = fetch_values(missing, priority)
+            if fetched is None:
+                return None
+            # Under every key, so a user looked up by id is cached by login too
+            for key, value in fetched.items():
+                self.put(key, value)
+            for key in missing:
+                found[key] = fetched.get(key, _MISSING)
+        if stale:
+            self._refresh(stale, lambda: fetch_values(stale, Priority.BACKGROUND))
+
+        values = {}
+        for value in found.values():
+            if value is not _MISSING:
+                values.setdefault(next(iter(value_keys(value))), value)
+        return list(values.values())
+
+    def _refresh(self, keys: list[K], fetch: Callable[[], Optional[dict]]):
+        def refresh():
+            try:
+                fetched = fetch()
+                if fetched is None:
+                    return
+                for key, value in fetched.items():
+                    self.put(key, value)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(keys)
+
+        self.refreshes += 1
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+def stats() -> dict[str, dict[str, int]]:
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def clear():
+    for cache in CACHES.values():
+        cache.clear()
+
+
+def save(path: str):
+    # Pickled apart, so each cache only unpickles its own values
+    snapshot = {name: pickle.dumps(cache.entries()) for name, cache in CACHES.items()}
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(snapshot, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_snapshot(name: str) -> dict:
+    global _snapshot
+    if not SNAPSHOT:
+        return {}
+    if _snapshot is None:
+        try:
+            with open(SNAPSHOT, "rb") as f:
+                _snapshot = pickle.load(f)
+        except FileNotFoundError:
+            _snapshot = {}
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f"Unable to read the cache snapshot {SNAPSHOT}: {e}")
+            _snapshot = {}
+    data = _snapshot.pop(name, None)
+    if data is None:
+        return {}
+    try:
+        return pickle.loads(data)
+    except Exception as e:
+        logger.warning(f"Unable to read {name} from the cache snapshot: {e}")
+        return {}
+
+
+def _save_snapshot():
+    try:
+        save(SNAPSHOT)
+    except OSError as e:
+        logger.warning(f"Unable to write the cache snapshot {SNAPSHOT}: {e}")
+
+
+# A file to keep the caches in between restarts
+SNAPSHOT = os.getenv("APTBOT_HELIX_CACHE")
+if SNAPSHOT:
+    atexit.register(_save_snapshot)
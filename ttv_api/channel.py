@@ -1,5 +1,8 @@
 from ttv_api import *
 
+# Seconds, titles and games change while streaming
+CHANNELS_TTL = 60.0
+
 
 @dataclass
 class Channel:
@@ -13,18 +16,15 @@ class Channel:
     delay: int
 
 
-def get_channels(*channel_ids: str) -> Optional[list[Channel]]:
+def _fetch_channels(
+    channel_ids: list[str], priority: Priority = Priority.INTERACTIVE
+) -> Optional[list[Channel]]:
     params = "?"
     for channel_id in channel_ids:
         params += f"broadcaster_id={channel_id}&"
 
-    http = urllib3.PoolManager()
-    r = http.request(
-        "GET",
-        URL.channels.value + params,
-        headers=HEADER,
-    )
-    if r.status != 200:
+    r = request(URL.channels, params, priority)
+    if r is None or r.status != 200:
         return None
 
     data = json.loads(r.data.decode("utf-8"))["data"]
@@ -44,3 +44,14 @@ def get_channels(*channel_ids: str) -> Optional[list[Channel]]:
             )
         )
     return channels
+
+
+# Lookups from many threads at once are sent together, 100 at a time
+_batcher = Batcher(_fetch_channels, lambda channel: [channel.broadcaster_id])
+_cache = Cache("channels", CHANNELS_TTL)
+
+
+def get_channels(
+    *channel_ids: str, priority: Priority = Priority.INTERACTIVE
+) -> Optional[list[Channel]]:
+    return _cache.get_many(channel_ids, _batcher.load, _batcher.keys, priority)
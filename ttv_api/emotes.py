@@ -1,5 +1,9 @@
 from ttv_api import *
 
+# Seconds
+GLOBAL_EMOTES_TTL = 3600.0
+CHANNEL_EMOTES_TTL = 600.0
+
 
 @dataclass
 class Emote:
@@ -13,15 +17,10 @@ class Emote:
     theme_mode: list[str]
 
 
-def get_global_emotes() -> Optional[list[Emote]]:
-    http = urllib3.PoolManager()
-    r = http.request(
-        "GET",
-        URL.emotes_channel.value,
-        headers=HEADER,
-    )
+def _fetch_global_emotes(priority: Priority) -> Optional[list[Emote]]:
+    r = request(URL.emotes_global, priority=priority)
 
-    if r.status != 200:
+    if r is None or r.status != 200:
         return None
 
     data = json.loads(r.data.decode("utf-8"))["data"]
@@ -44,17 +43,12 @@ def get_global_emotes() -> Optional[list[Emote]]:
     return emotes
 
 
-def get_channel_emotes(channel_id: str) -> Optional[list[Emote]]:
+def _fetch_channel_emotes(channel_id: str, priority: Priority) -> Optional[list[Emote]]:
     params = f"?broadcaster_id={channel_id}"
 
-    http = urllib3.PoolManager()
-    r = http.request(
-        "GET",
-        URL.emotes_channel.value + params,
-        headers=HEADER,
-    )
+    r = request(URL.emotes_channel, params, priority)
 
-    if r.status != 200:
+    if r is None or r.status != 200:
         return None
 
     data = json.loads(r.data.decode("utf-8"))["data"]
@@ -67,7 +61,7 @@ def get_channel_emotes(channel_id: str) -> Optional[list[Emote]]:
                 emote["name"],
                 emote["tier"],
                 emote["emote_type"],
-                emote["emote_set_it"],
+                emote["emote_set_id"],
                 emote["format"],
                 emote["scale"],
                 emote["theme_mode"],
@@ -77,5 +71,28 @@ def get_channel_emotes(channel_id: str) -> Optional[list[Emote]]:
     return emotes
 
 
+_global_cache = Cache("global_emotes", GLOBAL_EMOTES_TTL)
+_channel_cache = Cache("channel_emotes", CHANNEL_EMOTES_TTL)
+
+
+def get_global_emotes(
+    priority: Priority = Priority.INTERACTIVE,
+) -> Optional[list[Emote]]:
+    emotes = _global_cache.get("global", _fetch_global_emotes, priority)
+    # A copy, so callers can't change the cached list
+    return None if emotes is None else list(emotes)
+
+
+def get_channel_emotes(
+    channel_id: str, priority: Priority = Priority.INTERACTIVE
+) -> Optional[list[Emote]]:
+    emotes = _channel_cache.get(
+        channel_id,
+        lambda priority: _fetch_channel_emotes(channel_id, priority),
+        priority,
+    )
+    return None if emotes is None else list(emotes)
+
+
 def get_emote_image(emote_id: str, emote_format: str, theme_mode: str, scale: str):
     return f"https://static-cdn.jtvnw.net/emoticons/v2/{emote_id}/{emote_format}/{theme_mode}/{scale}"
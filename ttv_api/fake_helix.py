@@ -0,0 +1,269 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def user(user_id: str, login: Optional[str] = None) -> dict:
+    login = login or f"user{user_id}"
+    return {
+        "id": user_id,
+        "login": login,
+        "display_name": login,
+        "type": "",
+        "broadcaster_type": "",
+        "description": "",
+        "profile_image_url": "",
+        "offline_image_url": "",
+        "view_count": 0,
+        "created_at": "2016-12-14T20:32:28Z",
+    }
+
+
+def channel(user: dict, game_name: str = "Science & Technology") -> dict:
+    return {
+        "broadcaster_id": user["id"],
+        "broadcaster_login": user["login"],
+        "broadcaster_name": user["display_name"],
+        "broadcaster_language": "en",
+        "game_id": "509670",
+        "game_name": game_name,
+        "title": f"{user['display_name']} is live",
+        "delay": 0,
+    }
+
+
+def stream(user: dict, game_id: str = "509670", language: str = "en") -> dict:
+    return {
+        "id": f"4{user['id']}",
+        "user_id": user["id"],
+        "user_login": user["login"],
+        "user_name": user["display_name"],
+        "game_id": game_id,
+        "game_name": "",
+        "type": "live",
+        "title": "",
+        "viewer_count": 1,
+        "started_at": "2021-03-10T15:04:21Z",
+        "language": language,
+        "thumbnail_url": "",
+        "tag_ids": [],
+        "is_mature": False,
+    }
+
+
+def emote(emote_id: str) -> dict:
+    return {
+        "id": emote_id,
+        "name": f"emote{emote_id}",
+        "tier": "1000",
+        "emote_type": "subscriptions",
+        "emote_set_id": "1",
+        "format": ["static"],
+        "scale": ["1.0"],
+        "theme_mode": ["light", "dark"],
+    }
+
+
+# A local stand-in for the Helix endpoints in ttv_api. It answers users,
+# channels, streams and chat/emotes from what has been added with add_user
+# and records every request. The statuses in failures are answered first.
+# delay is added to every response, handshake to the first response
+# on each connection, e.g. for a TLS handshake. With a rate_limit, every
+# window allows that many requests and the rest are answered with 429.
+class FakeHelix:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        delay: float = 0.0,
+        handshake: float = 0.0,
+        rate_limit: Optional[int] = None,
+        window: float = 60.0,
+    ):
+        self.delay = delay
+        self.handshake = handshake
+        self.rate_limit = rate_limit
+        self.window = window
+        self.remaining = rate_limit or 0
+        self.reset = 0.0
+        self.limited = 0
+        self.users: dict[str, dict] = {}
+        self.channels: dict[str, dict] = {}
+        self.streams: list[dict] = []
+        self.emotes: dict[str, list[dict]] = {}
+        self.global_emotes: list[dict] = []
+        # (path, query) of every request
+        self.requests: list[tuple[str, dict[str, list[str]]]] = []
+        self.connections = 0
+        # Statuses to answer the next requests with
+        self.failures: list[int] = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _handler(self))
+        self.host, self.port = self._server.server_address[:2]
+        self.url = f"http://{self.host}:{self.port}/helix/"
+        threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_user(self, user_id: str, login: Optional[str] = None, live: bool = False):
+        payload = user(user_id, login)
+        self.users[user_id] = payload
+        self.channels[user_id] = channel(payload)
+        self.emotes[user_id] = [emote(f"{user_id}0")]
+        if live:
+            self.streams.append(stream(payload))
+        return payload
+
+    # Returns whether a request is over the limit, and the Ratelimit headers
+    def _spend(self) -> tuple[bool, dict[str, str]]:
+        if self.rate_limit is None:
+            return False, {}
+        with self._lock:
+            now = time.time()
+            if now >= self.reset:
+                self.remaining = self.rate_limit
+                self.reset = now + self.window
+            limited = self.remaining == 0
+            if limited:
+                self.limited += 1
+            else:
+                self.remaining -= 1
+            headers = {
+                "Ratelimit-Limit": str(self.rate_limit),
+                "Ratelimit-Remaining": str(self.remaining),
+                "Ratelimit-Reset": f"{self.reset:.3f}",
+            }
+        return limited, headers
+
+    def requests_to(self, path: str) -> list[dict[str, list[str]]]:
+        return [query for p, query in list(self.requests) if p == path]
+
+    def respond(self, path: str, query: dict[str, list[str]]) -> tuple[int, dict]:
+        if path == "users":
+            ids = set(query.get("id", []))
+            logins = set(query.get("login", []))
+            data = [
+                u for u in self.users.values() if u["id"] in ids or u["login"] in logins
+            ]
+        elif path == "channels":
+            data = [
+                self.channels[i]
+                for i in query.get("broadcaster_id", [])
+                if i in self.channels
+            ]
+        elif path == "chat/emotes":
+            data = self.emotes.get(query.get("broadcaster_id", [""])[0], [])
+        elif path == "chat/emotes/global":
+            data = self.global_emotes
+        elif path == "streams":
+            return 200, self._streams(query)
+        else:
+            return 404, {"error": "Not Found", "status": 404, "message": ""}
+        return 200, {"data": data}
+
+    def _streams(self, query: dict[str, list[str]]) -> dict:
+        filters = [
+            key
+            for key in ("user_id", "user_login", "game_id", "language")
+            if key in query
+        ]
+        streams = [
+            s for s in self.streams if all(s[key] in query[key] for key in filters)
+        ]
+        first = int(query.get("first", ["20"])[0])
+        start = int(query.get("after", ["0"])[0])
+        page = {"data": streams[start : start + first], "pagination": {}}
+        if start + first < len(streams):
+            page["pagination"]["cursor"] = str(start + first)
+        return page
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients that gave up waiting, e.g. after a timeout, aren't errors
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _handler(helix: FakeHelix):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The headers and the body are written separately
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with helix._lock:
+                helix.connections += 1
+            self.new_connection = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = url.path.removeprefix("/helix/")
+            query = parse_qs(url.query)
+            helix.requests.append((path, query))
+            delay = helix.delay
+            if self.new_connection:
+                delay += helix.handshake
+                self.new_connection = False
+            if delay:
+                time.sleep(delay)
+            with helix._lock:
+                failure = helix.failures.pop(0) if helix.failures else None
+            limited, headers = helix._spend()
+            if limited:
+                failure = 429
+            if failure:
+                status, payload = failure, {"status": failure, "message": ""}
+            else:
+                status, payload = helix.respond(path, query)
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m ttv_api.fake_helix",
+        description="Serve a fake Helix API, use it with APTBOT_HELIX_URL",
+    )
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds")
+    args = parser.parse_args()
+    helix = FakeHelix(port=args.port, delay=args.delay)
+    for i in range(args.users):
+        helix.add_user(str(i), live=i % 2 == 0)
+    print(f"APTBOT_HELIX_URL={helix.url}")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
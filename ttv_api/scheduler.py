@@ -0,0 +1,106 @@
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+from typing import Mapping, Optional
+
+
+class Priority(IntEnum):
+    # Someone in chat is waiting for the answer
+    INTERACTIVE = 0
+    # Polling, e.g. to see if a channel went live
+    BACKGROUND = 1
+
+
+# Keeps requests within Helix's rate limit bucket, as told by the Ratelimit-Limit,
+# Ratelimit-Remaining and Ratelimit-Reset headers of the responses.
+# Requests wait in order of priority, then arrival, when the bucket is empty.
+# Background requests leave reserve of the bucket to interactive ones and are
+# spread over the rest of the window once it is less than half full.
+class Scheduler:
+    def __init__(self, reserve: float = 0.2):
+        self.reserve = reserve
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        # time.time() when the bucket is full again
+        self.reset = 0.0
+        self.waited = 0
+        self._in_flight = 0
+        self._last_background = 0.0
+        self._waiting: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    # Blocks until a request of this priority can be sent,
+    # each call has to be followed by a call to release
+    def acquire(self, priority: Priority = Priority.INTERACTIVE):
+        with self._condition:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(self._waiting, ticket)
+            waited = False
+            try:
+                while True:
+                    now = time.time()
+                    delay = None
+                    if self._waiting[0] == ticket:
+                        delay = self._delay(priority, now)
+                        if delay <= 0:
+                            break
+                    waited = True
+                    self._condition.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+            self._in_flight += 1
+            if priority == Priority.BACKGROUND:
+                self._last_background = now
+            if waited:
+                self.waited += 1
+
+    # headers are those of the response, None if there wasn't one
+    def release(self, headers: Optional[Mapping[str, str]] = None, status: int = 200):
+        with self._condition:
+            self._in_flight -= 1
+            if headers is not None:
+                self._update(headers, status)
+            self._condition.notify_all()
+
+    def _delay(self, priority: Priority, now: float) -> float:
+        if self.remaining is None or self.limit is None:
+            return 0.0
+        if now >= self.reset:
+            self.remaining = self.limit
+        available = self.remaining - self._in_flight
+        if priority == Priority.BACKGROUND:
+            available -= int(self.limit * self.reserve)
+        if available <= 0:
+            # Until the reset, or a response that tells more
+            return max(self.reset - now, 0.01)
+        if priority == Priority.BACKGROUND and self.remaining * 2 < self.limit:
+            interval = (self.reset - now) / available
+            return self._last_background + interval - now
+        return 0.0
+
+    def _update(self, headers: Mapping[str, str], status: int):
+        try:
+            limit = int(headers["Ratelimit-Limit"])
+            remaining = int(headers["Ratelimit-Remaining"])
+            reset = float(headers["Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            if status == 429:
+                # Try again in a second
+                self.limit = self.limit or 1
+                self.remaining = 0
+                self.reset = max(self.reset, time.time() + 1.0)
+            return
+        if status == 429:
+            remaining = 0
+        self.limit = limit
+        # Responses can arrive out of order, within a window the lowest is the latest
+        if reset > self.reset or self.remaining is None:
+            self.remaining = remaining
+            self.reset = reset
+        else:
+            self.remaining = min(self.remaining, remaining)
@@ -1,5 +1,11 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
 from ttv_api import *
 
+# The most streams Helix returns in a page
+PAGE_SIZE = 100
+
 
 @dataclass
 class Stream:
@@ -19,16 +25,57 @@ class Stream:
     is_mature: bool
 
 
-def get_streams(
+# Raised by iter_streams when a page can't be fetched
+class StreamsUnavailable(Exception):
+    pass
+
+
+# Fetches the next page while the caller goes through the current one
+_prefetcher = ThreadPoolExecutor(thread_name_prefix="ttv_api.stream")
+
+
+def _fetch_page(params: str, priority: Priority) -> dict:
+    r = request(URL.streams, params, priority)
+    if r is None or r.status != 200:
+        raise StreamsUnavailable(f"Unable to get streams{params}")
+    return json.loads(r.data.decode("utf-8"))
+
+
+def _stream(stream: dict) -> Stream:
+    return Stream(
+        stream["id"],
+        stream["user_id"],
+        stream["user_login"],
+        stream["user_name"],
+        stream["game_id"],
+        stream["game_name"],
+        stream["type"],
+        stream["title"],
+        stream["viewer_count"],
+        datetime.strptime(stream["started_at"], "%Y-%m-%dT%H:%M:%SZ"),
+        stream["language"],
+        stream["thumbnail_url"],
+        stream["tag_ids"],
+        stream["is_mature"],
+    )
+
+
+# Yields streams a page at a time, so only the current page and the one being
+# prefetched are held, e.g. to go through every stream of a game.
+# Raises StreamsUnavailable if a page can't be fetched.
+def iter_streams(
     user_ids: list[str] = [],
     user_logins: list[str] = [],
     game_ids: list[str] = [],
     languages: list[str] = [],
-    max_streams: int = 100,
-) -> Optional[list[Stream]]:
-
-    streams = []
-    params = "?first=100&"
+    max_streams: Optional[int] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> Iterator[Stream]:
+    first = PAGE_SIZE
+    if max_streams is not None:
+        first = max(1, min(max_streams, PAGE_SIZE))
+    # The filters are sent with every page
+    params = f"?first={first}&"
     for user_id in user_ids:
         params += f"user_id={user_id}&"
     for user_login in user_logins:
@@ -38,45 +85,42 @@ def get_streams(
     for language in languages:
         params += f"language={language}&"
 
-    while True:
-        http = urllib3.PoolManager()
-        r = http.request(
-            "GET",
-            URL.streams.value + params,
-            headers=HEADER,
-        )
-        if r.status != 200:
-            return None
-
-        requested_data = json.loads(r.data.decode("utf-8"))
-        data = requested_data["data"]
-
-        for stream in data:
-            dt = datetime.strptime(stream["started_at"], "%Y-%m-%dT%H:%M:%SZ")
-            streams.append(
-                Stream(
-                    stream["id"],
-                    stream["user_id"],
-                    stream["user_login"],
-                    stream["user_name"],
-                    stream["game_id"],
-                    stream["game_name"],
-                    stream["type"],
-                    stream["title"],
-                    stream["viewer_count"],
-                    dt,
-                    stream["language"],
-                    stream["thumbnail_url"],
-                    stream["tag_ids"],
-                    stream["is_mature"],
+    remaining = max_streams
+    page: Optional[Future] = _prefetcher.submit(_fetch_page, params, priority)
+    try:
+        while page is not None:
+            requested_data = page.result()
+            page = None
+            data = requested_data["data"]
+            if remaining is not None:
+                data = data[:remaining]
+                remaining -= len(data)
+            cursor = requested_data.get("pagination", {}).get("cursor")
+            if cursor and data and remaining != 0:
+                page = _prefetcher.submit(
+                    _fetch_page, f"{params}after={cursor}", priority
                 )
+            for stream in data:
+                yield _stream(stream)
+    finally:
+        # The caller stopped early
+        if page is not None:
+            page.cancel()
+
+
+def get_streams(
+    user_ids: list[str] = [],
+    user_logins: list[str] = [],
+    game_ids: list[str] = [],
+    languages: list[str] = [],
+    max_streams: int = 100,
+    priority: Priority = Priority.INTERACTIVE,
+) -> Optional[list[Stream]]:
+    try:
+        return list(
+            iter_streams(
+                user_ids, user_logins, game_ids, languages, max_streams, priority
             )
-            if len(streams) >= max_streams:
-                return streams
-
-        try:
-            cursor = requested_data["pagination"]["cursor"]
-        except KeyError:
-            return streams
-        else:
-            params = f"?first=100&after={cursor}"
+        )
+    except StreamsUnavailable:
+        return None
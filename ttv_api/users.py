@@ -1,5 +1,8 @@
 from ttv_api import *
 
+# Seconds
+USERS_TTL = 3600.0
+
 
 @dataclass
 class User:
@@ -15,22 +18,15 @@ class User:
     created_at: datetime
 
 
-def get_users(
-    user_ids: list[str] = [], user_logins: list[str] = []
+def _fetch_users(
+    keys: list[tuple[str, str]], priority: Priority = Priority.INTERACTIVE
 ) -> Optional[list[User]]:
     params = "?"
-    for user_id in user_ids:
-        params += f"id={user_id}&"
-    for user_login in user_logins:
-        params += f"login={user_login}&"
-
-    http = urllib3.PoolManager()
-    r = http.request(
-        "GET",
-        URL.users.value + params,
-        headers=HEADER,
-    )
-    if r.status != 200:
+    for name, value in keys:
+        params += f"{name}={value}&"
+
+    r = request(URL.users, params, priority)
+    if r is None or r.status != 200:
         return None
 
     data = json.loads(r.data.decode("utf-8"))["data"]
@@ -53,3 +49,23 @@ def get_users(
             )
         )
     return users
+
+
+# Lookups from many threads at once are sent together, 100 at a time
+_batcher = Batcher(
+    _fetch_users, lambda user: [("id", user.user_id), ("login", user.login)]
+)
+_cache = Cache("users", USERS_TTL)
+
+
+def get_users(
+    user_ids: list[str] = [],
+    user_logins: list[str] = [],
+    priority: Priority = Priority.INTERACTIVE,
+) -> Optional[list[User]]:
+    keys = [("id", user_id) for user_id in user_ids]
+    keys += [("login", user_login.lower()) for user_login in user_logins]
+    if not keys:
+        # The user of the OAuth token
+        return _fetch_users(keys, priority)
+    return _cache.get_many(keys, _batcher.load, _batcher.keys, priority)